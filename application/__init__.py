@@ -1,26 +1,59 @@
 import asyncio
 import logging
 import os
-from typing import Tuple
+from typing import List, Tuple
 
 from tornado import web
+from tornado.ioloop import PeriodicCallback
 
 from application.lib.log.handler import QueueListenerHandler
 from application.lib.utils import config
 from application.lib.utils.config import DatabaseConfig, ApplicationConfig
 
 from application.datastore.db import get_db_managers
-from application.lib.cache import UserExistenceCache
+from application.lib.cache import (
+    UserExistenceCache,
+    SessionCache,
+    SearchCountCache,
+    SuggestionCache,
+    UserRecordCache,
+    UserJobCache,
+    SearchResultCache,
+)
+from application.lib.crypt.executor import HashingExecutor
+from application.lib.crypt.scheduler import HashingScheduler
+from application.lib.change_feed import ChangeFeedWatcher
+from application.lib.export import UserExportSlots
 from application.lib.log.formatter import CustomJsonFormatter
+from application.lib.loop_monitor import LoopMonitor
+from application.lib.write_behind import LastLoginWriteBehind
+from application.lib.managers.user_existence_manager import (
+    UserExistenceManager,
+    WARMUP_BACKGROUND,
+    WARMUP_BLOCKING,
+    WARMUP_OFF,
+)
+from application.lib.managers.user_job_manager import UserJobManager
+from application.lib.utils.various import fire_and_forget
 from application.lib.tornado.application import WebApplication
+from application.controllers.health import ReadinessController
+from application.controllers.metrics import MetricsController
 from application.controllers.user import (
     UserWriteController,
     UserReadController,
     UserLoginController,
+    UserSessionController,
+    UserSuggestController,
+    UserBatchController,
+    UserExportController,
+    UserStatusJobController,
+    UserJobController,
+    UserChangesController,
 )
 
 
 logger = logging.getLogger()
+_periodic_callbacks: List[PeriodicCallback] = []
 
 
 def load_configurations() -> Tuple[ApplicationConfig, DatabaseConfig]:
@@ -48,6 +81,30 @@ def init_log(loglevel: str):
     logger.setLevel(level=loglevel)
 
 
+def init_supervisor_log(loglevel: str):
+    # Plain handler: the queue listener thread must not exist before forking
+    formatter = CustomJsonFormatter("%(levelname)s %(message)s %(asctime)s")
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    supervisor_logger = logging.getLogger("supervisor")
+    supervisor_logger.addHandler(stream_handler)
+    supervisor_logger.setLevel(level=loglevel)
+    supervisor_logger.propagate = False
+
+
+def init_event_loop_policy(app_config: ApplicationConfig):
+    """Must run before any event loop is created, and before forking"""
+    if getattr(app_config, "event_loop", "asyncio") != "uvloop":
+        return
+
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("uvloop is not installed, running on the asyncio loop")
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
 async def init_db(db_config: DatabaseConfig):
     for db_manager in get_db_managers():
         await db_manager(db_config).init()
@@ -55,14 +112,69 @@ async def init_db(db_config: DatabaseConfig):
 
 async def init_cache(app_config: ApplicationConfig):
     await UserExistenceCache(app_config).init()
+    await SessionCache(app_config).init()
+    await UserRecordCache(app_config).init()
+    await UserJobCache(app_config).init()
+    await SearchResultCache(app_config).init()
+    SearchCountCache(app_config)
+    SuggestionCache(app_config)
+
+
+async def init_user_existence(app_config: ApplicationConfig):
+    user_existence_settings = getattr(app_config, "user_existence", {})
+    warmup = user_existence_settings.get("warmup", WARMUP_OFF)
+    if warmup == WARMUP_BACKGROUND:
+        # Serving right away, /health/ready answers 503 until warm
+        fire_and_forget(func=UserExistenceManager.prepare_cache, warmup=True)
+    else:
+        await UserExistenceManager.prepare_cache(warmup=warmup == WARMUP_BLOCKING)
+
+
+async def init_hashing(app_config: ApplicationConfig):
+    await HashingExecutor(app_config).init()
+    await HashingScheduler(app_config).init()
+
+
+def start_periodic_callback(callback, interval: float):
+    """Runs callback every interval seconds, runs never overlap"""
+    periodic_callback = PeriodicCallback(callback, interval * 1000, jitter=0.1)
+    periodic_callback.start()
+    _periodic_callbacks.append(periodic_callback)
+
 
+def stop_periodic_callbacks():
+    while _periodic_callbacks:
+        _periodic_callbacks.pop().stop()
 
-async def initialize_application() -> Tuple[ApplicationConfig, DatabaseConfig]:
-    app_config, db_config = load_configurations()
+
+def init_background_tasks(app_config: ApplicationConfig):
+    user_existence_settings = getattr(app_config, "user_existence", {})
+    reconcile_interval = user_existence_settings.get("reconcile_interval", 0)
+    if reconcile_interval > 0:
+        start_periodic_callback(UserExistenceManager.reconcile, reconcile_interval)
+
+    bloom_filter_settings = user_existence_settings.get("bloom_filter", {})
+    reload_interval = bloom_filter_settings.get("reload_interval", 3600)
+    if bloom_filter_settings.get("enabled", False) and reload_interval > 0:
+        start_periodic_callback(
+            UserExistenceManager.reload_bloom_filter, reload_interval
+        )
+
+
+async def initialize_application(
+    app_config: ApplicationConfig, db_config: DatabaseConfig
+) -> None:
+    """Takes the configurations loaded once by the entrypoint, they're singletons"""
     init_log(app_config.loglevel)
     await init_db(db_config)
     await init_cache(app_config)
-    return app_config, db_config
+    await init_user_existence(app_config)
+    await init_hashing(app_config)
+    await LoopMonitor(app_config).init()
+    await LastLoginWriteBehind(app_config).init()
+    UserExportSlots(app_config)
+    await ChangeFeedWatcher(app_config).init()
+    init_background_tasks(app_config)
 
 
 def initialize_web_application() -> web.Application:
@@ -71,7 +183,16 @@ def initialize_web_application() -> web.Application:
             (r"/user", UserWriteController),
             (r"/user/(?P<id>[1-9]\d*)", UserWriteController),
             (r"/user/search", UserReadController),
+            (r"/user/suggest", UserSuggestController),
+            (r"/user/batch", UserBatchController),
+            (r"/user/export", UserExportController),
+            (r"/user/changes", UserChangesController),
+            (r"/user/jobs/status", UserStatusJobController),
+            (r"/user/jobs/(?P<job_id>[0-9a-f]{32})", UserJobController),
             (r"/user/login", UserLoginController),
+            (r"/user/session", UserSessionController),
+            (r"/metrics", MetricsController),
+            (r"/health/ready", ReadinessController),
         ]
     )
 
@@ -85,9 +206,18 @@ async def shutdown_application() -> None:
 
     try:
         logger.info("Application is shutting down")
+        stop_periodic_callbacks()
+        await LoopMonitor().close()
+        await ChangeFeedWatcher().close()
+        # Pending logins need the DB pools still open
+        await LastLoginWriteBehind().close()
+        # Before the pools and Redis, interrupted jobs still record their state
+        await UserJobManager.close()
         await asyncio.gather(
             *[db_manager().close() for db_manager in get_db_managers()]
         )
+        await HashingExecutor().close()
+        await UserExistenceCache().close()
 
     except Exception as e:
         logger.error(f"Error encountered while application was shutting down: {e}")
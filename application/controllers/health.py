@@ -0,0 +1,20 @@
+from http import HTTPStatus
+
+from application.lib.cache import UserExistenceCache
+from application.lib.decorators.controller import handle_server_errors
+from application.lib.tornado.request_handler import ApplicationRequestHandler
+
+
+class ReadinessController(ApplicationRequestHandler):
+    RETRY_AFTER = 5
+
+    @handle_server_errors
+    async def get(self, **kwargs):
+        if not UserExistenceCache().is_ready:
+            self.set_status(HTTPStatus.SERVICE_UNAVAILABLE)
+            self.set_header("Retry-After", self.RETRY_AFTER)
+            self.write({"status": "warming_up"})
+            return
+
+        self.set_status(HTTPStatus.OK)
+        self.write({"status": "ready"})
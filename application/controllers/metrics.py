@@ -0,0 +1,12 @@
+from http import HTTPStatus
+
+from application.lib.decorators.controller import handle_server_errors
+from application.lib.metrics import MetricsRegistry
+from application.lib.tornado.request_handler import ApplicationRequestHandler
+
+
+class MetricsController(ApplicationRequestHandler):
+    @handle_server_errors
+    async def get(self, **kwargs):
+        self.set_status(HTTPStatus.OK)
+        self.write(MetricsRegistry().snapshot())
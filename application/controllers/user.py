@@ -1,23 +1,49 @@
+import csv
+import io
+import json
 from http import HTTPStatus
 from logging import getLogger
-from typing import Dict
+from typing import Dict, List, Optional
 
+from tornado.iostream import StreamClosedError
+
+from application.lib.change_feed import ChangeFeedWatcher
 from application.lib.decorators.controller import handle_server_errors
+from application.lib.export import UserExportSlots
 from application.lib.tornado.request_handler import ApplicationRequestHandler
-from application.lib.validation import validate
+from application.lib.validation import validate, ValidationException
 from application.lib.managers.user_manager import (
     UserManager,
     UserAlreadyTaken,
     UserNotFound,
     WrongPassword,
 )
+from application.lib.managers.user_job_manager import UserJobManager
+from application.lib.managers.session_manager import SessionManager, SessionNotFound
 from application.lib.validation.schemas.user import (
     create_user_request_schema,
+    create_user_batch_request_schema,
     update_user_request_schema,
+    get_user_request_schema,
     delete_user_request_schema,
     search_user_request_schema,
+    export_user_request_schema,
+    status_change_job_request_schema,
+    get_user_job_request_schema,
+    user_job_schema,
+    change_feed_request_schema,
+    change_feed_user_schema,
+    encode_change_cursor,
+    decode_change_cursor,
+    suggest_user_request_schema,
     login_user_request_schema,
     user_schema,
+    users_schema,
+    user_suggestion_schema,
+    user_batch_results_schema,
+    BATCH_CREATED,
+    EXPORT_COLUMNS,
+    EXPORT_FORMAT_CSV,
 )
 
 
@@ -29,10 +55,34 @@ class UserWriteController(ApplicationRequestHandler):
         self.schemas = {
             "create_user_request_schema": create_user_request_schema,
             "update_user_request_schema": update_user_request_schema,
+            "get_user_request_schema": get_user_request_schema,
             "delete_user_request_schema": delete_user_request_schema,
             "user_schema": user_schema,
+            "users_schema": users_schema,
         }
 
+    @handle_server_errors
+    @validate(schema_name="get_user_request_schema")
+    async def get(self, data: Dict, **kwargs):
+        consistency_token = self.get_consistency_token()
+        if "ids" in data:
+            stored_users = await UserManager.get_users(
+                data["ids"], consistency_token=consistency_token
+            )
+            self.set_status(HTTPStatus.OK)
+            self.write(self.schemas["users_schema"].dump(stored_users))
+            return
+
+        stored_users = await UserManager.get_users(
+            [data["id"]], consistency_token=consistency_token
+        )
+        if not stored_users:
+            self.set_status(HTTPStatus.NOT_FOUND)
+            self.write("User doesn't exist")
+        else:
+            self.set_status(HTTPStatus.OK)
+            self.write(self.schemas["user_schema"].dump(stored_users[0]))
+
     @handle_server_errors
     @validate(schema_name="create_user_request_schema")
     async def post(self, data: Dict, **kwargs):
@@ -43,14 +93,19 @@ class UserWriteController(ApplicationRequestHandler):
             self.write("User already taken")
             return
 
+        self.set_consistency_token()
         self.set_status(HTTPStatus.CREATED)
         self.write(str(stored_user_id))
 
     @handle_server_errors
     @validate(schema_name="update_user_request_schema")
     async def patch(self, data: Dict, **kwargs):
+        # The updated user is read back only if the client wants it
+        return_user = "return=minimal" not in self.request.headers.get("Prefer", "")
         try:
-            stored_user = await UserManager.update_user(user_data=data)
+            stored_user = await UserManager.update_user(
+                user_data=data, return_user=return_user
+            )
         except UserAlreadyTaken:
             self.set_status(HTTPStatus.BAD_REQUEST)
             self.write("One or more fields exist for another users")
@@ -58,6 +113,11 @@ class UserWriteController(ApplicationRequestHandler):
             self.set_status(HTTPStatus.NOT_FOUND)
             self.write("User doesn't exist")
         else:
+            self.set_consistency_token()
+            if not return_user:
+                self.set_status(HTTPStatus.NO_CONTENT)
+                return
+
             self.set_status(HTTPStatus.OK)
             self.write(self.schemas["user_schema"].dump(stored_user))
 
@@ -70,6 +130,7 @@ class UserWriteController(ApplicationRequestHandler):
             self.set_status(HTTPStatus.NOT_FOUND)
             self.write("User doesn't exist")
         else:
+            self.set_consistency_token()
             self.set_status(HTTPStatus.NO_CONTENT)
 
 
@@ -82,7 +143,9 @@ class UserReadController(ApplicationRequestHandler):
     @handle_server_errors
     @validate(schema_name="search_user_request_schema")
     async def post(self, data: Dict, **kwargs):
-        stored_users, users_num = await UserManager.search_users(filters=data)
+        stored_users, users_num = await UserManager.search_users(
+            filters=data, consistency_token=self.get_consistency_token()
+        )
         self.set_status(HTTPStatus.OK)
         self.write(
             self.schemas["search_user_request_schema"].dump(
@@ -90,11 +153,243 @@ class UserReadController(ApplicationRequestHandler):
                     "users": stored_users,
                     "users_num": users_num,
                     "limit": data["limit"],
+                    "sort_by": data.get("sort_by"),
                 }
             )
         )
 
 
+class UserExportController(ApplicationRequestHandler):
+    CONTENT_TYPES = {
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv; charset=UTF-8",
+    }
+
+    def initialize(self):
+        self.schemas = {
+            "export_user_request_schema": export_user_request_schema,
+            "users_schema": users_schema,
+        }
+
+    def _serialize(self, users: List[Dict], export_format: str, header: bool) -> str:
+        dumped_users = self.schemas["users_schema"].dump(users)
+        if export_format != EXPORT_FORMAT_CSV:
+            return "".join(json.dumps(user) + "\n" for user in dumped_users)
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+        if header:
+            writer.writeheader()
+
+        writer.writerows(dumped_users)
+        return buffer.getvalue()
+
+    @handle_server_errors
+    @validate(schema_name="export_user_request_schema")
+    async def get(self, data: Dict, **kwargs):
+        consistency_token = self.get_consistency_token()
+        export_slots = UserExportSlots()
+        if not export_slots.acquire():
+            self.set_status(HTTPStatus.SERVICE_UNAVAILABLE)
+            self.set_header("Retry-After", export_slots.retry_after)
+            self.write({"error": "Too many exports running"})
+            return
+
+        export_format = data.pop("format")
+        self.set_status(HTTPStatus.OK)
+        self.set_header("Content-Type", self.CONTENT_TYPES[export_format])
+        users_stream = UserManager.export_users(
+            data, consistency_token=consistency_token
+        )
+        try:
+            header = True
+            async for users in users_stream:
+                self.write(self._serialize(users, export_format, header))
+                header = False
+                # Resolves once the chunk left the socket: a slow client
+                # pauses the cursor instead of filling memory
+                await self.flush()
+
+            if header:
+                self.write(self._serialize([], export_format, header))
+        except StreamClosedError:
+            logger.info("Client went away during user export")
+        except Exception:
+            if not self._headers_written:
+                raise
+
+            # No terminating chunk, the client can tell the export is truncated
+            logger.exception("User export aborted")
+            self.request.connection.close()
+        finally:
+            await users_stream.aclose()
+            export_slots.release()
+
+
+class UserStatusJobController(ApplicationRequestHandler):
+    def initialize(self):
+        self.schemas = {
+            "status_change_job_request_schema": status_change_job_request_schema,
+            "user_job_schema": user_job_schema,
+        }
+
+    @handle_server_errors
+    @validate(schema_name="status_change_job_request_schema")
+    async def post(self, data: Dict, **kwargs):
+        new_status = data.pop("new_status")
+        chunk_size = data.pop("chunk_size", None)
+        job = await UserJobManager.start_status_change(
+            filters=data, new_status=new_status, chunk_size=chunk_size
+        )
+        self.set_status(HTTPStatus.ACCEPTED)
+        self.set_header("Location", f"/user/jobs/{job['id']}")
+        self.write(self.schemas["user_job_schema"].dump(job))
+
+
+class UserJobController(ApplicationRequestHandler):
+    def initialize(self):
+        self.schemas = {
+            "get_user_job_request_schema": get_user_job_request_schema,
+            "user_job_schema": user_job_schema,
+        }
+
+    @handle_server_errors
+    @validate(schema_name="get_user_job_request_schema")
+    async def get(self, data: Dict, **kwargs):
+        job = await UserJobManager.get_job(data["job_id"])
+        if job is None:
+            self.set_status(HTTPStatus.NOT_FOUND)
+            self.write("Job doesn't exist")
+            return
+
+        self.set_status(HTTPStatus.OK)
+        self.write(self.schemas["user_job_schema"].dump(job))
+
+
+class UserChangesController(ApplicationRequestHandler):
+    SSE_CONTENT_TYPE = "text/event-stream"
+
+    def initialize(self):
+        self.schemas = {
+            "change_feed_request_schema": change_feed_request_schema,
+            "change_feed_user_schema": change_feed_user_schema,
+        }
+
+    @handle_server_errors
+    @validate(schema_name="change_feed_request_schema")
+    async def get(self, data: Dict, **kwargs):
+        if self.SSE_CONTENT_TYPE in self.request.headers.get("Accept", ""):
+            await self._stream_events(data)
+            return
+
+        after = data.get("after")
+        users = await UserManager.get_changes(after=after, limit=data["limit"])
+        if not users and data["wait"]:
+            if await ChangeFeedWatcher().wait_for_changes(after, data["wait"]):
+                users = await UserManager.get_changes(after=after, limit=data["limit"])
+
+        # Unchanged when there's nothing new, clients poll again with it
+        next_cursor = None
+        if users:
+            next_cursor = encode_change_cursor(users[-1])
+        elif after is not None:
+            next_cursor = encode_change_cursor(
+                {"last_modified": after[0], "id": after[1]}
+            )
+
+        self.set_status(HTTPStatus.OK)
+        self.write(
+            self.schemas["change_feed_request_schema"].dump(
+                {"users": users, "next_cursor": next_cursor}
+            )
+        )
+
+    async def _stream_events(self, data: Dict):
+        """Server-sent events, one per user, until the client disconnects"""
+        after = data.get("after")
+        last_event_id = self.request.headers.get("Last-Event-ID")
+        if last_event_id:
+            # Reconnecting EventSource clients resume from the last event
+            try:
+                after = decode_change_cursor(last_event_id)
+            except ValueError:
+                raise ValidationException("Invalid Last-Event-ID")
+
+        change_feed_watcher = ChangeFeedWatcher()
+        self.set_status(HTTPStatus.OK)
+        self.set_header("Content-Type", self.SSE_CONTENT_TYPE)
+        self.set_header("Cache-Control", "no-cache")
+        try:
+            while True:
+                users = await UserManager.get_changes(after=after, limit=data["limit"])
+                if users:
+                    after = (users[-1]["last_modified"], users[-1]["id"])
+                    self.write("".join(self._format_event(user) for user in users))
+                elif not await change_feed_watcher.wait_for_changes(
+                    after, change_feed_watcher.max_wait
+                ):
+                    # Comment line, finds out about clients gone away
+                    self.write(": keepalive\n\n")
+                else:
+                    continue
+
+                await self.flush()
+        except StreamClosedError:
+            logger.info("Client went away from the change feed")
+        except Exception:
+            if not self._headers_written:
+                raise
+
+            # EventSource clients reconnect with the last event id they got
+            logger.exception("Change feed stream aborted")
+            self.request.connection.close()
+
+    def _format_event(self, user: Dict) -> str:
+        dumped_user = self.schemas["change_feed_user_schema"].dump(user)
+        return f"id: {encode_change_cursor(user)}\ndata: {json.dumps(dumped_user)}\n\n"
+
+
+class UserSuggestController(ApplicationRequestHandler):
+    def initialize(self):
+        self.schemas = {
+            "suggest_user_request_schema": suggest_user_request_schema,
+            "user_suggestion_schema": user_suggestion_schema,
+        }
+
+    @handle_server_errors
+    @validate(schema_name="suggest_user_request_schema")
+    async def get(self, data: Dict, **kwargs):
+        suggestions = await UserManager.suggest_users(
+            prefix=data["q"], limit=data["limit"]
+        )
+        self.set_status(HTTPStatus.OK)
+        self.write(self.schemas["user_suggestion_schema"].dump(suggestions))
+
+
+class UserBatchController(ApplicationRequestHandler):
+    def initialize(self):
+        self.schemas = {
+            "create_user_batch_request_schema": create_user_batch_request_schema,
+            "user_batch_results_schema": user_batch_results_schema,
+        }
+
+    @handle_server_errors
+    @validate(schema_name="create_user_batch_request_schema")
+    async def post(self, data: Dict, **kwargs):
+        results = await UserManager.insert_users(data["users"])
+        created = [result for result in results if result["status"] == BATCH_CREATED]
+        if created:
+            self.set_consistency_token()
+
+        # Multi-status as soon as a row wasn't created, see the per-row status
+        if len(created) == len(results):
+            self.set_status(HTTPStatus.CREATED)
+        else:
+            self.set_status(HTTPStatus.MULTI_STATUS)
+
+        self.write(self.schemas["user_batch_results_schema"].dump(results))
+
+
 class UserLoginController(ApplicationRequestHandler):
     def initialize(self):
         self.schemas = {
@@ -113,5 +408,47 @@ class UserLoginController(ApplicationRequestHandler):
             logger.debug(f"User {data['email']} inserted wrong password")
             self.set_status(HTTPStatus.BAD_REQUEST)
         else:
+            if SessionManager.is_enabled():
+                stored_user["session_token"] = await SessionManager.create_session(
+                    stored_user["id"]
+                )
+
             self.set_status(HTTPStatus.OK)
             self.write(self.schemas["user_schema"].dump(stored_user))
+
+
+class UserSessionController(ApplicationRequestHandler):
+    def _get_session_token(self) -> Optional[str]:
+        scheme, _, token = self.request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token.strip():
+            return None
+
+        return token.strip()
+
+    @handle_server_errors
+    async def get(self, **kwargs):
+        token = self._get_session_token()
+        if token is None:
+            self.set_status(HTTPStatus.UNAUTHORIZED)
+            self.write("Missing session token")
+            return
+
+        try:
+            user_id = await SessionManager.validate_session(token)
+        except SessionNotFound:
+            self.set_status(HTTPStatus.UNAUTHORIZED)
+            self.write("Invalid or expired session")
+        else:
+            self.set_status(HTTPStatus.OK)
+            self.write({"id": user_id})
+
+    @handle_server_errors
+    async def delete(self, **kwargs):
+        token = self._get_session_token()
+        if token is None:
+            self.set_status(HTTPStatus.UNAUTHORIZED)
+            self.write("Missing session token")
+            return
+
+        await SessionManager.delete_session(token)
+        self.set_status(HTTPStatus.NO_CONTENT)
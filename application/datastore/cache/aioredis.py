@@ -1,3 +1,5 @@
+from typing import Dict, Tuple
+
 import aioredis
 
 from application.lib.utils.singleton import Singleton
@@ -5,6 +7,8 @@ from application.lib.utils.singleton import Singleton
 
 class AioRedisCache(metaclass=Singleton):
     config_key = None
+    # Caches sharing the same settings share the same connection pool
+    _clients: Dict[Tuple, aioredis.Redis] = {}
 
     def __init__(self, appconfig):
         self.settings = getattr(appconfig, self.config_key)
@@ -17,19 +21,65 @@ class AioRedisCache(metaclass=Singleton):
         self.maxsize = self.settings.get("pool_max_size", 20)
         await self._create()
 
+    @property
+    def _pool_key(self) -> Tuple:
+        return self.host, self.port, self.db
+
     async def _create(self):
-        self.client = await aioredis.create_redis_pool(
-            address="redis://{}:{}".format(self.host, self.port),
-            db=self.db,
-            minsize=self.minsize,
-            maxsize=self.maxsize,
-        )
+        if self._pool_key not in self._clients:
+            self._clients[self._pool_key] = await aioredis.create_redis_pool(
+                address="redis://{}:{}".format(self.host, self.port),
+                db=self.db,
+                minsize=self.minsize,
+                maxsize=self.maxsize,
+            )
+
+        self.client = self._clients[self._pool_key]
 
     async def close(self):
-        await self.client.close()
+        client = self._clients.pop(self._pool_key, None)
+        if client is not None:
+            client.close()
+            await client.wait_closed()
 
     async def hset(self, name, key, value):
         return await self.client.hset(name, key, value)
 
     async def hexists(self, key, field):
         return await self.client.hexists(key, field)
+
+    async def exists(self, key, *keys):
+        return await self.client.exists(key, *keys)
+
+    def iscan(self, match=None, count=None):
+        return self.client.iscan(match=match, count=count)
+
+    def ihscan(self, key, count=None):
+        return self.client.ihscan(key, count=count)
+
+    async def get(self, key):
+        return await self.client.get(key)
+
+    async def mget(self, key, *keys):
+        return await self.client.mget(key, *keys)
+
+    async def set(self, key, value, expire=0, exist=None):
+        return await self.client.set(key, value, expire=expire, exist=exist)
+
+    async def incr(self, key):
+        return await self.client.incr(key)
+
+    async def expire(self, key, timeout):
+        return await self.client.expire(key, timeout)
+
+    async def delete(self, key, *keys):
+        return await self.client.delete(key, *keys)
+
+    async def sadd(self, key, member, *members):
+        return await self.client.sadd(key, member, *members)
+
+    async def smembers(self, key):
+        return await self.client.smembers(key)
+
+    def pipeline(self):
+        return self.client.pipeline()
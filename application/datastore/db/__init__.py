@@ -1,11 +1,15 @@
 from typing import List
 
-from application.datastore.db.manager import DBManager
+from application.datastore.db.manager import BaseDBManager, DBManager
+from application.datastore.db.replica_pool import (
+    ReplicaPoolDBManager,
+    is_replica_pool_config,
+)
 from application.lib.utils.config import DatabaseConfig
 from application.lib.utils.various import snake_to_upper_camel
 
 
-_db_managers: List[DBManager] = []
+_db_managers: List[BaseDBManager] = []
 
 
 def get_db_managers():
@@ -15,9 +19,14 @@ def get_db_managers():
     db_config = DatabaseConfig()
 
     for db_name, db_types in db_config.connections.items():
-        for db_type in db_types:
+        for db_type, connection_config in db_types.items():
             attributes = {"DB_NAME": db_name, "DB_TYPE": db_type}
             db_manager_class_name = snake_to_upper_camel(db_name, db_type)
-            _db_managers.append(type(db_manager_class_name, (DBManager,), attributes))
+            base_class = (
+                ReplicaPoolDBManager
+                if is_replica_pool_config(db_type, connection_config)
+                else DBManager
+            )
+            _db_managers.append(type(db_manager_class_name, (base_class,), attributes))
 
     return _db_managers
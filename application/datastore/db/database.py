@@ -1,6 +1,8 @@
 import asyncio
 from random import randint
 
+import sqlalchemy
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.exc import OperationalError
 
@@ -21,11 +23,16 @@ class Database:
         self.db_type = db_type
         self.settings = settings
         self._engine = None
+        self._read_only_engine = None
 
     async def init(self):
         self.db_uri = self.settings["db_uri"]
         self.debug = self.settings.get("debug", False)
         self.pool_size = self.settings.get("pool_size", 20)
+        self.read_only_pool_size = self.settings.get(
+            "read_only_pool_size", self.pool_size
+        )
+        self.statement_timeout_ms = self.settings.get("statement_timeout_ms", 0)
         await self.create()
 
     async def create(self):
@@ -36,6 +43,7 @@ class Database:
         while True:
             try:
                 self._engine = self._create_engine()
+                self._read_only_engine = self._create_read_only_engine()
                 return
             except Exception as e:
                 logger.exception(e)
@@ -56,16 +64,54 @@ class Database:
 
     def _create_engine(self):
         logger.debug("Creating engine for {} {}".format(self.db_name, self.db_type))
-        return create_async_engine(
+        engine = create_async_engine(
             self.db_uri, pool_size=self.pool_size, pool_recycle=3600, echo=self.debug
         )
+        self._set_statement_timeout(engine)
+        return engine
+
+    def _create_read_only_engine(self):
+        logger.debug(
+            "Creating read only engine for {} {}".format(self.db_name, self.db_type)
+        )
+        # Autocommit: no BEGIN/COMMIT around reads, and nothing to roll back
+        # when connections go back to the pool
+        engine = create_async_engine(
+            self.db_uri,
+            pool_size=self.read_only_pool_size,
+            pool_recycle=3600,
+            pool_reset_on_return=None,
+            isolation_level="AUTOCOMMIT",
+            echo=self.debug,
+        )
+        self._set_statement_timeout(engine)
+        return engine
+
+    def _set_statement_timeout(self, engine):
+        if not self.statement_timeout_ms:
+            return
+
+        # Only applies to SELECT statements
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_max_execution_time(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(
+                "SET SESSION max_execution_time = {:d}".format(
+                    self.statement_timeout_ms
+                )
+            )
+            cursor.close()
 
     async def close(self):
         logger.debug("Closing engine for {} {}".format(self.db_name, self.db_type))
         if self._engine:
             await self._engine.dispose()
 
+        if self._read_only_engine:
+            await self._read_only_engine.dispose()
+
         self._engine = None
+        self._read_only_engine = None
 
     def should_close(self, exception):
         if isinstance(exception, OperationalError):
@@ -75,5 +121,13 @@ class Database:
 
         return False
 
-    def connect(self):
+    async def ping(self):
+        await self.ensure_connected()
+        async with self._read_only_engine.connect() as connection:
+            await connection.execute(sqlalchemy.text("SELECT 1"))
+
+    def connect(self, read_only: bool = False):
+        if read_only:
+            return self._read_only_engine.connect()
+
         return self._engine.connect()
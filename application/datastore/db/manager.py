@@ -1,3 +1,5 @@
+from typing import Optional
+
 from application.lib.utils.singleton import Singleton
 from application.datastore.db.database import Database
 from application.datastore.db.worker import DBWorker
@@ -11,9 +13,15 @@ class BaseDBManager(metaclass=Singleton):
     async def init(self):
         raise NotImplementedError
 
-    async def acquire(self):
+    async def acquire(
+        self, consistency_token: Optional[float] = None, read_only: bool = False
+    ):
         raise NotImplementedError
 
+    def replication_lag(self) -> Optional[float]:
+        """Seconds the most lagging replica is behind, None when not tracked"""
+        return None
+
     async def close(self):
         raise NotImplementedError
 
@@ -31,8 +39,11 @@ class DBManager(BaseDBManager):
     async def init(self):
         await self.database.init()
 
-    async def acquire(self):
-        return DBWorker(self.database)
+    async def acquire(
+        self, consistency_token: Optional[float] = None, read_only: bool = False
+    ):
+        # No lag tracking on a single connection, tokens need a replica pool
+        return DBWorker(self.database, read_only=read_only)
 
     async def close(self):
         await self.database.close()
@@ -0,0 +1,288 @@
+import asyncio
+import random
+import time
+from typing import List, Optional
+
+import sqlalchemy
+from sqlalchemy.exc import OperationalError
+
+from application.datastore.db.connection_constants import MASTER_TYPE, READ_ONLY_TYPE
+from application.datastore.db.database import Database
+from application.datastore.db.manager import BaseDBManager
+from application.datastore.db.worker import DBWorker
+from application.lib.log import logger
+from application.lib.metrics import MetricsRegistry
+
+
+LEAST_OUTSTANDING_BALANCING = "least_outstanding"
+LATENCY_BALANCING = "latency"
+
+HEARTBEAT_ID = 1
+WRITE_HEARTBEAT_QUERY = sqlalchemy.text(
+    """
+    INSERT INTO replication_heartbeat (id, ts) VALUES (:id, :ts)
+    ON DUPLICATE KEY UPDATE ts = GREATEST(ts, VALUES(ts))
+    """
+)
+READ_HEARTBEAT_QUERY = sqlalchemy.text(
+    "SELECT ts FROM replication_heartbeat WHERE id = :id"
+)
+
+
+class Replica:
+    EWMA_ALPHA = 0.2
+    INITIAL_LATENCY = 0.005
+
+    def __init__(self, database: Database, name: str, weight: float):
+        self.database = database
+        self.name = name
+        self.weight = weight
+        self.outstanding = 0
+        self.latency = self.INITIAL_LATENCY
+        self.healthy = True
+        self.failures = 0
+        self.successes = 0
+        # Master heartbeat last seen on the replica, None when not tracked
+        self.replicated_until: Optional[float] = None
+
+    def record_latency(self, latency: float):
+        self.latency += self.EWMA_ALPHA * (latency - self.latency)
+
+
+class ReplicaDBWorker(DBWorker):
+    """DBWorker reporting load, latency and connection errors to its replica"""
+
+    def __init__(
+        self, pool: "ReplicaPoolDBManager", replica: Replica, read_only: bool = False
+    ):
+        super().__init__(replica.database, read_only=read_only)
+        self.pool = pool
+        self.replica = replica
+
+    async def __aenter__(self):
+        self.replica.outstanding += 1
+        self.started_at = time.monotonic()
+        try:
+            return await super().__aenter__()
+        except Exception as e:
+            self.replica.outstanding -= 1
+            self.pool.record_failure(self.replica, e)
+            raise
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            await super().__aexit__(exc_type, exc_value, traceback)
+        finally:
+            self.replica.outstanding -= 1
+            if isinstance(exc_value, OperationalError):
+                self.pool.record_failure(self.replica, exc_value)
+            else:
+                self.replica.record_latency(time.monotonic() - self.started_at)
+
+
+class ReplicaPoolDBManager(BaseDBManager):
+    """
+    Read only manager spreading connections over several replicas. Replicas
+    failing max_failures times in a row, on requests or on the periodic
+    health probe, are ejected until rise_successes probes succeed again.
+    With heartbeat_interval set, the master heartbeat is written and read
+    back from every replica to know how far each one has replicated: reads
+    carrying a consistency token only go to replicas past it, and replicas
+    lagging more than max_lag are skipped. With no eligible replica left
+    reads go to the master.
+    """
+
+    BALANCINGS = (LEAST_OUTSTANDING_BALANCING, LATENCY_BALANCING)
+
+    def __init__(self, config):
+        pool_config = config.connections[self.DB_NAME][self.DB_TYPE]
+        self.balancing = pool_config.get("balancing", LEAST_OUTSTANDING_BALANCING)
+        if self.balancing not in self.BALANCINGS:
+            raise ValueError(
+                f"Invalid balancing {self.balancing} for db {self.DB_NAME}"
+            )
+
+        self.health_check_interval = pool_config.get("health_check_interval", 5)
+        self.health_check_timeout = pool_config.get("health_check_timeout", 1)
+        self.max_failures = pool_config.get("max_failures", 3)
+        self.rise_successes = pool_config.get("rise_successes", 2)
+        self.heartbeat_interval = pool_config.get("heartbeat_interval", 0)
+        self.max_lag = pool_config.get("max_lag", 0)
+        self.clock_skew_margin = pool_config.get("clock_skew_margin_ms", 0) / 1000
+        self.replicas: List[Replica] = []
+        for index, replica_config in enumerate(pool_config["replicas"]):
+            replica_config = {**config.default, **replica_config}
+            self.replicas.append(
+                Replica(
+                    database=Database(replica_config, self.DB_NAME, self.DB_TYPE),
+                    name=replica_config.get("name", f"replica_{index}"),
+                    weight=replica_config.get("weight", 1),
+                )
+            )
+
+        self._tasks: List[asyncio.Task] = []
+
+    async def init(self):
+        for replica in self.replicas:
+            await replica.database.init()
+
+        self._tasks.append(asyncio.ensure_future(self._health_check()))
+        if self.heartbeat_interval > 0:
+            self._tasks.append(asyncio.ensure_future(self._track_lag()))
+
+    def _score(self, replica: Replica) -> float:
+        if self.balancing == LATENCY_BALANCING:
+            return (replica.outstanding + 1) * replica.latency / replica.weight
+
+        return (replica.outstanding + 1) / replica.weight
+
+    def _is_eligible(self, replica: Replica, consistency_token: Optional[float]):
+        if not replica.healthy:
+            return False
+
+        if self.heartbeat_interval <= 0:
+            return True
+
+        if replica.replicated_until is None:
+            return False
+
+        if consistency_token is not None and (
+            replica.replicated_until < consistency_token + self.clock_skew_margin
+        ):
+            return False
+
+        lag = time.time() - replica.replicated_until
+        return not self.max_lag or lag <= self.max_lag
+
+    def _choose_replica(
+        self, consistency_token: Optional[float] = None
+    ) -> Optional[Replica]:
+        eligible_replicas = [
+            replica
+            for replica in self.replicas
+            if self._is_eligible(replica, consistency_token)
+        ]
+        if not eligible_replicas:
+            return None
+
+        best_score = min(self._score(replica) for replica in eligible_replicas)
+        return random.choice(
+            [
+                replica
+                for replica in eligible_replicas
+                if self._score(replica) == best_score
+            ]
+        )
+
+    async def acquire(
+        self, consistency_token: Optional[float] = None, read_only: bool = False
+    ):
+        replica = self._choose_replica(consistency_token)
+        if replica is not None:
+            return ReplicaDBWorker(self, replica, read_only=read_only)
+
+        MetricsRegistry().counter(f"db.{self.DB_NAME}.replicas.master_fallback").inc()
+        return await self._acquire_master(read_only=read_only)
+
+    async def _acquire_master(self, read_only: bool = False) -> DBWorker:
+        # Imported here, the factory module depends on this one
+        from application.datastore.db.manager_factory import DBManagerFactory
+
+        return await DBManagerFactory.make_manager(
+            db_name=self.DB_NAME, db_type=MASTER_TYPE
+        ).acquire(read_only=read_only)
+
+    def replication_lag(self) -> Optional[float]:
+        if self.heartbeat_interval <= 0:
+            return None
+
+        now = time.time()
+        lags = [
+            now - replica.replicated_until
+            for replica in self.replicas
+            if replica.healthy and replica.replicated_until is not None
+        ]
+        return max(lags, default=None)
+
+    def record_failure(self, replica: Replica, exception: Exception):
+        replica.successes = 0
+        replica.failures += 1
+        if replica.healthy and replica.failures >= self.max_failures:
+            replica.healthy = False
+            MetricsRegistry().counter(f"db.{self.DB_NAME}.replicas.ejected").inc()
+            logger.warning(
+                f"Replica {replica.name} of {self.DB_NAME} ejected after "
+                f"{replica.failures} failures: {exception}"
+            )
+
+    def record_success(self, replica: Replica):
+        replica.failures = 0
+        replica.successes += 1
+        if not replica.healthy and replica.successes >= self.rise_successes:
+            replica.healthy = True
+            MetricsRegistry().counter(f"db.{self.DB_NAME}.replicas.readmitted").inc()
+            logger.info(f"Replica {replica.name} of {self.DB_NAME} readmitted")
+
+    async def _probe(self, replica: Replica):
+        started_at = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                replica.database.ping(), timeout=self.health_check_timeout
+            )
+        except Exception as e:
+            self.record_failure(replica, e)
+        else:
+            replica.record_latency(time.monotonic() - started_at)
+            self.record_success(replica)
+
+    async def _health_check(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*[self._probe(replica) for replica in self.replicas])
+
+    async def _read_heartbeat(self, replica: Replica):
+        async with DBWorker(replica.database, read_only=True) as db_worker:
+            row = await db_worker.fetchone(READ_HEARTBEAT_QUERY, {"id": HEARTBEAT_ID})
+
+        if row is not None:
+            replica.replicated_until = float(row[0])
+
+    async def _track_lag(self):
+        lag_histogram = MetricsRegistry().histogram(
+            f"db.{self.DB_NAME}.replicas.lag_ms"
+        )
+        while True:
+            try:
+                async with await self._acquire_master() as db_worker:
+                    await db_worker.execute(
+                        WRITE_HEARTBEAT_QUERY, {"id": HEARTBEAT_ID, "ts": time.time()}
+                    )
+            except Exception as e:
+                logger.warning(f"Heartbeat write on {self.DB_NAME} failed: {e}")
+
+            results = await asyncio.gather(
+                *[self._read_heartbeat(replica) for replica in self.replicas],
+                return_exceptions=True,
+            )
+            now = time.time()
+            for replica, result in zip(self.replicas, results):
+                if isinstance(result, Exception):
+                    logger.warning(
+                        f"Heartbeat read on replica {replica.name} failed: {result}"
+                    )
+                elif replica.replicated_until is not None:
+                    lag_histogram.observe((now - replica.replicated_until) * 1000)
+
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+        self._tasks = []
+
+        await asyncio.gather(*[replica.database.close() for replica in self.replicas])
+
+
+def is_replica_pool_config(db_type: str, connection_config) -> bool:
+    return db_type == READ_ONLY_TYPE and "replicas" in connection_config
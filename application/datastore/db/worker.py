@@ -1,38 +1,84 @@
+from sqlalchemy.exc import OperationalError
+
+
+MAX_EXECUTION_TIME_EXCEEDED = 3024
+
+
+class QueryTimeout(Exception):
+    pass
+
+
 class DBWorker:
-    def __init__(self, database):
+    def __init__(self, database, read_only: bool = False):
         self.database = database
+        # Read only workers run on autocommit connections, no transaction
+        self.read_only = read_only
         self.connection = None
         self.transaction = None
 
     async def __aenter__(self):
         await self.database.ensure_connected()
-        connection = self.database.connect()
+        connection = self.database.connect(read_only=self.read_only)
         self.connection = await connection.start()
-        transaction = self.connection.begin()
-        self.transaction = await transaction.start()
+        if not self.read_only:
+            transaction = self.connection.begin()
+            self.transaction = await transaction.start()
+
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        if exc_type is None:
-            await self.commit()
-        else:
-            await self.rollback()
+        if self.transaction is not None:
+            if exc_type is None:
+                await self.commit()
+            else:
+                await self.rollback()
+
+            await self.transaction.close()
 
-        await self.transaction.close()
         await self.connection.close()
 
+    async def _execute(self, query, *params, **multiparams):
+        try:
+            return await self.connection.execute(query, *params, **multiparams)
+        except OperationalError as e:
+            if e.orig.args and e.orig.args[0] == MAX_EXECUTION_TIME_EXCEEDED:
+                raise QueryTimeout(str(e.orig))
+
+            raise
+
     async def execute(self, query, *params, **multiparams):
-        result = await self.connection.execute(query, *params, **multiparams)
+        result = await self._execute(query, *params, **multiparams)
         return result.lastrowid
 
+    async def execute_rowcount(self, query, *params, **multiparams):
+        # Matched rows: the MySQL dialects connect with CLIENT_FOUND_ROWS
+        result = await self._execute(query, *params, **multiparams)
+        return result.rowcount
+
     async def fetchone(self, query, *params, **multiparams):
-        result = await self.connection.execute(query, *params, **multiparams)
+        result = await self._execute(query, *params, **multiparams)
         return result.fetchone()
 
     async def fetchall(self, query, *params, **multiparams):
-        result = await self.connection.execute(query, *params, **multiparams)
+        result = await self._execute(query, *params, **multiparams)
         return result.fetchall()
 
+    async def stream(self, query, *params, batch_size: int = 1000, **multiparams):
+        """Yields lists of rows from an unbuffered, server-side cursor"""
+        try:
+            result = await self.connection.stream(query, *params, **multiparams)
+            async for rows in result.partitions(batch_size):
+                yield rows
+        except OperationalError as e:
+            if e.orig.args and e.orig.args[0] == MAX_EXECUTION_TIME_EXCEEDED:
+                raise QueryTimeout(str(e.orig))
+
+            raise
+
+    async def invalidate(self):
+        """Discards the connection instead of returning it to the pool"""
+        await self.connection.invalidate()
+
     async def commit(self):
         await self.transaction.commit()
 
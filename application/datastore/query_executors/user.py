@@ -1,9 +1,11 @@
-from typing import List, Dict, Tuple, Optional, Union
+from datetime import datetime
+from typing import AsyncIterator, List, Dict, Tuple, Optional, Union
 
 import sqlalchemy
 
 from application.datastore.db.worker import DBWorker
 from application.datastore.db.executor import QueryExecutor
+from application.lib.validation.schemas.user import NAME_MATCH_FULLTEXT
 
 
 class UserIntegrityError(Exception):
@@ -15,6 +17,10 @@ class UserNotFoundDb(Exception):
 
 
 class UserQueryExecutor(QueryExecutor):
+    NULLABLE_COLUMNS = ("last_login",)
+    # Must match ngram_token_size, shorter terms can't use the full-text index
+    NGRAM_TOKEN_SIZE = 2
+
     @classmethod
     async def get_favourite_sports_by_customer_id(
         cls, db_worker: DBWorker, customer_id: int
@@ -67,6 +73,45 @@ class UserQueryExecutor(QueryExecutor):
 
         return inserted_id
 
+    @classmethod
+    async def insert_users(cls, db_worker: DBWorker, users_data: List[Dict]):
+        """Duplicated emails are left untouched instead of failing the batch"""
+        values_clauses = []
+        params = {}
+        for index, user_data in enumerate(users_data):
+            values_clauses.append(
+                f"(:name_{index}, :email_{index}, :password_{index}, :salt_{index})"
+            )
+            params.update(
+                {
+                    f"name_{index}": user_data["name"],
+                    f"email_{index}": user_data["email"],
+                    f"password_{index}": user_data["hashed_password"],
+                    f"salt_{index}": user_data["salt"],
+                }
+            )
+
+        query = f"""
+            INSERT INTO users (name, email, password, salt)
+            VALUES {",".join(values_clauses)}
+            ON DUPLICATE KEY UPDATE id = id
+        """
+        await db_worker.execute(sqlalchemy.text(query), params)
+
+    @classmethod
+    async def get_users_salts(
+        cls, db_worker: DBWorker, emails: List[str]
+    ) -> List[Tuple[int, str, bytes]]:
+        query = """
+            SELECT id, email, salt
+            FROM users
+            WHERE email IN :emails
+        """
+        rows = await db_worker.fetchall(
+            sqlalchemy.text(query), {"emails": tuple(emails)}
+        )
+        return [(row[0], row[1], row[2]) for row in rows]
+
     @classmethod
     async def update_user(
         cls,
@@ -81,33 +126,95 @@ class UserQueryExecutor(QueryExecutor):
 
             params[field] = value
 
-        user = await cls._acquire_lock(db_worker, user_data["id"])
-        if user is None:
-            raise UserNotFoundDb
-
         query = f"""
             UPDATE users
             SET {",".join(set_clauses)}
             WHERE id = :id
         """
         try:
-            await db_worker.execute(
+            updated_rows = await db_worker.execute_rowcount(
                 sqlalchemy.text(query),
                 params,
             )
         except sqlalchemy.exc.IntegrityError:
             raise UserIntegrityError
 
+        if not updated_rows:
+            raise UserNotFoundDb
+
     @classmethod
-    async def _acquire_lock(
-        cls,
-        db_worker: DBWorker,
-        user_id: int,
+    async def get_user_email(cls, db_worker: DBWorker, user_id: int) -> Optional[str]:
+        query = """
+            SELECT email
+            FROM users
+            WHERE id = :id
+        """
+        row = await db_worker.fetchone(sqlalchemy.text(query), {"id": user_id})
+        return row[0] if row is not None else None
+
+    @classmethod
+    async def update_last_logins(
+        cls, db_worker: DBWorker, last_logins: Dict[int, datetime]
     ):
+        case_clauses = []
+        params = {}
+        for index, (user_id, last_login) in enumerate(last_logins.items()):
+            case_clauses.append(f"WHEN :id_{index} THEN :last_login_{index}")
+            params[f"id_{index}"] = user_id
+            params[f"last_login_{index}"] = last_login
+
+        params["ids"] = tuple(last_logins)
+        # Batches flushed by different processes may land out of order
+        query = f"""
+            UPDATE users
+            SET last_login = GREATEST(
+                COALESCE(last_login, '1970-01-01'),
+                CASE id {" ".join(case_clauses)} END
+            )
+            WHERE id IN :ids
+        """
+        await db_worker.execute(sqlalchemy.text(query), params)
+
+    @classmethod
+    async def get_users_emails(
+        cls, db_worker: DBWorker, after_id: int, limit: int
+    ) -> List[Tuple[int, str]]:
+        query = f"""
+            SELECT id, email
+            FROM users
+            WHERE id > :after_id
+            ORDER BY id
+            LIMIT :limit
+        """
+        rows = await db_worker.fetchall(
+            sqlalchemy.text(query), {"after_id": after_id, "limit": limit}
+        )
+        return [(row[0], row[1]) for row in rows]
+
+    @classmethod
+    async def email_exists(cls, db_worker: DBWorker, email: str) -> bool:
+        query = """
+            SELECT 1
+            FROM users
+            WHERE email = :email
+            LIMIT 1
+        """
+        row = await db_worker.fetchone(sqlalchemy.text(query), {"email": email})
+        return row is not None
+
+    @classmethod
+    async def get_existing_emails(
+        cls, db_worker: DBWorker, emails: List[str]
+    ) -> List[str]:
         query = f"""
-            SELECT * FROM users WHERE id = :id FOR UPDATE
+            SELECT email
+            FROM users
+            WHERE email IN :emails
         """
-        return await db_worker.fetchone(sqlalchemy.text(query), {"id": user_id})
+        rows = await db_worker.fetchall(
+            sqlalchemy.text(query), {"emails": tuple(emails)}
+        )
+        return [row[0] for row in rows]
 
     @classmethod
     async def count_users(cls, db_worker: DBWorker, filters: Dict) -> Union[int, None]:
@@ -126,18 +233,44 @@ class UserQueryExecutor(QueryExecutor):
         return users_num[0]
 
     @classmethod
-    async def search_users(
-        cls,
-        db_worker: DBWorker,
-        filters: Dict,
-        include_secrets: bool = False,
-    ) -> Optional[List]:
+    async def estimate_users(cls, db_worker: DBWorker, filters: Dict) -> int:
+        (
+            stringified_where_clauses,
+            _,
+            _,
+            parameters,
+        ) = cls._get_stringified_where_sort_limit_clauses(filters=filters)
+        query = f"""
+            EXPLAIN SELECT id
+            FROM users
+            {stringified_where_clauses};
+        """
+        plan = await db_worker.fetchone(sqlalchemy.text(query), parameters)
+        plan = plan._mapping
+        if plan["rows"] is None:
+            return 0
+
+        return round(plan["rows"] * (plan["filtered"] or 100) / 100)
+
+    @classmethod
+    def _get_search_query(
+        cls, filters: Dict, include_secrets: bool = False, optimizer_hints: str = ""
+    ) -> Tuple[str, List[str], Dict]:
         (
             stringified_where_clauses,
             stringified_order_by_clauses,
             stringified_limit_clauses,
             parameters,
         ) = cls._get_stringified_where_sort_limit_clauses(filters=filters)
+        if "after" in filters:
+            stringified_seek_clause = cls._get_stringified_seek_clause(
+                filters=filters, parameters=parameters
+            )
+            if stringified_where_clauses:
+                stringified_where_clauses += f" AND ({stringified_seek_clause})"
+            else:
+                stringified_where_clauses = f"WHERE {stringified_seek_clause}"
+
         column_names = [
             "id",
             "name",
@@ -156,12 +289,24 @@ class UserQueryExecutor(QueryExecutor):
             )
 
         query = f"""
-            SELECT {",".join(column_names)}
+            SELECT {optimizer_hints} {",".join(column_names)}
             FROM users
             {stringified_where_clauses}
             {stringified_order_by_clauses}
             {stringified_limit_clauses};
         """
+        return query, column_names, parameters
+
+    @classmethod
+    async def search_users(
+        cls,
+        db_worker: DBWorker,
+        filters: Dict,
+        include_secrets: bool = False,
+    ) -> Optional[List]:
+        query, column_names, parameters = cls._get_search_query(
+            filters=filters, include_secrets=include_secrets
+        )
         users = await db_worker.fetchall(sqlalchemy.text(query), parameters)
 
         if not users:
@@ -173,6 +318,210 @@ class UserQueryExecutor(QueryExecutor):
 
         return dict_results
 
+    @classmethod
+    async def stream_users(
+        cls,
+        db_worker: DBWorker,
+        filters: Dict,
+        batch_size: int,
+        max_execution_ms: int,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Search results read through a server-side cursor, batch_size rows at
+        a time: the next batch isn't fetched until the caller asks for it.
+        """
+        # Overrides the session statement timeout, meant for short reads
+        query, column_names, parameters = cls._get_search_query(
+            filters=filters,
+            optimizer_hints=f"/*+ MAX_EXECUTION_TIME({max_execution_ms:d}) */",
+        )
+        async for rows in db_worker.stream(
+            sqlalchemy.text(query), parameters, batch_size=batch_size
+        ):
+            yield [dict(zip(column_names, row)) for row in rows]
+
+    @classmethod
+    async def get_changes(
+        cls,
+        db_worker: DBWorker,
+        after: Optional[Tuple[datetime, int]],
+        limit: int,
+        safety_lag: int,
+    ) -> List[Dict]:
+        """
+        Users by (last_modified, id), a range read on users__last_modified_idx
+        (InnoDB appends the primary key to it). Rows modified in the last
+        safety_lag seconds are held back: an earlier last_modified may still
+        be committed by a transaction in flight, and cursors never go back.
+        """
+        column_names = [
+            "id",
+            "name",
+            "email",
+            "status",
+            "last_login",
+            "created_at",
+            "last_modified",
+        ]
+        where_clauses = ["last_modified <= NOW() - INTERVAL :safety_lag SECOND"]
+        parameters = {"safety_lag": safety_lag, "limit": limit}
+        if after is not None:
+            where_clauses.append(
+                "last_modified >= :after_last_modified AND ("
+                "last_modified > :after_last_modified OR id > :after_id)"
+            )
+            parameters.update({"after_last_modified": after[0], "after_id": after[1]})
+
+        query = f"""
+            SELECT {",".join(column_names)}
+            FROM users FORCE INDEX (users__last_modified_idx)
+            WHERE {" AND ".join(where_clauses)}
+            ORDER BY last_modified, id
+            LIMIT :limit
+        """
+        rows = await db_worker.fetchall(sqlalchemy.text(query), parameters)
+        return [dict(zip(column_names, row)) for row in rows]
+
+    @classmethod
+    async def get_changes_head(
+        cls, db_worker: DBWorker, safety_lag: int
+    ) -> Optional[Tuple[datetime, int]]:
+        """Position of the last change get_changes would return"""
+        query = """
+            SELECT last_modified, id
+            FROM users FORCE INDEX (users__last_modified_idx)
+            WHERE last_modified <= NOW() - INTERVAL :safety_lag SECOND
+            ORDER BY last_modified DESC, id DESC
+            LIMIT 1
+        """
+        row = await db_worker.fetchone(
+            sqlalchemy.text(query), {"safety_lag": safety_lag}
+        )
+        return (row[0], row[1]) if row is not None else None
+
+    @classmethod
+    async def get_users_chunk(
+        cls,
+        db_worker: DBWorker,
+        filters: Dict,
+        after_id: int,
+        limit: int,
+        excluded_status: str,
+    ) -> List[Tuple[int, str]]:
+        """Ids and emails of the next users by id, skipping excluded_status"""
+        stringified_where_clauses, parameters = cls._get_stringified_job_where_clauses(
+            filters, "id > :after_id AND status != :excluded_status"
+        )
+        query = f"""
+            SELECT id, email
+            FROM users
+            {stringified_where_clauses}
+            ORDER BY id
+            LIMIT :chunk_limit
+        """
+        rows = await db_worker.fetchall(
+            sqlalchemy.text(query),
+            {
+                **parameters,
+                "after_id": after_id,
+                "excluded_status": excluded_status,
+                "chunk_limit": limit,
+            },
+        )
+        return [(row[0], row[1]) for row in rows]
+
+    @classmethod
+    async def set_users_status(
+        cls, db_worker: DBWorker, user_ids: List[int], status: str, filters: Dict
+    ) -> int:
+        """Only users still matching filters, they may have changed since the read"""
+        stringified_where_clauses, parameters = cls._get_stringified_job_where_clauses(
+            filters, "id IN :chunk_user_ids AND status != :new_status"
+        )
+        query = f"""
+            UPDATE users
+            SET status = :new_status
+            {stringified_where_clauses}
+        """
+        return await db_worker.execute_rowcount(
+            sqlalchemy.text(query),
+            {**parameters, "new_status": status, "chunk_user_ids": tuple(user_ids)},
+        )
+
+    @classmethod
+    async def set_net_write_timeout(cls, db_worker: DBWorker, timeout: Optional[int]):
+        """Session scoped, None restores the server default"""
+        if timeout is None:
+            await db_worker.execute(
+                sqlalchemy.text("SET SESSION net_write_timeout = DEFAULT")
+            )
+        else:
+            await db_worker.execute(
+                sqlalchemy.text("SET SESSION net_write_timeout = :timeout"),
+                {"timeout": timeout},
+            )
+
+    @classmethod
+    async def suggest_users(
+        cls, db_worker: DBWorker, prefix: str, limit: int
+    ) -> List[Dict]:
+        # Two index range scans (users__email_idx and users__name), email
+        # matches first
+        query = f"""
+            (
+                SELECT 0 AS source, email AS matched, id, name, email
+                FROM users
+                WHERE email LIKE :prefix
+                ORDER BY email
+                LIMIT :limit
+            )
+            UNION ALL
+            (
+                SELECT 1 AS source, name AS matched, id, name, email
+                FROM users
+                WHERE name LIKE :prefix
+                ORDER BY name
+                LIMIT :limit
+            )
+            ORDER BY source, matched;
+        """
+        escaped_prefix = (
+            prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        rows = await db_worker.fetchall(
+            sqlalchemy.text(query), {"prefix": escaped_prefix + "%", "limit": limit}
+        )
+
+        suggestions = {}
+        for _, _, user_id, name, email in rows:
+            if user_id not in suggestions:
+                suggestions[user_id] = {"id": user_id, "name": name, "email": email}
+
+        return list(suggestions.values())[:limit]
+
+    @classmethod
+    def _get_stringified_job_where_clauses(
+        cls, filters: Dict, chunk_clauses: str
+    ) -> Tuple[str, Dict]:
+        (
+            stringified_where_clauses,
+            _,
+            _,
+            parameters,
+        ) = cls._get_stringified_where_sort_limit_clauses(
+            filters={
+                key: value
+                for key, value in filters.items()
+                if key not in ("sort_by", "limit", "offset")
+            }
+        )
+        if stringified_where_clauses:
+            stringified_where_clauses += f" AND {chunk_clauses}"
+        else:
+            stringified_where_clauses = f"WHERE {chunk_clauses}"
+
+        return stringified_where_clauses, parameters
+
     @classmethod
     def _get_stringified_where_sort_limit_clauses(
         cls, filters: Dict
@@ -184,9 +533,19 @@ class UserQueryExecutor(QueryExecutor):
             where_clauses.append("id IN :user_ids")
             parameters["user_ids"] = tuple(filters["user_ids"])
 
+        name_phrase = None
         if "name" in filters:
-            where_clauses.append("name LIKE :name")
-            parameters["name"] = "%" + filters["name"] + "%"
+            if filters.get("name_match") == NAME_MATCH_FULLTEXT:
+                name_phrase = cls._get_fulltext_phrase(filters["name"])
+
+            if name_phrase is not None:
+                where_clauses.append(
+                    "MATCH(name) AGAINST(:name_phrase IN BOOLEAN MODE)"
+                )
+                parameters["name_phrase"] = name_phrase
+            else:
+                where_clauses.append("name LIKE :name")
+                parameters["name"] = "%" + filters["name"] + "%"
 
         if "email" in filters:
             where_clauses.append("email = :email")
@@ -242,6 +601,11 @@ class UserQueryExecutor(QueryExecutor):
             ]
             stringified_order_by_clauses = ", ".join(order_by_clauses)
             stringified_order_by_clauses = "ORDER BY " + stringified_order_by_clauses
+        elif filters.get("order_by_relevance") and name_phrase is not None:
+            stringified_order_by_clauses = (
+                "ORDER BY MATCH(name) AGAINST(:name_phrase IN BOOLEAN MODE) DESC, "
+                "id DESC"
+            )
         else:
             stringified_order_by_clauses = "ORDER BY id DESC"
 
@@ -250,6 +614,9 @@ class UserQueryExecutor(QueryExecutor):
             stringified_limit_clauses = "LIMIT :limit OFFSET :offset"
             parameters["limit"] = filters["limit"]
             parameters["offset"] = filters["offset"]
+        elif "limit" in filters:
+            stringified_limit_clauses = "LIMIT :limit"
+            parameters["limit"] = filters["limit"]
 
         return (
             stringified_where_clauses,
@@ -257,3 +624,74 @@ class UserQueryExecutor(QueryExecutor):
             stringified_limit_clauses,
             parameters,
         )
+
+    @classmethod
+    def _get_fulltext_phrase(cls, name: str) -> Optional[str]:
+        # Quoted phrase: n-grams have to be adjacent, close to substring matching
+        words = name.replace('"', " ").split()
+        # Shorter words aren't indexed, without any the MATCH would be empty
+        if all(len(word) < cls.NGRAM_TOKEN_SIZE for word in words):
+            return None
+
+        term = " ".join(words)
+
+        return f'"{term}"'
+
+    @classmethod
+    def _get_stringified_seek_clause(cls, filters: Dict, parameters: Dict) -> str:
+        """
+        Keyset condition selecting the rows sorted after filters["after"], the
+        sort values of the last row of the previous page. MySQL sorts NULLs
+        first, so they come before any value in ASC order and after in DESC.
+        """
+        equality_clauses = []
+        seek_clauses = []
+        for position, (sorting_data, value) in enumerate(
+            zip(filters["sort_by"], filters["after"])
+        ):
+            column = sorting_data["column"]
+            parameter_name = f"after_{position}"
+            parameters[parameter_name] = value
+            nullable = column in cls.NULLABLE_COLUMNS
+
+            if sorting_data["order"] == "ASC":
+                if value is None:
+                    following_clause = f"{column} IS NOT NULL"
+                else:
+                    following_clause = f"{column} > :{parameter_name}"
+            else:
+                if value is None:
+                    following_clause = None
+                elif nullable:
+                    following_clause = (
+                        f"({column} < :{parameter_name} OR {column} IS NULL)"
+                    )
+                else:
+                    following_clause = f"{column} < :{parameter_name}"
+
+            if following_clause is not None:
+                seek_clauses.append(" AND ".join(equality_clauses + [following_clause]))
+
+            if value is None:
+                equality_clauses.append(f"{column} IS NULL")
+            else:
+                equality_clauses.append(f"{column} = :{parameter_name}")
+
+        if not seek_clauses:
+            return "FALSE"
+
+        stringified_seek_clause = " OR ".join(f"({clause})" for clause in seek_clauses)
+
+        # Redundant bound on the leading column, lets MySQL use a range scan
+        leading_sorting_data = filters["sort_by"][0]
+        leading_column = leading_sorting_data["column"]
+        if (
+            filters["after"][0] is not None
+            and leading_column not in cls.NULLABLE_COLUMNS
+        ):
+            operator = ">=" if leading_sorting_data["order"] == "ASC" else "<="
+            stringified_seek_clause = (
+                f"{leading_column} {operator} :after_0 AND ({stringified_seek_clause})"
+            )
+
+        return stringified_seek_clause
@@ -1,15 +1,579 @@
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from math import ceil
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+import aioredis
+
 from application.datastore.cache.aioredis import AioRedisCache
 
 from application.lib.decorators.generic import handle_errors
+from application.lib.log import logger
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.bloom import BloomFilter
+from application.lib.utils.lru import TTLLRUCache
+from application.lib.utils.singleton import Singleton
+
+
+USER_DATETIME_FIELDS = ("created_at", "last_modified", "last_login")
+
+
+def _dump_user(user: Dict) -> Dict:
+    """JSON friendly copy of a user record"""
+    return {
+        field: value.isoformat() if isinstance(value, datetime) else value
+        for field, value in user.items()
+    }
+
+
+def _load_user(user: Dict) -> Dict:
+    """Reverts _dump_user, in place"""
+    for field in USER_DATETIME_FIELDS:
+        if user.get(field) is not None:
+            user[field] = datetime.fromisoformat(user[field])
+
+    return user
+
+
+class LocalCache(metaclass=Singleton):
+    config_key = None
+    default_maxsize = 1024
+    default_ttl = 5
+
+    def __init__(self, appconfig):
+        self.settings = getattr(appconfig, self.config_key, {})
+        self.cache = TTLLRUCache(
+            maxsize=self.settings.get("maxsize", self.default_maxsize),
+            ttl=self.settings.get("ttl", self.default_ttl),
+        )
+
+
+class SearchCountCache(LocalCache):
+    config_key = "search_count_cache"
+
+
+class SuggestionCache(LocalCache):
+    config_key = "suggestion_cache"
+    default_maxsize = 4096
+    default_ttl = 2
+
+
+HASH_LAYOUT = "hash"
+KEYS_LAYOUT = "keys"
 
 
 class UserExistenceCache(AioRedisCache):
+    """
+    Emails already taken. The default layout stores them as fields of the
+    user_existence hash (optionally sharded into user_existence:<n> hashes),
+    the keys layout uses one user_existence:<email> key per email so that
+    entries can expire.
+    """
+
     config_key = "redis"
+    user_existence_config_key = "user_existence"
     hashset_name = "user_existence"
+    reconciler_lock_name = "user_existence_reconciler_lock"
+    warmup_lock_name = "user_existence_warmup_lock"
+    warm_marker_name = "user_existence_warm"
+    LAYOUTS = (HASH_LAYOUT, KEYS_LAYOUT)
+    SCAN_COUNT = 1000
+    BLOOM_FILTER_HEADROOM = 1.5
+
+    def __init__(self, appconfig):
+        super().__init__(appconfig)
+        self.user_existence_settings = getattr(
+            appconfig, self.user_existence_config_key, {}
+        )
+        self.layout = self.user_existence_settings.get("layout", HASH_LAYOUT)
+        if self.layout not in self.LAYOUTS:
+            raise ValueError(f"Invalid user existence layout {self.layout}")
+
+        self.shards = self.user_existence_settings.get("shards", 1)
+        self.ttl = self.user_existence_settings.get("ttl", 0)
+        self.db_precheck = self.user_existence_settings.get("db_precheck", False)
+        self.bloom_filter = None
+        # Keys added while a bloom filter is being loaded, see _load_bloom_filter
+        self._bloom_filter_backlog: Optional[List[str]] = None
+        # Set once warmed up and with the bloom filter loaded
+        self.is_ready = False
+
+    async def init_bloom_filter(self):
+        bloom_filter_settings = self.user_existence_settings.get("bloom_filter", {})
+        if not bloom_filter_settings.get("enabled", False):
+            return
+
+        # Sized after the current keys, with room for the signups until the
+        # next reload: a saturated filter lets every lookup through
+        keys_num = await self._count_keys()
+        if keys_num is None and self.bloom_filter is not None:
+            keys_num = self.bloom_filter.count
+        capacity = max(
+            bloom_filter_settings.get("capacity", 1000000),
+            ceil((keys_num or 0) * self.BLOOM_FILTER_HEADROOM),
+        )
+        await self._load_bloom_filter(
+            capacity=capacity,
+            error_rate=bloom_filter_settings.get("error_rate", 0.01),
+        )
+
+    async def _count_keys(self) -> Optional[int]:
+        """Number of taken emails, None when it can't be told without a scan"""
+        if self.layout != HASH_LAYOUT:
+            return None
+
+        pipeline = self.pipeline()
+        for hashset_name in self.hashset_names:
+            pipeline.hlen(hashset_name)
+
+        return sum(await pipeline.execute())
+
+    async def _load_bloom_filter(self, capacity: int, error_rate: float):
+        bloom_filter = BloomFilter(capacity=capacity, error_rate=error_rate)
+        # The scan can miss keys stored meanwhile, they're replayed at the end
+        self._bloom_filter_backlog = []
+        try:
+            async for key in self.iterate_keys():
+                bloom_filter.add(key)
+        finally:
+            backlog, self._bloom_filter_backlog = self._bloom_filter_backlog, None
+
+        for key in backlog:
+            bloom_filter.add(key)
+
+        if bloom_filter.is_saturated:
+            logger.warning(
+                f"User existence bloom filter loaded {bloom_filter.count} keys, "
+                f"over its capacity of {capacity}"
+            )
+
+        # Only used once complete: a partial filter would give false negatives
+        self.bloom_filter = bloom_filter
+        logger.info(f"User existence bloom filter loaded {bloom_filter.count} keys")
+
+    def _add_to_bloom_filter(self, key: str):
+        if self.bloom_filter is not None:
+            self.bloom_filter.add(key)
+        if self._bloom_filter_backlog is not None:
+            self._bloom_filter_backlog.append(key)
+
+    @property
+    def hashset_names(self) -> List[str]:
+        if self.shards == 1:
+            return [self.hashset_name]
+
+        return [f"{self.hashset_name}:{shard}" for shard in range(self.shards)]
+
+    def _get_hashset_name(self, key: str) -> str:
+        if self.shards == 1:
+            return self.hashset_name
+
+        return f"{self.hashset_name}:{zlib.crc32(key.encode()) % self.shards}"
+
+    def _get_key_name(self, key: str) -> str:
+        return f"{self.hashset_name}:{key}"
 
     async def user_exists(self, key: str) -> bool:
-        return await self.hexists(self.hashset_name, key)
+        if self.bloom_filter is not None and key not in self.bloom_filter:
+            MetricsRegistry().counter("user_existence.bloom_filter.negative").inc()
+            return False
+
+        if self.layout == KEYS_LAYOUT:
+            return bool(await self.exists(self._get_key_name(key)))
+
+        return await self.hexists(self._get_hashset_name(key), key)
+
+    async def users_exist(self, keys: List[str]) -> List[bool]:
+        exist = [False] * len(keys)
+        pipeline = self.pipeline()
+        pipelined_indexes = []
+        for index, key in enumerate(keys):
+            if self.bloom_filter is not None and key not in self.bloom_filter:
+                continue
+
+            pipelined_indexes.append(index)
+            if self.layout == KEYS_LAYOUT:
+                pipeline.exists(self._get_key_name(key))
+            else:
+                pipeline.hexists(self._get_hashset_name(key), key)
+
+        if pipelined_indexes:
+            for index, key_exists in zip(pipelined_indexes, await pipeline.execute()):
+                exist[index] = bool(key_exists)
+
+        return exist
 
     @handle_errors
     async def set_user_existence(self, key: str):
-        await self.hset(self.hashset_name, key, 0)
+        await self.set_users_existence([key])
+
+    async def set_users_existence(self, keys: Iterable[str]):
+        pipeline = self.pipeline()
+        for key in keys:
+            self._add_to_bloom_filter(key)
+            if self.layout == KEYS_LAYOUT:
+                pipeline.set(self._get_key_name(key), 0, expire=self.ttl)
+            else:
+                pipeline.hset(self._get_hashset_name(key), key, 0)
+
+        await pipeline.execute()
+
+    @handle_errors
+    async def remove_user_existence(self, key: str):
+        await self.remove_users_existence([key])
+
+    async def remove_users_existence(self, keys: Iterable[str]):
+        # Bloom filters can't forget keys: removed ones stay possible positives
+        pipeline = self.pipeline()
+        for key in keys:
+            if self.layout == KEYS_LAYOUT:
+                pipeline.delete(self._get_key_name(key))
+            else:
+                pipeline.hdel(self._get_hashset_name(key), key)
+
+        await pipeline.execute()
+
+    async def iterate_keys(self) -> AsyncIterator[str]:
+        if self.layout == KEYS_LAYOUT:
+            prefix_length = len(self._get_key_name(""))
+            async for key_name in self.iscan(
+                match=self._get_key_name("*"), count=self.SCAN_COUNT
+            ):
+                yield key_name.decode()[prefix_length:]
+
+            return
+
+        for hashset_name in self.hashset_names:
+            async for key, _ in self.ihscan(hashset_name, count=self.SCAN_COUNT):
+                yield key.decode()
+
+    async def acquire_lock(self, lock_name: str, ttl: int) -> bool:
+        return bool(
+            await self.set(
+                lock_name,
+                os.getpid(),
+                expire=ttl,
+                exist=aioredis.Redis.SET_IF_NOT_EXIST,
+            )
+        )
+
+    async def is_warm(self) -> bool:
+        # The marker goes away with the data on a flush or an empty failover
+        return bool(await self.exists(self.warm_marker_name))
+
+    async def mark_warm(self):
+        await self.set(self.warm_marker_name, os.getpid())
+
+
+class SessionCache(AioRedisCache):
+    config_key = "redis"
+    sessions_config_key = "sessions"
+    session_key_prefix = "session:"
+    user_sessions_key_prefix = "user_sessions:"
+    credentials_fence_key_prefix = "credentials_fence:"
+
+    def __init__(self, appconfig):
+        super().__init__(appconfig)
+        session_settings = getattr(appconfig, self.sessions_config_key, {})
+        self.enabled = session_settings.get("enabled", True)
+        self.ttl = session_settings.get("ttl", 3600)
+        self.credentials_fence_ttl = session_settings.get("credentials_fence_ttl", 60)
+        self.local_cache = TTLLRUCache(
+            maxsize=session_settings.get("local_cache_size", 10000),
+            ttl=session_settings.get("local_cache_ttl", 5),
+        )
+
+    async def store_session(self, token_hash: str, user_id: int):
+        user_sessions_key = self.user_sessions_key_prefix + str(user_id)
+        pipeline = self.pipeline()
+        pipeline.set(self.session_key_prefix + token_hash, user_id, expire=self.ttl)
+        pipeline.sadd(user_sessions_key, token_hash)
+        pipeline.expire(user_sessions_key, self.ttl)
+        await pipeline.execute()
+
+    async def get_session(self, token_hash: str) -> Optional[int]:
+        # Sliding expiry: every lookup hitting Redis pushes the expiration back
+        session_key = self.session_key_prefix + token_hash
+        pipeline = self.pipeline()
+        pipeline.get(session_key)
+        pipeline.expire(session_key, self.ttl)
+        user_id, _ = await pipeline.execute()
+        return int(user_id) if user_id is not None else None
+
+    @handle_errors
+    async def touch_user_sessions(self, user_id: int):
+        await self.expire(self.user_sessions_key_prefix + str(user_id), self.ttl)
+
+    async def delete_session(self, token_hash: str):
+        await self.delete(self.session_key_prefix + token_hash)
+
+    async def fence_credentials(self, email: str):
+        await self.set(
+            self.credentials_fence_key_prefix + email.lower(),
+            1,
+            expire=self.credentials_fence_ttl,
+        )
+
+    async def fence_users_credentials(self, emails: Iterable[str]):
+        pipeline = self.pipeline()
+        for email in emails:
+            pipeline.set(
+                self.credentials_fence_key_prefix + email.lower(),
+                1,
+                expire=self.credentials_fence_ttl,
+            )
+
+        await pipeline.execute()
+
+    async def is_credentials_fenced(self, email: str) -> bool:
+        return bool(
+            await self.exists(self.credentials_fence_key_prefix + email.lower())
+        )
+
+    async def delete_user_sessions(self, user_id: int) -> List[str]:
+        user_sessions_key = self.user_sessions_key_prefix + str(user_id)
+        token_hashes = [
+            token_hash.decode() for token_hash in await self.smembers(user_sessions_key)
+        ]
+        await self.delete(
+            user_sessions_key,
+            *[self.session_key_prefix + token_hash for token_hash in token_hashes],
+        )
+        return token_hashes
+
+
+class UserRecordCache(AioRedisCache):
+    """
+    Two tier cache of public user records: in-process LRU in front of Redis.
+    Invalidated records leave a short lived tombstone in Redis so that readers
+    go to the master until replicas caught up, instead of caching stale rows.
+    """
+
+    config_key = "redis"
+    user_cache_config_key = "user_cache"
+    key_prefix = "user:"
+    tombstone = b""
+
+    def __init__(self, appconfig):
+        super().__init__(appconfig)
+        user_cache_settings = getattr(appconfig, self.user_cache_config_key, {})
+        self.ttl = user_cache_settings.get("ttl", 300)
+        self.invalidation_grace = user_cache_settings.get("invalidation_grace", 5)
+        self.local_cache = TTLLRUCache(
+            maxsize=user_cache_settings.get("local_cache_size", 10000),
+            ttl=user_cache_settings.get("local_cache_ttl", 5),
+        )
+
+    def _serialize(self, user: Dict) -> str:
+        return json.dumps(_dump_user(user))
+
+    def _deserialize(self, raw_user: bytes) -> Dict:
+        return _load_user(json.loads(raw_user))
+
+    async def get_users(
+        self, user_ids: Iterable[int]
+    ) -> Tuple[Dict[int, Dict], Set[int]]:
+        """Returns the cached users by id and the ids recently invalidated"""
+        users = {}
+        missing_user_ids = []
+        for user_id in user_ids:
+            user = self.local_cache.get(user_id)
+            if user is not None:
+                users[user_id] = user
+            else:
+                missing_user_ids.append(user_id)
+
+        invalidated_user_ids = set()
+        if not missing_user_ids:
+            return users, invalidated_user_ids
+
+        raw_users = await self.mget(
+            *[self.key_prefix + str(user_id) for user_id in missing_user_ids]
+        )
+        for user_id, raw_user in zip(missing_user_ids, raw_users):
+            if raw_user is None:
+                continue
+
+            if raw_user == self.tombstone:
+                invalidated_user_ids.add(user_id)
+                continue
+
+            users[user_id] = self._deserialize(raw_user)
+            self.local_cache.set(user_id, users[user_id])
+
+        return users, invalidated_user_ids
+
+    @handle_errors
+    async def fill_users(self, users: List[Dict]):
+        """
+        Caches users read on a cache miss, the only way records get cached.
+        Never overwrites: a write landing during the read left a tombstone.
+        """
+        pipeline = self.pipeline()
+        for user in users:
+            pipeline.set(
+                self.key_prefix + str(user["id"]),
+                self._serialize(user),
+                expire=self.ttl,
+                exist=aioredis.Redis.SET_IF_NOT_EXIST,
+            )
+
+        for user, stored in zip(users, await pipeline.execute()):
+            if stored:
+                self.local_cache.set(user["id"], user)
+
+    @handle_errors
+    async def invalidate_users(self, user_ids: Iterable[int]):
+        pipeline = self.pipeline()
+        for user_id in user_ids:
+            pipeline.set(
+                self.key_prefix + str(user_id),
+                self.tombstone,
+                expire=self.invalidation_grace,
+            )
+            self.local_cache.pop(user_id)
+
+        await pipeline.execute()
+
+
+class UserJobCache(AioRedisCache):
+    """Progress of the bulk jobs, readable from any process"""
+
+    config_key = "redis"
+    user_jobs_config_key = "user_jobs"
+    key_prefix = "user_job:"
+
+    def __init__(self, appconfig):
+        super().__init__(appconfig)
+        user_jobs_settings = getattr(appconfig, self.user_jobs_config_key, {})
+        self.ttl = user_jobs_settings.get("ttl", 86400)
+        self.chunk_size = user_jobs_settings.get("chunk_size", 1000)
+        self.chunk_pause = user_jobs_settings.get("chunk_pause_ms", 100) / 1000
+        self.max_replica_lag = user_jobs_settings.get("max_replica_lag", 5)
+
+    async def store_job(self, job: Dict):
+        await self.set(self.key_prefix + job["id"], json.dumps(job), expire=self.ttl)
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        raw_job = await self.get(self.key_prefix + job_id)
+        return json.loads(raw_job) if raw_job is not None else None
+
+
+class SearchResultCache(AioRedisCache):
+    """
+    Search results, in-process LRU in front of Redis, keyed by the search
+    generation: a counter bumped by every write to users. Other processes
+    pick a bump up within max_staleness_ms, after which the results cached
+    before it can't be reached anymore and just expire.
+    """
+
+    config_key = "redis"
+    search_cache_config_key = "search_cache"
+    key_prefix = "search:"
+    generation_key = "search_generation"
+    generation_bumped_at_key = "search_generation_bumped_at"
+
+    def __init__(self, appconfig):
+        super().__init__(appconfig)
+        search_cache_settings = getattr(appconfig, self.search_cache_config_key, {})
+        self.enabled = search_cache_settings.get("enabled", False)
+        self.ttl = search_cache_settings.get("ttl", 60)
+        # Filters whose results go stale sooner, the shortest one applies
+        self.filter_ttls = search_cache_settings.get("filter_ttls", {})
+        self.max_staleness = search_cache_settings.get("max_staleness_ms", 1000) / 1000
+        # Results read sooner after a bump aren't cached, see UserManager
+        self.write_settle_time = (
+            search_cache_settings.get("write_settle_ms", 2000) / 1000
+        )
+        self.local_cache = TTLLRUCache(
+            maxsize=search_cache_settings.get("local_cache_size", 1000),
+            ttl=self.ttl,
+        )
+        self._generation: Optional[Tuple[int, float]] = None
+        self._generation_read_at = 0.0
+
+    def get_ttl(self, filters: Dict) -> int:
+        return min(
+            [ttl for name, ttl in self.filter_ttls.items() if name in filters],
+            default=self.ttl,
+        )
+
+    async def get_generation(self) -> Optional[Tuple[int, float]]:
+        """
+        Current generation number and time of its bump, at most max_staleness
+        old. None when Redis can't tell, results can't be trusted then.
+        """
+        if (
+            self._generation is None
+            or time.monotonic() - self._generation_read_at >= self.max_staleness
+        ):
+            try:
+                generation, bumped_at = await self.mget(
+                    self.generation_key, self.generation_bumped_at_key
+                )
+            except Exception:
+                logger.exception("Search generation unavailable")
+                return None
+
+            self._generation = (int(generation or 0), float(bumped_at or 0))
+            self._generation_read_at = time.monotonic()
+
+        return self._generation
+
+    @handle_errors
+    async def bump_generation(self):
+        pipeline = self.pipeline()
+        pipeline.incr(self.generation_key)
+        pipeline.set(self.generation_bumped_at_key, time.time())
+        generation, _ = await pipeline.execute()
+        # Writers see their own writes right away
+        self._generation = (generation, time.time())
+        self._generation_read_at = time.monotonic()
+
+    def _serialize(self, result: Tuple[List[Dict], Optional[int]]) -> str:
+        users, users_num = result
+        return json.dumps(
+            {"users": [_dump_user(user) for user in users], "users_num": users_num}
+        )
+
+    def _deserialize(self, raw_result: bytes) -> Tuple[List[Dict], Optional[int]]:
+        result = json.loads(raw_result)
+        return [_load_user(user) for user in result["users"]], result["users_num"]
+
+    async def get_result(
+        self, generation: int, filters_key: str, ttl: int
+    ) -> Optional[Tuple[List[Dict], Optional[int]]]:
+        result = self.local_cache.get((generation, filters_key))
+        if result is not None:
+            return result
+
+        try:
+            raw_result = await self.get(f"{self.key_prefix}{generation}:{filters_key}")
+            if raw_result is None:
+                return None
+
+            result = self._deserialize(raw_result)
+        except Exception:
+            logger.exception("Search result unavailable")
+            return None
+
+        self.local_cache.set((generation, filters_key), result, ttl=ttl)
+        return result
+
+    @handle_errors
+    async def set_result(
+        self,
+        generation: int,
+        filters_key: str,
+        result: Tuple[List[Dict], Optional[int]],
+        ttl: int,
+    ):
+        self.local_cache.set((generation, filters_key), result, ttl=ttl)
+        await self.set(
+            f"{self.key_prefix}{generation}:{filters_key}",
+            self._serialize(result),
+            expire=ttl,
+        )
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+from application.datastore.db.connection_constants import (
+    USER_MANAGER_DB,
+    MASTER_TYPE,
+    READ_ONLY_TYPE,
+)
+from application.datastore.db.manager_factory import DBManagerFactory
+from application.datastore.query_executors.user import UserQueryExecutor
+from application.lib.log import logger
+from application.lib.utils.singleton import Singleton
+
+
+class ChangeFeedWatcher(metaclass=Singleton):
+    """
+    Tracks the newest position of the change feed for the long-polling
+    clients of the process: a single index read every poll_interval_ms,
+    only while someone is waiting, wakes up every client it has news for.
+    """
+
+    config_key = "change_feed"
+
+    def __init__(self, appconfig):
+        self.settings = getattr(appconfig, self.config_key, {})
+        self.poll_interval = self.settings.get("poll_interval_ms", 1000) / 1000
+        self.safety_lag = self.settings.get("safety_lag", 5)
+        self.max_wait = self.settings.get("max_wait", 30)
+        self.read_from_replicas = self.settings.get("read_from_replicas", False)
+        self.head: Optional[Tuple[datetime, int]] = None
+        self.waiters = 0
+        self._tick = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def init(self):
+        self._task = asyncio.ensure_future(self._watch())
+
+    async def acquire(self):
+        """Read only connection to a database showing every visible change"""
+        if not self.read_from_replicas:
+            return await DBManagerFactory.make_manager(
+                db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
+            ).acquire(read_only=True)
+
+        # Only replicas past the feed horizon, the master otherwise
+        return await DBManagerFactory.make_manager(
+            db_name=USER_MANAGER_DB, db_type=READ_ONLY_TYPE
+        ).acquire(consistency_token=time.time() - self.safety_lag, read_only=True)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self.waiters:
+                continue
+
+            try:
+                async with await self.acquire() as db_worker:
+                    self.head = await UserQueryExecutor.get_changes_head(
+                        db_worker, safety_lag=self.safety_lag
+                    )
+            except Exception as e:
+                logger.warning(f"Change feed head read failed: {e}")
+                continue
+
+            tick, self._tick = self._tick, asyncio.Event()
+            tick.set()
+
+    async def wait_for_changes(
+        self, after: Optional[Tuple[datetime, int]], timeout: float
+    ) -> bool:
+        """
+        To be called after a read found nothing past after: the head cached
+        before that read can't tell, so it waits for the next one at least.
+        False when nothing past after showed up within timeout seconds.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+
+            self.waiters += 1
+            try:
+                await asyncio.wait_for(self._tick.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiters -= 1
+
+            if self.head is not None and (after is None or self.head > after):
+                return True
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
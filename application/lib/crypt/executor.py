@@ -0,0 +1,79 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Tuple
+
+from application.lib.log import logger
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.singleton import Singleton
+
+
+PROCESS_EXECUTOR = "process"
+THREAD_EXECUTOR = "thread"
+
+
+class HashingQueueFull(Exception):
+    pass
+
+
+def _timed_call(func: Callable, *args) -> Tuple[float, float, Any]:
+    # Runs inside the executor worker: time.monotonic is system wide on the
+    # platforms we run on, so it can be compared with the submission time
+    started_at = time.monotonic()
+    result = func(*args)
+    return started_at, time.monotonic() - started_at, result
+
+
+class HashingExecutor(metaclass=Singleton):
+    config_key = "hashing"
+    EXECUTOR_TYPES = (PROCESS_EXECUTOR, THREAD_EXECUTOR)
+
+    def __init__(self, appconfig):
+        self.settings = getattr(appconfig, self.config_key, {})
+        self._executor: Executor = None
+
+    async def init(self):
+        self.executor_type = self.settings.get("executor", PROCESS_EXECUTOR)
+        if self.executor_type not in self.EXECUTOR_TYPES:
+            raise ValueError(f"Invalid hashing executor type {self.executor_type}")
+
+        self.workers = self.settings.get("workers") or os.cpu_count() or 1
+        self._create()
+
+    def _create(self):
+        logger.debug(
+            f"Creating {self.executor_type} hashing executor "
+            f"with {self.workers} workers"
+        )
+        if self.executor_type == PROCESS_EXECUTOR:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="hashing"
+            )
+
+    async def run(self, func: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        submitted_at = time.monotonic()
+        started_at, hash_time, result = await loop.run_in_executor(
+            self._executor, partial(_timed_call, func, *args)
+        )
+
+        metrics = MetricsRegistry()
+        metrics.histogram("hashing.queue_wait_ms").observe(
+            max(started_at - submitted_at, 0) * 1000
+        )
+        metrics.histogram("hashing.hash_ms").observe(hash_time * 1000)
+        return result
+
+    async def close(self):
+        if self._executor is None:
+            return
+
+        logger.debug(f"Shutting down {self.executor_type} hashing executor")
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(self._executor.shutdown, wait=True)
+        )
+        self._executor = None
@@ -1,7 +1,14 @@
 import os
+import hmac
 import hashlib
 from typing import Tuple
 
+from application.lib.crypt.scheduler import (
+    HashingScheduler,
+    LOGIN_LANE,
+    SIGNUP_LANE,
+)
+
 
 class CryptPbkdf2:
     HASH_FUNCTION = "sha512"
@@ -32,3 +39,26 @@ class CryptPbkdf2:
         cls, cleartext_password: str, hashed_password: bytes, salt: bytes
     ) -> bool:
         return cls._hash_password(cleartext_password, salt) == hashed_password
+
+    @classmethod
+    async def encrypt_password_async(
+        cls, cleartext_password: str, lane: str = SIGNUP_LANE
+    ) -> Tuple[bytes, bytes]:
+        salt = cls._generate_salt()
+        hashed_password = await HashingScheduler().run(
+            lane, cls._hash_password, cleartext_password, salt
+        )
+        return hashed_password, salt
+
+    @classmethod
+    async def check_password_async(
+        cls,
+        cleartext_password: str,
+        hashed_password: bytes,
+        salt: bytes,
+        lane: str = LOGIN_LANE,
+    ) -> bool:
+        computed_password = await HashingScheduler().run(
+            lane, cls._hash_password, cleartext_password, salt
+        )
+        return hmac.compare_digest(computed_password, hashed_password)
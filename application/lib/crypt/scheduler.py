@@ -0,0 +1,168 @@
+import asyncio
+import time
+from collections import deque
+from math import ceil
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from application.lib.crypt.executor import HashingExecutor, HashingQueueFull
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.singleton import Singleton
+
+
+LOGIN_LANE = "login"
+PASSWORD_CHANGE_LANE = "password_change"
+SIGNUP_LANE = "signup"
+BATCH_SIGNUP_LANE = "batch_signup"
+
+DEFAULT_LANES = {
+    LOGIN_LANE: {"weight": 6, "deadline_ms": 500},
+    PASSWORD_CHANGE_LANE: {"weight": 3, "deadline_ms": 1000},
+    SIGNUP_LANE: {"weight": 1, "deadline_ms": 2000},
+    # Batches wait as long as needed at the lowest share, but only two full
+    # batches can be queued
+    BATCH_SIGNUP_LANE: {"weight": 1, "deadline_ms": None, "max_queue_size": 2000},
+}
+
+
+class HashingOverloaded(HashingQueueFull):
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"Hashing lane {lane} is overloaded")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class HashingLane:
+    def __init__(
+        self,
+        name: str,
+        weight: int,
+        max_in_flight: int,
+        deadline: Optional[float],
+        max_queue_size: Optional[int],
+    ):
+        self.name = name
+        self.weight = weight
+        self.max_in_flight = max_in_flight
+        self.deadline = deadline
+        self.max_queue_size = max_queue_size
+        self.queue: Deque[Tuple[asyncio.Future, Callable, Tuple, float]] = deque()
+        self.in_flight = 0
+        self.current_weight = 0
+
+    @property
+    def is_active(self) -> bool:
+        return bool(self.queue) or self.in_flight > 0
+
+    @property
+    def is_eligible(self) -> bool:
+        return bool(self.queue) and self.in_flight < self.max_in_flight
+
+
+class HashingScheduler(metaclass=Singleton):
+    """
+    Admission control in front of the HashingExecutor: every kind of hashing
+    work gets its own lane, lanes share the executor workers through smooth
+    weighted round robin and requests are rejected upfront when the estimated
+    queue wait would exceed the lane deadline.
+    """
+
+    config_key = "hashing"
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, appconfig):
+        self.settings = getattr(appconfig, self.config_key, {})
+        self.lanes: Dict[str, HashingLane] = {}
+        self.in_flight = 0
+
+    async def init(self):
+        self.capacity = HashingExecutor().workers
+        self.avg_hash_time = self.settings.get("expected_hash_ms", 50) / 1000
+        lanes_settings = self.settings.get("lanes", {})
+        for lane_name, default_settings in DEFAULT_LANES.items():
+            lane_settings = {**default_settings, **lanes_settings.get(lane_name, {})}
+            deadline_ms = lane_settings.get("deadline_ms")
+            self.lanes[lane_name] = HashingLane(
+                name=lane_name,
+                weight=lane_settings["weight"],
+                max_in_flight=lane_settings.get("max_in_flight", self.capacity),
+                deadline=deadline_ms / 1000 if deadline_ms is not None else None,
+                max_queue_size=lane_settings.get("max_queue_size"),
+            )
+
+    def _estimate_wait(self, lane: HashingLane) -> float:
+        active_weight = sum(
+            other_lane.weight
+            for other_lane in self.lanes.values()
+            if other_lane.is_active or other_lane is lane
+        )
+        slots = min(lane.max_in_flight, self.capacity * lane.weight / active_weight)
+        return (len(lane.queue) + 1) / max(slots, 1) * self.avg_hash_time
+
+    async def run(self, lane_name: str, func: Callable, *args) -> Any:
+        lane = self.lanes[lane_name]
+        metrics = MetricsRegistry()
+
+        estimated_wait = self._estimate_wait(lane)
+        if (lane.deadline is not None and estimated_wait > lane.deadline) or (
+            lane.max_queue_size is not None and len(lane.queue) >= lane.max_queue_size
+        ):
+            metrics.counter(f"hashing.{lane.name}.rejected").inc()
+            raise HashingOverloaded(
+                lane=lane.name, retry_after=max(ceil(estimated_wait), 1)
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.append((future, func, args, time.monotonic()))
+        self._dispatch()
+        return await future
+
+    def _next_lane(self) -> Optional[HashingLane]:
+        eligible_lanes = [lane for lane in self.lanes.values() if lane.is_eligible]
+        if not eligible_lanes:
+            return None
+
+        total_weight = 0
+        for lane in eligible_lanes:
+            lane.current_weight += lane.weight
+            total_weight += lane.weight
+
+        selected_lane = max(eligible_lanes, key=lambda lane: lane.current_weight)
+        selected_lane.current_weight -= total_weight
+        return selected_lane
+
+    def _dispatch(self):
+        while self.in_flight < self.capacity:
+            lane = self._next_lane()
+            if lane is None:
+                return
+
+            future, func, args, enqueued_at = lane.queue.popleft()
+            # Caller went away while waiting for a slot
+            if future.done():
+                continue
+
+            MetricsRegistry().histogram(f"hashing.{lane.name}.queue_wait_ms").observe(
+                (time.monotonic() - enqueued_at) * 1000
+            )
+            lane.in_flight += 1
+            self.in_flight += 1
+            asyncio.ensure_future(self._execute(lane, future, func, args))
+
+    async def _execute(
+        self, lane: HashingLane, future: asyncio.Future, func: Callable, args: Tuple
+    ):
+        started_at = time.monotonic()
+        try:
+            result = await HashingExecutor().run(func, *args)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            hash_time = time.monotonic() - started_at
+            self.avg_hash_time += self.EWMA_ALPHA * (hash_time - self.avg_hash_time)
+            if not future.done():
+                future.set_result(result)
+        finally:
+            lane.in_flight -= 1
+            self.in_flight -= 1
+            self._dispatch()
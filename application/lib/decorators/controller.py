@@ -3,6 +3,8 @@ from typing import Callable
 from functools import wraps
 from logging import getLogger
 
+from application.datastore.db.worker import QueryTimeout
+from application.lib.crypt.executor import HashingQueueFull
 from application.lib.validation import ValidationException, UnsupportedPayloadException
 from application.lib.tornado.request_handler import ApplicationCustomError
 
@@ -23,6 +25,16 @@ def handle_server_errors(request_handler_method: Callable):
             logger.error(ue)
             self.set_status(HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
             self.write({"error": "Unsupported Media Type"})
+        except HashingQueueFull as he:
+            logger.warning(f"Password hashing rejected: {he}")
+            self.set_status(HTTPStatus.SERVICE_UNAVAILABLE)
+            if getattr(he, "retry_after", None) is not None:
+                self.set_header("Retry-After", he.retry_after)
+            self.write({"error": "Service Unavailable"})
+        except QueryTimeout as qe:
+            logger.warning(f"Query timed out: {qe}")
+            self.set_status(HTTPStatus.SERVICE_UNAVAILABLE)
+            self.write({"error": "Query timed out"})
         except ApplicationCustomError as re:
             raise
         except Exception as e:
@@ -0,0 +1,31 @@
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.singleton import Singleton
+
+
+class UserExportSlots(metaclass=Singleton):
+    """
+    Settings of the streaming exports and bound on how many run at once:
+    each one holds a read only connection for as long as the client reads.
+    """
+
+    config_key = "user_export"
+
+    def __init__(self, appconfig):
+        self.settings = getattr(appconfig, self.config_key, {})
+        self.batch_size = self.settings.get("batch_size", 1000)
+        self.max_concurrent = self.settings.get("max_concurrent", 2)
+        self.max_execution_ms = self.settings.get("max_execution_ms", 3600000)
+        self.net_write_timeout = self.settings.get("net_write_timeout", 600)
+        self.retry_after = self.settings.get("retry_after", 30)
+        self.running = 0
+
+    def acquire(self) -> bool:
+        if self.running >= self.max_concurrent:
+            MetricsRegistry().counter("user.export.rejected").inc()
+            return False
+
+        self.running += 1
+        return True
+
+    def release(self):
+        self.running -= 1
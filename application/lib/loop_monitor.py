@@ -0,0 +1,78 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from application.lib.log import logger
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.singleton import Singleton
+
+
+class LoopMonitor(metaclass=Singleton):
+    """
+    Measures the event loop scheduling delay: a timer expecting to wake up
+    every interval records how late it actually ran. A watchdog thread logs
+    the loop thread stack when a single callback blocks for longer than
+    slow_callback_ms, pointing at the offending handler.
+    """
+
+    config_key = "loop_monitor"
+    STACK_LIMIT = 8
+
+    def __init__(self, appconfig):
+        self.settings = getattr(appconfig, self.config_key, {})
+        self.enabled = self.settings.get("enabled", False)
+        self.interval = self.settings.get("interval_ms", 100) / 1000
+        self.slow_callback = self.settings.get("slow_callback_ms", 100) / 1000
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._last_tick = time.monotonic()
+
+    async def init(self):
+        if not self.enabled:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._task = asyncio.ensure_future(self._measure_lag())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor", daemon=True
+        )
+        self._watchdog.start()
+
+    async def _measure_lag(self):
+        lag_histogram = MetricsRegistry().histogram("loop.lag_ms")
+        while True:
+            expected_at = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._last_tick = time.monotonic()
+            lag_histogram.observe(max(self._last_tick - expected_at, 0) * 1000)
+
+    def _watch(self):
+        reported_tick = None
+        while not self._stopped.wait(self.interval):
+            last_tick = self._last_tick
+            blocked_for = time.monotonic() - last_tick - self.interval
+            # One report per stall, the loop thread is the one still blocked
+            if blocked_for < self.slow_callback or last_tick == reported_tick:
+                continue
+
+            reported_tick = last_tick
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            MetricsRegistry().counter("loop.slow_callbacks").inc()
+            stack = "".join(traceback.format_stack(frame, limit=self.STACK_LIMIT))
+            logger.warning(
+                f"Event loop blocked for over {blocked_for * 1000:.0f}ms in:\n{stack}"
+            )
+
+    async def close(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
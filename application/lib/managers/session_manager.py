@@ -0,0 +1,63 @@
+import hashlib
+import secrets
+
+from application.lib.cache import SessionCache
+from application.lib.utils.various import fire_and_forget
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class SessionManager:
+    TOKEN_BYTES = 32
+
+    @classmethod
+    def _hash_token(cls, token: str) -> str:
+        # Only token digests are stored, a Redis dump doesn't leak usable tokens
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return SessionCache().enabled
+
+    @classmethod
+    async def create_session(cls, user_id: int) -> str:
+        token = secrets.token_urlsafe(cls.TOKEN_BYTES)
+        token_hash = cls._hash_token(token)
+        session_cache = SessionCache()
+        await session_cache.store_session(token_hash, user_id)
+        session_cache.local_cache.set(token_hash, user_id)
+        return token
+
+    @classmethod
+    async def validate_session(cls, token: str) -> int:
+        token_hash = cls._hash_token(token)
+        session_cache = SessionCache()
+
+        # Local entries are never extended, revocations performed by other
+        # processes are picked up within local_cache_ttl
+        user_id = session_cache.local_cache.get(token_hash)
+        if user_id is not None:
+            return user_id
+
+        user_id = await session_cache.get_session(token_hash)
+        if user_id is None:
+            raise SessionNotFound
+
+        fire_and_forget(func=session_cache.touch_user_sessions, user_id=user_id)
+        session_cache.local_cache.set(token_hash, user_id)
+        return user_id
+
+    @classmethod
+    async def delete_session(cls, token: str):
+        token_hash = cls._hash_token(token)
+        session_cache = SessionCache()
+        session_cache.local_cache.pop(token_hash)
+        await session_cache.delete_session(token_hash)
+
+    @classmethod
+    async def delete_user_sessions(cls, user_id: int):
+        session_cache = SessionCache()
+        for token_hash in await session_cache.delete_user_sessions(user_id):
+            session_cache.local_cache.pop(token_hash)
@@ -0,0 +1,180 @@
+import asyncio
+import time
+from typing import AsyncIterator, List, Tuple
+
+from application.datastore.db.connection_constants import (
+    USER_MANAGER_DB,
+    MASTER_TYPE,
+    READ_ONLY_TYPE,
+)
+from application.datastore.db.manager_factory import DBManagerFactory
+from application.datastore.query_executors.user import UserQueryExecutor
+from application.lib.cache import UserExistenceCache
+from application.lib.decorators.generic import handle_errors
+from application.lib.log import logger
+from application.lib.metrics import MetricsRegistry
+
+
+WARMUP_OFF = "off"
+WARMUP_BLOCKING = "blocking"
+WARMUP_BACKGROUND = "background"
+
+
+class UserExistenceManager:
+    _db_manager_factory = DBManagerFactory()
+    BATCH_SIZE = 5000
+    RECONCILER_LOCK_TTL = 600
+    WARMUP_LOCK_TTL = 30
+    WARMUP_POLL_INTERVAL = 1
+    WARMUP_PROGRESS_INTERVAL = 5
+
+    @classmethod
+    async def stream_users_emails(
+        cls, batch_size: int = BATCH_SIZE
+    ) -> AsyncIterator[List[Tuple[int, str]]]:
+        """Yields (id, email) batches in id order, one short query per batch"""
+        last_id = 0
+        while True:
+            async with await cls._db_manager_factory.make_manager(
+                db_name=USER_MANAGER_DB, db_type=READ_ONLY_TYPE
+            ).acquire(read_only=True) as db_worker:
+                rows = await UserQueryExecutor.get_users_emails(
+                    db_worker, after_id=last_id, limit=batch_size
+                )
+
+            if rows:
+                yield rows
+
+            if len(rows) < batch_size:
+                return
+
+            last_id = rows[-1][0]
+
+    @classmethod
+    async def _remove_stale_keys(cls, keys: List[str]) -> int:
+        # A lagging replica misses recent signups, whose keys must survive
+        async with await cls._db_manager_factory.make_manager(
+            db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
+        ).acquire(read_only=True) as db_worker:
+            existing_emails = await UserQueryExecutor.get_existing_emails(
+                db_worker, emails=keys
+            )
+
+        # users.email is compared case insensitively by MySQL
+        existing_emails = {email.lower() for email in existing_emails}
+        stale_keys = [key for key in keys if key.lower() not in existing_emails]
+        if stale_keys:
+            await UserExistenceCache().remove_users_existence(stale_keys)
+
+        return len(stale_keys)
+
+    @classmethod
+    @handle_errors
+    async def reconcile(cls):
+        user_existence_cache = UserExistenceCache()
+        settings = user_existence_cache.user_existence_settings
+        batch_size = settings.get("reconcile_batch_size", cls.BATCH_SIZE)
+        # The lock is left to expire: one run per lock ttl across all processes
+        if not await user_existence_cache.acquire_lock(
+            user_existence_cache.reconciler_lock_name,
+            ttl=settings.get("reconcile_lock_ttl", cls.RECONCILER_LOCK_TTL),
+        ):
+            return
+
+        logger.info("User existence reconciliation started")
+        stored_keys_num = 0
+        # With a ttl the cache only keeps recently seen emails, it's not
+        # meant to hold every user
+        if not user_existence_cache.ttl:
+            async for rows in cls.stream_users_emails(batch_size):
+                await user_existence_cache.set_users_existence(
+                    [email for _, email in rows]
+                )
+                stored_keys_num += len(rows)
+
+            await user_existence_cache.mark_warm()
+
+        removed_keys_num = 0
+        keys = []
+        async for key in user_existence_cache.iterate_keys():
+            keys.append(key)
+            if len(keys) >= batch_size:
+                removed_keys_num += await cls._remove_stale_keys(keys)
+                keys = []
+                await asyncio.sleep(0)
+
+        if keys:
+            removed_keys_num += await cls._remove_stale_keys(keys)
+
+        logger.info(
+            f"User existence reconciliation completed: {stored_keys_num} keys "
+            f"stored, {removed_keys_num} stale keys removed"
+        )
+
+    @classmethod
+    @handle_errors
+    async def reload_bloom_filter(cls):
+        """
+        Rebuilds the bloom filter from the cache: emails taken through other
+        processes would be false negatives here otherwise.
+        """
+        await UserExistenceCache().init_bloom_filter()
+
+    @classmethod
+    async def _load_users_emails(cls, batch_size: int, lock_ttl: int):
+        user_existence_cache = UserExistenceCache()
+        loaded_counter = MetricsRegistry().counter("user_existence.warmup.loaded")
+        started_at = last_progress_at = time.monotonic()
+        loaded_keys_num = 0
+        async for rows in cls.stream_users_emails(batch_size):
+            await user_existence_cache.set_users_existence([email for _, email in rows])
+            # Keep the lock while making progress, let it go quickly on a crash
+            await user_existence_cache.expire(
+                user_existence_cache.warmup_lock_name, lock_ttl
+            )
+            loaded_keys_num += len(rows)
+            loaded_counter.inc(len(rows))
+
+            now = time.monotonic()
+            if now - last_progress_at >= cls.WARMUP_PROGRESS_INTERVAL:
+                last_progress_at = now
+                logger.info(
+                    f"User existence warmup: {loaded_keys_num} keys loaded, "
+                    f"{loaded_keys_num / (now - started_at):.0f} keys/s, "
+                    f"last id {rows[-1][0]}"
+                )
+
+        logger.info(
+            f"User existence warmup completed: {loaded_keys_num} keys loaded "
+            f"in {time.monotonic() - started_at:.1f}s"
+        )
+
+    @classmethod
+    async def warmup(cls):
+        """Fills an empty cache from the users table, once across all processes"""
+        user_existence_cache = UserExistenceCache()
+        settings = user_existence_cache.user_existence_settings
+        batch_size = settings.get("warmup_batch_size", cls.BATCH_SIZE)
+        lock_ttl = settings.get("warmup_lock_ttl", cls.WARMUP_LOCK_TTL)
+
+        while not await user_existence_cache.is_warm():
+            if await user_existence_cache.acquire_lock(
+                user_existence_cache.warmup_lock_name, ttl=lock_ttl
+            ):
+                await cls._load_users_emails(batch_size, lock_ttl)
+                await user_existence_cache.mark_warm()
+                await user_existence_cache.delete(user_existence_cache.warmup_lock_name)
+                return
+
+            # Another process is loading, its lock expires if it dies
+            await asyncio.sleep(cls.WARMUP_POLL_INTERVAL)
+
+    @classmethod
+    async def prepare_cache(cls, warmup: bool):
+        user_existence_cache = UserExistenceCache()
+        if warmup:
+            await cls.warmup()
+
+        # Loaded after the warmup, it would give false negatives otherwise
+        await user_existence_cache.init_bloom_filter()
+        user_existence_cache.is_ready = True
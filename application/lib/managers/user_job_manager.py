@@ -0,0 +1,184 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from application.datastore.db.connection_constants import (
+    USER_MANAGER_DB,
+    MASTER_TYPE,
+    READ_ONLY_TYPE,
+)
+from application.datastore.db.manager_factory import DBManagerFactory
+from application.datastore.query_executors.user import UserQueryExecutor
+from application.lib.cache import SessionCache, UserJobCache, UserRecordCache
+from application.lib.log import logger
+from application.lib.managers.session_manager import SessionManager
+from application.lib.managers.user_manager import UserManager
+from application.lib.metrics import MetricsRegistry
+
+
+STATUS_CHANGE_JOB = "status_change"
+
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_INTERRUPTED = "interrupted"
+
+
+class UserJobManager:
+    """
+    Bulk status changes, run in the background by the process accepting them.
+    Matching users are walked in id order, chunk_size at a time, with one short
+    UPDATE transaction per chunk and a pause in between, longer while replicas
+    lag more than max_replica_lag. Users already in the target status are
+    skipped, so a failed or interrupted job can simply be submitted again.
+    """
+
+    _db_manager_factory = DBManagerFactory()
+    _tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def _now(cls) -> str:
+        return datetime.utcnow().replace(microsecond=0).isoformat()
+
+    @classmethod
+    async def start_status_change(
+        cls, filters: Dict, new_status: str, chunk_size: Optional[int] = None
+    ) -> Dict:
+        user_job_cache = UserJobCache()
+        job = {
+            "id": uuid.uuid4().hex,
+            "type": STATUS_CHANGE_JOB,
+            "state": JOB_RUNNING,
+            "new_status": new_status,
+            "processed": 0,
+            "updated": 0,
+            "last_id": 0,
+            "created_at": cls._now(),
+            "updated_at": cls._now(),
+            "finished_at": None,
+            "error": None,
+        }
+        await user_job_cache.store_job(job)
+        task = asyncio.ensure_future(
+            cls._run_status_change(
+                job=job,
+                filters=filters,
+                chunk_size=chunk_size or user_job_cache.chunk_size,
+            )
+        )
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+        return job
+
+    @classmethod
+    async def close(cls):
+        """Stops the running jobs, marking them interrupted"""
+        tasks = list(cls._tasks)
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @classmethod
+    async def get_job(cls, job_id: str) -> Optional[Dict]:
+        return await UserJobCache().get_job(job_id)
+
+    @classmethod
+    async def _change_chunk_status(
+        cls, user_rows: List[Tuple[int, str]], new_status: str, filters: Dict
+    ) -> int:
+        user_ids = [user_id for user_id, _ in user_rows]
+        async with await cls._db_manager_factory.make_manager(
+            db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
+        ).acquire() as db_worker:
+            # Fenced before the commit, logins read the status from replicas
+            await SessionCache().fence_users_credentials(
+                [email for _, email in user_rows]
+            )
+            updated = await UserQueryExecutor.set_users_status(
+                db_worker, user_ids, new_status, filters
+            )
+
+        await UserRecordCache().invalidate_users(user_ids)
+        if updated:
+            await UserManager.invalidate_searches()
+
+        if new_status == "DISABLED":
+            await asyncio.gather(
+                *[SessionManager.delete_user_sessions(user_id) for user_id in user_ids]
+            )
+
+        return updated
+
+    @classmethod
+    async def _wait_for_replicas(cls, max_lag: float, pause: float):
+        read_only_manager = cls._db_manager_factory.make_manager(
+            db_name=USER_MANAGER_DB, db_type=READ_ONLY_TYPE
+        )
+        while True:
+            replication_lag = read_only_manager.replication_lag()
+            if replication_lag is None or replication_lag <= max_lag:
+                return
+
+            await asyncio.sleep(max(pause, replication_lag - max_lag))
+
+    @classmethod
+    async def _run_status_change(cls, job: Dict, filters: Dict, chunk_size: int):
+        user_job_cache = UserJobCache()
+        try:
+            while True:
+                # Master reads: replicas may not show the previous chunk yet
+                async with await cls._db_manager_factory.make_manager(
+                    db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
+                ).acquire(read_only=True) as db_worker:
+                    user_rows = await UserQueryExecutor.get_users_chunk(
+                        db_worker,
+                        filters=filters,
+                        after_id=job["last_id"],
+                        limit=chunk_size,
+                        excluded_status=job["new_status"],
+                    )
+
+                if not user_rows:
+                    break
+
+                updated = await cls._change_chunk_status(
+                    user_rows, job["new_status"], filters
+                )
+                MetricsRegistry().counter("user.jobs.status_change.updated").inc(
+                    updated
+                )
+                job.update(
+                    {
+                        "processed": job["processed"] + len(user_rows),
+                        "updated": job["updated"] + updated,
+                        "last_id": user_rows[-1][0],
+                        "updated_at": cls._now(),
+                    }
+                )
+                await user_job_cache.store_job(job)
+
+                await asyncio.sleep(user_job_cache.chunk_pause)
+                await cls._wait_for_replicas(
+                    user_job_cache.max_replica_lag, user_job_cache.chunk_pause
+                )
+
+            job["state"] = JOB_DONE
+        except asyncio.CancelledError:
+            logger.warning(
+                f"User job {job['id']} interrupted after id {job['last_id']}"
+            )
+            job.update({"state": JOB_INTERRUPTED, "error": "Interrupted by shutdown"})
+            await cls._finish_job(job)
+            raise
+        except Exception as e:
+            logger.exception(f"User job {job['id']} failed")
+            job.update({"state": JOB_FAILED, "error": str(e)})
+
+        await cls._finish_job(job)
+
+    @classmethod
+    async def _finish_job(cls, job: Dict):
+        job.update({"updated_at": cls._now(), "finished_at": cls._now()})
+        await UserJobCache().store_job(job)
@@ -1,4 +1,6 @@
-from typing import Dict, List, Tuple
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
 from datetime import datetime
 
 from application.datastore.db.connection_constants import (
@@ -13,8 +15,55 @@ from application.datastore.query_executors.user import (
     UserNotFoundDb,
 )
 from application.lib.crypt.pbkdf2 import CryptPbkdf2
-from application.lib.cache import UserExistenceCache
-from application.lib.utils.various import fire_and_forget
+from application.lib.crypt.scheduler import (
+    LOGIN_LANE,
+    PASSWORD_CHANGE_LANE,
+    SIGNUP_LANE,
+    BATCH_SIGNUP_LANE,
+)
+from application.lib.cache import (
+    UserExistenceCache,
+    SearchCountCache,
+    SearchResultCache,
+    SessionCache,
+    SuggestionCache,
+    UserRecordCache,
+)
+from application.lib.change_feed import ChangeFeedWatcher
+from application.lib.decorators.generic import handle_errors
+from application.lib.export import UserExportSlots
+from application.lib.log import logger
+from application.lib.managers.session_manager import SessionManager
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.single_flight import SingleFlight
+from application.lib.utils.various import fire_and_forget, canonical_hash
+from application.lib.write_behind import LastLoginWriteBehind
+from application.lib.validation.schemas.user import (
+    BATCH_ALREADY_TAKEN,
+    BATCH_CREATED,
+    COUNT_MODE_EXACT,
+    COUNT_MODE_ESTIMATE,
+    COUNT_MODE_NONE,
+)
+
+
+# Search parameters that don't change the set of matching users
+NON_FILTERING_KEYS = (
+    "sort_by",
+    "order_by_relevance",
+    "limit",
+    "offset",
+    "after",
+    "count_mode",
+)
+
+
+# Rows per multi-row INSERT, one transaction each
+INSERT_BATCH_CHUNK_SIZE = 500
+
+
+# Fields whose change must not be missed by logins reading from replicas
+CREDENTIAL_FIELDS = {"email", "password", "status"}
 
 
 class UserAlreadyTaken(Exception):
@@ -31,10 +80,31 @@ class WrongPassword(Exception):
 
 class UserManager:
     _db_manager_factory = DBManagerFactory()
+    # Identical concurrent reads share a single execution
+    _get_users_flights = SingleFlight("user.get")
+    _search_users_flights = SingleFlight("user.search")
+    SESSIONS_REVOCATION_RETRY_DELAY = 1
 
     @classmethod
     async def _is_user_taken(cls, key):
-        return await UserExistenceCache().user_exists(key)
+        user_existence_cache = UserExistenceCache()
+        if await user_existence_cache.user_exists(key):
+            return True
+
+        if not user_existence_cache.db_precheck:
+            return False
+
+        # A unique index lookup is much cheaper than hashing for nothing
+        async with await cls._db_manager_factory.make_manager(
+            db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
+        ).acquire(read_only=True) as db_worker:
+            is_user_taken = await UserQueryExecutor.email_exists(db_worker, key)
+
+        if is_user_taken:
+            MetricsRegistry().counter("user_existence.db_precheck.hit").inc()
+            cls._cache_user_existence(key)
+
+        return is_user_taken
 
     @classmethod
     def _cache_user_existence(cls, key):
@@ -43,14 +113,24 @@ class UserManager:
             key=key,
         )
 
+    @classmethod
+    @handle_errors
+    async def _store_users_existence(cls, keys: List[str]):
+        await UserExistenceCache().set_users_existence(keys)
+
+    @classmethod
+    def _cache_users_existence(cls, keys: List[str]):
+        fire_and_forget(func=cls._store_users_existence, keys=keys)
+
     @classmethod
     async def insert_user(cls, user_data: Dict) -> int:
         is_user_taken = await cls._is_user_taken(user_data["email"])
         if is_user_taken:
             raise UserAlreadyTaken
 
-        hashed_password, salt = CryptPbkdf2.encrypt_password(
+        hashed_password, salt = await CryptPbkdf2.encrypt_password_async(
             cleartext_password=user_data["password"],
+            lane=SIGNUP_LANE,
         )
         async with await cls._db_manager_factory.make_manager(
             db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
@@ -69,14 +149,170 @@ class UserManager:
             finally:
                 cls._cache_user_existence(user_data["email"])
 
+        await cls.invalidate_searches()
         return user_id
 
     @classmethod
-    async def update_user(cls, user_data: Dict) -> Dict:
+    async def _get_taken_emails(cls, emails: List[str]) -> Set[str]:
+        """Lowercased emails already registered, cache first then master"""
+        user_existence_cache = UserExistenceCache()
+        exist = await user_existence_cache.users_exist(emails)
+        taken_emails = {
+            email.lower() for email, email_exists in zip(emails, exist) if email_exists
+        }
+        missing_emails = [
+            email for email, email_exists in zip(emails, exist) if not email_exists
+        ]
+        if not missing_emails or not user_existence_cache.db_precheck:
+            return taken_emails
+
+        async with await cls._db_manager_factory.make_manager(
+            db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
+        ).acquire(read_only=True) as db_worker:
+            existing_emails = await UserQueryExecutor.get_existing_emails(
+                db_worker, missing_emails
+            )
+
+        if existing_emails:
+            MetricsRegistry().counter("user_existence.db_precheck.hit").inc(
+                len(existing_emails)
+            )
+            cls._cache_users_existence(existing_emails)
+
+        return taken_emails | {email.lower() for email in existing_emails}
+
+    @classmethod
+    async def insert_users(cls, users_data: List[Dict]) -> List[Dict]:
+        """
+        Creates every user whose email isn't taken, returning one result per
+        input row, in order. Rows losing a race to a concurrent signup are
+        told apart by their salt, left untouched by ON DUPLICATE KEY.
+        """
+        results = [
+            {"index": index, "email": user_data["email"], "status": BATCH_ALREADY_TAKEN}
+            for index, user_data in enumerate(users_data)
+        ]
+        # The first occurrence of an email in the batch wins
+        first_indexes = {}
+        for index, user_data in enumerate(users_data):
+            first_indexes.setdefault(user_data["email"].lower(), index)
+
+        taken_emails = await cls._get_taken_emails(
+            [users_data[index]["email"] for index in first_indexes.values()]
+        )
+        indexes = [
+            index for email, index in first_indexes.items() if email not in taken_emails
+        ]
+        if not indexes:
+            return results
+
+        hashing_tasks = [
+            asyncio.ensure_future(
+                CryptPbkdf2.encrypt_password_async(
+                    cleartext_password=users_data[index]["password"],
+                    lane=BATCH_SIGNUP_LANE,
+                )
+            )
+            for index in indexes
+        ]
+        try:
+            hashes = await asyncio.gather(*hashing_tasks)
+        except BaseException:
+            # Hashes still queued in the lane would burn workers for nothing
+            for hashing_task in hashing_tasks:
+                hashing_task.cancel()
+            raise
+        rows = [
+            {**users_data[index], "hashed_password": hashed_password, "salt": salt}
+            for index, (hashed_password, salt) in zip(indexes, hashes)
+        ]
+
+        created_emails = []
+        for chunk_start in range(0, len(rows), INSERT_BATCH_CHUNK_SIZE):
+            chunk_indexes = indexes[chunk_start : chunk_start + INSERT_BATCH_CHUNK_SIZE]
+            chunk_rows = rows[chunk_start : chunk_start + INSERT_BATCH_CHUNK_SIZE]
+            async with await cls._db_manager_factory.make_manager(
+                db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
+            ).acquire() as db_worker:
+                await UserQueryExecutor.insert_users(db_worker, chunk_rows)
+                stored_users = await UserQueryExecutor.get_users_salts(
+                    db_worker, [row["email"] for row in chunk_rows]
+                )
+
+            stored_salts = {
+                email.lower(): (user_id, salt) for user_id, email, salt in stored_users
+            }
+            for index, row in zip(chunk_indexes, chunk_rows):
+                user_id, salt = stored_salts.get(row["email"].lower(), (None, None))
+                if salt == row["salt"]:
+                    results[index].update({"status": BATCH_CREATED, "id": user_id})
+                    created_emails.append(row["email"])
+
+        cls._cache_users_existence([users_data[index]["email"] for index in indexes])
+        if created_emails:
+            await cls.invalidate_searches()
+
+        MetricsRegistry().counter("user.batch.created").inc(len(created_emails))
+        return results
+
+    @classmethod
+    async def invalidate_searches(cls):
+        """To be called once a write to users is committed"""
+        search_result_cache = SearchResultCache()
+        if search_result_cache.enabled:
+            await search_result_cache.bump_generation()
+
+    @classmethod
+    async def _fence_credentials(cls, email: str) -> bool:
+        """Best effort: a Redis failure must not fail the write"""
+        try:
+            await SessionCache().fence_credentials(email)
+        except Exception:
+            logger.exception("Credentials fencing failed")
+            MetricsRegistry().counter("sessions.fence_failed").inc()
+            return False
+
+        return True
+
+    @classmethod
+    async def _update_user_row(
+        cls, db_worker, user_data: Dict
+    ) -> Tuple[Optional[str], bool]:
+        """
+        Single UPDATE, returns the previous email when credentials change and
+        whether its fencing succeeded, to be retried after the commit if not.
+        """
+        previous_email = None
+        fenced = True
+        if CREDENTIAL_FIELDS.intersection(user_data):
+            previous_email = await UserQueryExecutor.get_user_email(
+                db_worker, user_data["id"]
+            )
+            if previous_email is None:
+                raise UserNotFound
+
+            # Replicas may accept the old credentials until they catch up,
+            # fenced before the commit so that there's no unfenced window
+            fenced = await cls._fence_credentials(previous_email)
+
+        try:
+            await UserQueryExecutor.update_user(db_worker, user_data)
+        except UserIntegrityError:
+            raise UserAlreadyTaken
+        except UserNotFoundDb:
+            raise UserNotFound
+
+        return previous_email, fenced
+
+    @classmethod
+    async def update_user(
+        cls, user_data: Dict, return_user: bool = True
+    ) -> Optional[Dict]:
         hashed_password = salt = None
         if "password" in user_data:
-            hashed_password, salt = CryptPbkdf2.encrypt_password(
+            hashed_password, salt = await CryptPbkdf2.encrypt_password_async(
                 cleartext_password=user_data["password"],
+                lane=PASSWORD_CHANGE_LANE,
             )
             user_data.update(
                 {
@@ -88,44 +324,205 @@ class UserManager:
         async with await cls._db_manager_factory.make_manager(
             db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
         ).acquire() as db_worker:
-            try:
-                await UserQueryExecutor.update_user(
-                    db_worker,
-                    user_data,
+            previous_email, fenced = await cls._update_user_row(db_worker, user_data)
+            stored_user = None
+            if return_user:
+                stored_user = await UserQueryExecutor.search_users(
+                    db_worker, filters={"user_ids": [user_data["id"]]}
                 )
-            except UserIntegrityError:
-                raise UserAlreadyTaken
-            except UserNotFoundDb:
-                raise UserNotFound
 
-            stored_user = await UserQueryExecutor.search_users(
-                db_worker, filters={"user_ids": [user_data["id"]]}
+        if not fenced:
+            # Fenced after the commit rather than not at all
+            fire_and_forget(func=cls._fence_credentials, email=previous_email)
+
+        # Not the row just read: a concurrent update may commit after this one
+        # and publish first, readers fill the cache from the tombstone instead
+        await UserRecordCache().invalidate_users([user_data["id"]])
+
+        await cls.invalidate_searches()
+
+        if "email" in user_data and user_data["email"] != previous_email:
+            cls._cache_user_existence(user_data["email"])
+            fire_and_forget(
+                func=UserExistenceCache().remove_user_existence,
+                key=previous_email,
             )
 
-        return stored_user[0]
+        # Sessions don't survive a password change or a disabled account
+        if "password" in user_data or user_data.get("status") == "DISABLED":
+            await cls._revoke_sessions(user_data["id"])
+
+        return stored_user[0] if stored_user is not None else None
 
     @classmethod
     async def delete_user(cls, user_id: int):
         async with await cls._db_manager_factory.make_manager(
             db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
         ).acquire() as db_worker:
-            try:
-                await UserQueryExecutor.update_user(
-                    db_worker,
-                    {"id": user_id, "status": "DISABLED"},
+            previous_email, fenced = await cls._update_user_row(
+                db_worker, {"id": user_id, "status": "DISABLED"}
+            )
+
+        if not fenced:
+            fire_and_forget(func=cls._fence_credentials, email=previous_email)
+
+        await UserRecordCache().invalidate_users([user_id])
+        await cls.invalidate_searches()
+        await cls._revoke_sessions(user_id)
+
+    @classmethod
+    async def _revoke_sessions(cls, user_id: int):
+        """
+        Runs after the commit: failing the request would hide a write that
+        succeeded, so a failure is retried in the background instead.
+        """
+        try:
+            await SessionManager.delete_user_sessions(user_id)
+        except Exception:
+            logger.exception(f"Revoking the sessions of user {user_id} failed")
+            MetricsRegistry().counter("sessions.revoke_failed").inc()
+            fire_and_forget(func=cls._retry_revoke_sessions, user_id=user_id)
+
+    @classmethod
+    @handle_errors
+    async def _retry_revoke_sessions(cls, user_id: int):
+        await asyncio.sleep(cls.SESSIONS_REVOCATION_RETRY_DELAY)
+        await SessionManager.delete_user_sessions(user_id)
+
+    @classmethod
+    async def get_users(
+        cls, user_ids: List[int], consistency_token: Optional[float] = None
+    ) -> List[Dict]:
+        return await cls._get_users_flights.run(
+            (tuple(user_ids), consistency_token),
+            cls._get_users,
+            user_ids,
+            consistency_token,
+        )
+
+    @classmethod
+    async def _get_users(
+        cls, user_ids: List[int], consistency_token: Optional[float] = None
+    ) -> List[Dict]:
+        user_record_cache = UserRecordCache()
+        users, invalidated_user_ids = await user_record_cache.get_users(user_ids)
+
+        missing_user_ids = [
+            user_id
+            for user_id in user_ids
+            if user_id not in users and user_id not in invalidated_user_ids
+        ]
+        # Recently written users are read from master, replicas may lag
+        for db_type, db_user_ids in (
+            (READ_ONLY_TYPE, missing_user_ids),
+            (MASTER_TYPE, list(invalidated_user_ids)),
+        ):
+            if not db_user_ids:
+                continue
+
+            async with await cls._db_manager_factory.make_manager(
+                db_name=USER_MANAGER_DB, db_type=db_type
+            ).acquire(consistency_token=consistency_token, read_only=True) as db_worker:
+                stored_users = await UserQueryExecutor.search_users(
+                    db_worker, filters={"user_ids": db_user_ids}
                 )
-            except UserNotFoundDb:
-                raise UserNotFound
+
+            if stored_users:
+                users.update({user["id"]: user for user in stored_users})
+                if db_type == READ_ONLY_TYPE:
+                    fire_and_forget(
+                        func=user_record_cache.fill_users, users=stored_users
+                    )
+
+        return [users[user_id] for user_id in user_ids if user_id in users]
 
     @classmethod
-    async def search_users(cls, filters: Dict) -> Tuple[List[Dict], int]:
+    def _get_filters_key(cls, filters: Dict, exclude: Iterable[str] = ()) -> str:
+        normalized_filters = {k: v for k, v in filters.items() if k not in exclude}
+        if "user_ids" in normalized_filters:
+            normalized_filters["user_ids"] = sorted(set(normalized_filters["user_ids"]))
+
+        return canonical_hash(normalized_filters)
+
+    @classmethod
+    async def _count_users(cls, db_worker, filters: Dict) -> Optional[int]:
+        count_mode = filters.get("count_mode", COUNT_MODE_EXACT)
+        if count_mode == COUNT_MODE_NONE:
+            return None
+
+        if count_mode == COUNT_MODE_ESTIMATE:
+            return await UserQueryExecutor.estimate_users(db_worker, filters=filters)
+
+        count_cache = SearchCountCache().cache
+        count_key = cls._get_filters_key(filters, exclude=NON_FILTERING_KEYS)
+        users_num = count_cache.get(count_key)
+        if users_num is None:
+            users_num = await UserQueryExecutor.count_users(db_worker, filters=filters)
+            count_cache.set(count_key, users_num)
+
+        return users_num
+
+    @classmethod
+    async def search_users(
+        cls, filters: Dict, consistency_token: Optional[float] = None
+    ) -> Tuple[List[Dict], Optional[int]]:
+        return await cls._search_users_flights.run(
+            (cls._get_filters_key(filters), consistency_token),
+            cls._search_users,
+            filters,
+            consistency_token,
+        )
+
+    @classmethod
+    async def _search_users(
+        cls, filters: Dict, consistency_token: Optional[float] = None
+    ) -> Tuple[List[Dict], Optional[int]]:
+        search_result_cache = SearchResultCache()
+        # Reads carrying a consistency token want fresher data than the cache
+        if not search_result_cache.enabled or consistency_token is not None:
+            return await cls._query_users(filters, consistency_token=consistency_token)
+
+        filters_key = cls._get_filters_key(filters)
+        ttl = search_result_cache.get_ttl(filters)
+        search_generation = await search_result_cache.get_generation()
+        if search_generation is None:
+            return await cls._query_users(filters, consistency_token=consistency_token)
+
+        generation, bumped_at = search_generation
+        result = await search_result_cache.get_result(generation, filters_key, ttl)
+        if result is not None:
+            MetricsRegistry().counter("search_cache.hit").inc()
+            return result
+
+        MetricsRegistry().counter("search_cache.miss").inc()
+        # Replicas as usual, only the client's own token routes reads
+        result = await cls._query_users(filters, consistency_token=consistency_token)
+        # A replica may still miss a recent write: cached under the new
+        # generation, its result would outlive the bump
+        if time.time() - bumped_at < search_result_cache.write_settle_time:
+            MetricsRegistry().counter("search_cache.unsettled").inc()
+            return result
+
+        fire_and_forget(
+            func=search_result_cache.set_result,
+            generation=generation,
+            filters_key=filters_key,
+            result=result,
+            ttl=ttl,
+        )
+        return result
+
+    @classmethod
+    async def _query_users(
+        cls, filters: Dict, consistency_token: Optional[float] = None
+    ) -> Tuple[List[Dict], Optional[int]]:
         async with await cls._db_manager_factory.make_manager(
             db_name=USER_MANAGER_DB, db_type=READ_ONLY_TYPE
-        ).acquire() as db_worker:
-            users_num = await UserQueryExecutor.count_users(db_worker, filters=filters)
+        ).acquire(consistency_token=consistency_token, read_only=True) as db_worker:
+            users_num = await cls._count_users(db_worker, filters=filters)
 
             # No users found
-            if users_num == 0:
+            if users_num == 0 and filters.get("count_mode") != COUNT_MODE_ESTIMATE:
                 return [], users_num
 
             stored_users = await UserQueryExecutor.search_users(
@@ -139,38 +536,110 @@ class UserManager:
             return stored_users, users_num
 
     @classmethod
-    async def login_user(cls, user_data: Dict) -> Dict:
+    async def export_users(
+        cls, filters: Dict, consistency_token: Optional[float] = None
+    ) -> AsyncIterator[List[Dict]]:
+        export_slots = UserExportSlots()
         async with await cls._db_manager_factory.make_manager(
-            db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
-        ).acquire() as db_worker:
-            stored_user = await UserQueryExecutor.search_users(
-                db_worker,
-                filters={
-                    "email": user_data["email"],
-                    "status": "ACTIVE",
-                },
-                include_secrets=True,
+            db_name=USER_MANAGER_DB, db_type=READ_ONLY_TYPE
+        ).acquire(consistency_token=consistency_token, read_only=True) as db_worker:
+            # Slow clients stall the cursor, MySQL must wait for them
+            await UserQueryExecutor.set_net_write_timeout(
+                db_worker, export_slots.net_write_timeout
             )
-            if stored_user is None:
-                raise UserNotFound
+            completed = False
+            try:
+                async for users in UserQueryExecutor.stream_users(
+                    db_worker,
+                    filters=filters,
+                    batch_size=export_slots.batch_size,
+                    max_execution_ms=export_slots.max_execution_ms,
+                ):
+                    yield users
 
-            stored_user = stored_user[0]
-            password_matches = CryptPbkdf2.check_password(
-                cleartext_password=user_data["password"],
-                hashed_password=stored_user["password"],
-                salt=stored_user["salt"],
-            )
-            if not password_matches:
-                raise WrongPassword
+                completed = True
+            finally:
+                if completed:
+                    await UserQueryExecutor.set_net_write_timeout(db_worker, None)
+                else:
+                    # Closing the cursor would read the remaining rows,
+                    # dropping the connection aborts the query instead
+                    await db_worker.invalidate()
 
-            last_login = datetime.utcnow().replace(microsecond=0)
-            await UserQueryExecutor.update_user(
+    @classmethod
+    async def get_changes(
+        cls, after: Optional[Tuple[datetime, int]], limit: int
+    ) -> List[Dict]:
+        change_feed_watcher = ChangeFeedWatcher()
+        async with await change_feed_watcher.acquire() as db_worker:
+            return await UserQueryExecutor.get_changes(
                 db_worker,
-                {
-                    "id": stored_user["id"],
-                    "last_login": last_login,
-                },
+                after=after,
+                limit=limit,
+                safety_lag=change_feed_watcher.safety_lag,
+            )
+
+    @classmethod
+    async def suggest_users(cls, prefix: str, limit: int) -> List[Dict]:
+        # Per-keystroke traffic: identical prefixes are served from memory
+        suggestion_cache = SuggestionCache().cache
+        suggestion_key = (prefix.lower(), limit)
+        suggestions = suggestion_cache.get(suggestion_key)
+        if suggestions is not None:
+            return suggestions
+
+        async with await cls._db_manager_factory.make_manager(
+            db_name=USER_MANAGER_DB, db_type=READ_ONLY_TYPE
+        ).acquire(read_only=True) as db_worker:
+            suggestions = await UserQueryExecutor.suggest_users(
+                db_worker, prefix=prefix, limit=limit
             )
-            stored_user["last_login"] = last_login
 
+        suggestion_cache.set(suggestion_key, suggestions)
+        return suggestions
+
+    @classmethod
+    async def _get_login_user(cls, email: str) -> Optional[Dict]:
+        db_types = (READ_ONLY_TYPE, MASTER_TYPE)
+        if await SessionCache().is_credentials_fenced(email):
+            db_types = (MASTER_TYPE,)
+
+        # Missing on the replica could be a signup that didn't replicate yet
+        for db_type in db_types:
+            async with await cls._db_manager_factory.make_manager(
+                db_name=USER_MANAGER_DB, db_type=db_type
+            ).acquire(read_only=True) as db_worker:
+                stored_user = await UserQueryExecutor.search_users(
+                    db_worker,
+                    filters={
+                        "email": email,
+                        "status": "ACTIVE",
+                    },
+                    include_secrets=True,
+                )
+
+            if stored_user:
+                return stored_user[0]
+
+        return None
+
+    @classmethod
+    async def login_user(cls, user_data: Dict) -> Dict:
+        stored_user = await cls._get_login_user(user_data["email"])
+        if stored_user is None:
+            raise UserNotFound
+
+        # No connection is held while hashing
+        password_matches = await CryptPbkdf2.check_password_async(
+            cleartext_password=user_data["password"],
+            hashed_password=stored_user["password"],
+            salt=stored_user["salt"],
+            lane=LOGIN_LANE,
+        )
+        if not password_matches:
+            raise WrongPassword
+
+        last_login = datetime.utcnow().replace(microsecond=0)
+        await LastLoginWriteBehind().add(stored_user["id"], last_login)
+        stored_user["last_login"] = last_login
         return stored_user
@@ -0,0 +1,70 @@
+from bisect import bisect_left
+from typing import Dict, Sequence
+
+from application.lib.utils.singleton import Singleton
+
+
+DEFAULT_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def snapshot(self) -> int:
+        return self.value
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_MS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict:
+        bucket_labels = [str(bucket) for bucket in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "buckets": dict(zip(bucket_labels, self.counts)),
+        }
+
+
+class MetricsRegistry(metaclass=Singleton):
+    def __init__(self):
+        self._counters: Dict[str, Counter] = {}
+        self._histograms: Dict[str, Histogram] = {}
+
+    def counter(self, name: str) -> Counter:
+        if name not in self._counters:
+            self._counters[name] = Counter()
+
+        return self._counters[name]
+
+    def histogram(
+        self, name: str, buckets: Sequence[float] = DEFAULT_MS_BUCKETS
+    ) -> Histogram:
+        if name not in self._histograms:
+            self._histograms[name] = Histogram(buckets)
+
+        return self._histograms[name]
+
+    def snapshot(self) -> Dict:
+        return {
+            "counters": {
+                name: counter.snapshot() for name, counter in self._counters.items()
+            },
+            "histograms": {
+                name: histogram.snapshot()
+                for name, histogram in self._histograms.items()
+            },
+        }
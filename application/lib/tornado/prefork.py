@@ -0,0 +1,91 @@
+import logging
+import os
+import signal
+import time
+from typing import Callable, Dict, List
+
+
+logger = logging.getLogger("supervisor")
+
+
+class WorkerSupervisor:
+    """
+    Pre-fork supervisor: forks the workers before anything is initialized, so
+    that every worker builds its own event loop, DB and Redis pools, and
+    restarts the workers dying unexpectedly. SIGTERM/SIGINT are forwarded to
+    the workers, which shut down gracefully.
+    """
+
+    MIN_UPTIME = 10
+    MAX_RESTART_DELAY = 30
+
+    def __init__(self, workers: int, worker_main: Callable[[int], int]):
+        self.workers = workers
+        self.worker_main = worker_main
+        self.children: Dict[int, int] = {}
+        self.started_at: List[float] = [0.0] * workers
+        self.failures: List[int] = [0] * workers
+        self.stopping = False
+
+    def _spawn(self, worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            exit_code = 1
+            try:
+                exit_code = self.worker_main(worker_id)
+            except Exception:
+                logger.exception(f"Worker {worker_id} crashed")
+            finally:
+                # Never run the supervisor code in the child
+                os._exit(exit_code)
+
+        self.children[pid] = worker_id
+        self.started_at[worker_id] = time.monotonic()
+        logger.info(f"Worker {worker_id} started with pid {pid}")
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _restart_delay(self, worker_id: int) -> float:
+        # Back off exponentially on workers dying right after starting
+        if time.monotonic() - self.started_at[worker_id] < self.MIN_UPTIME:
+            self.failures[worker_id] += 1
+        else:
+            self.failures[worker_id] = 0
+
+        return min(2 ** self.failures[worker_id] - 1, self.MAX_RESTART_DELAY)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+
+            worker_id = self.children.pop(pid, None)
+            if worker_id is None or self.stopping:
+                continue
+
+            restart_delay = self._restart_delay(worker_id)
+            logger.error(
+                f"Worker {worker_id} (pid {pid}) exited with code "
+                f"{os.waitstatus_to_exitcode(status)}, restarting in {restart_delay}s"
+            )
+            time.sleep(restart_delay)
+            if not self.stopping:
+                self._spawn(worker_id)
+
+        logger.info("All workers exited")
+        return 0
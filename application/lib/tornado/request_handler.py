@@ -1,10 +1,36 @@
-from typing import Dict, Union
+import math
+import time
+from typing import Dict, Optional, Union
 
 from tornado.escape import json_encode, utf8
 from tornado.web import RequestHandler, ErrorHandler, HTTPError
 
+from application.lib.validation import ValidationException
+
+
+CONSISTENCY_TOKEN_HEADER = "X-Consistency-Token"
+
 
 class ApplicationRequestHandler(RequestHandler):
+    def set_consistency_token(self):
+        """To be called once the write is committed"""
+        self.set_header(CONSISTENCY_TOKEN_HEADER, f"{time.time():.6f}")
+
+    def get_consistency_token(self) -> Optional[float]:
+        token = self.request.headers.get(CONSISTENCY_TOKEN_HEADER)
+        if token is None:
+            return None
+
+        try:
+            consistency_token = float(token)
+        except ValueError:
+            consistency_token = math.nan
+
+        if not math.isfinite(consistency_token):
+            raise ValidationException(f"Malformed {CONSISTENCY_TOKEN_HEADER}")
+
+        return consistency_token
+
     def _request_summary(self) -> Dict:
         return {
             "uri": self.request.uri,
@@ -0,0 +1,42 @@
+import hashlib
+from math import ceil, log
+from typing import Iterator
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter: no false negatives, false positives rate close to
+    error_rate as long as no more than capacity keys are added
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(ceil(-capacity * log(error_rate) / log(2) ** 2), 8)
+        self.hashes_num = max(round(self.size / capacity * log(2)), 1)
+        self.bits = bytearray(ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # Double hashing (Kirsch-Mitzenmacher) on top of a single digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first_hash = int.from_bytes(digest[:8], "little")
+        second_hash = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes_num):
+            yield (first_hash + i * second_hash) % self.size
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.count > self.capacity
@@ -0,0 +1,22 @@
+import base64
+import binascii
+import json
+from typing import Dict
+
+
+def encode_cursor(payload: Dict) -> str:
+    serialized_payload = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(serialized_payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict:
+    try:
+        padded_cursor = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded_cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Malformed cursor")
+
+    if not isinstance(payload, dict):
+        raise ValueError("Malformed cursor")
+
+    return payload
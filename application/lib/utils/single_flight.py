@@ -0,0 +1,43 @@
+import asyncio
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from application.lib.metrics import MetricsRegistry
+
+
+class SingleFlight:
+    """
+    Concurrent calls sharing a key wait for the call already in flight instead
+    of running their own, and all get its result or exception. Results are
+    shared, callers must not modify them. The call runs in its own task, so
+    the caller that started it going away doesn't fail the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(
+        self, key: Hashable, func: Callable[..., Awaitable], *args, **kwargs
+    ) -> Any:
+        call = self._calls.get(key)
+        if call is not None:
+            MetricsRegistry().counter(f"single_flight.{self.name}.coalesced").inc()
+            return await asyncio.shield(call)
+
+        MetricsRegistry().counter(f"single_flight.{self.name}.executed").inc()
+        call = asyncio.ensure_future(func(*args, **kwargs))
+        self._calls[key] = call
+        call.add_done_callback(partial(self._forget, key))
+        return await asyncio.shield(call)
+
+    def _forget(self, key: Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+        # Retrieved even when every caller is gone, no "never retrieved" noise
+        if not call.cancelled():
+            call.exception()
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -1,5 +1,7 @@
+import hashlib
+import json
 import re
-from typing import Callable
+from typing import Any, Callable
 
 from tornado.ioloop import IOLoop
 
@@ -18,3 +20,10 @@ def snake_to_upper_camel(*args: str) -> str:
 def fire_and_forget(func: Callable, loop: IOLoop = None, **kwargs):
     used_loop = loop if loop is not None else IOLoop.current()
     used_loop.add_callback(func, **kwargs)
+
+
+def canonical_hash(data: Any) -> str:
+    serialized_data = json.dumps(
+        data, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha1(serialized_data.encode()).hexdigest()
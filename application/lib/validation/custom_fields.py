@@ -39,3 +39,13 @@ class ConvertedAwareDateTime(fields.DateTime):
             return value
 
         return value.replace(tzinfo=tz.UTC).isoformat()
+
+
+class DelimitedList(fields.List):
+    """List field also accepting a comma separated string (query arguments)"""
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(",") if item.strip()]
+
+        return super(DelimitedList, self)._deserialize(value, attr, data, **kwargs)
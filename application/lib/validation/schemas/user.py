@@ -1,4 +1,6 @@
+from datetime import datetime
 from math import ceil
+from typing import Tuple
 
 from marshmallow import (
     Schema,
@@ -10,6 +12,7 @@ from marshmallow import (
     ValidationError,
 )
 
+from application.lib.utils.cursor import encode_cursor, decode_cursor
 from application.lib.validation import custom_fields
 
 
@@ -35,13 +38,53 @@ SEARCHABLE_COLUMNS = (
     "last_modified",
     "last_login",
 )
+DATETIME_COLUMNS = (
+    "created_at",
+    "last_modified",
+    "last_login",
+)
+NULLABLE_COLUMNS = ("last_login",)
 UPDATEABLE_COLUMNS = (
     "name",
     "email",
     "status",
     "password",
 )
+COUNT_MODE_EXACT = "exact"
+COUNT_MODE_ESTIMATE = "estimate"
+COUNT_MODE_NONE = "none"
+COUNT_MODES = (
+    COUNT_MODE_EXACT,
+    COUNT_MODE_ESTIMATE,
+    COUNT_MODE_NONE,
+)
+NAME_MATCH_LIKE = "like"
+NAME_MATCH_FULLTEXT = "fulltext"
+NAME_MATCH_MODES = (
+    NAME_MATCH_LIKE,
+    NAME_MATCH_FULLTEXT,
+)
 MAX_SEARCH_LIMIT = 100
+MAX_SUGGEST_LIMIT = 20
+MAX_BATCH_SIZE = 1000
+MAX_JOB_CHUNK_SIZE = 5000
+MAX_CHANGES_LIMIT = 1000
+MAX_CHANGES_WAIT = 30
+BATCH_CREATED = "created"
+BATCH_ALREADY_TAKEN = "already_taken"
+EXPORT_FORMAT_NDJSON = "ndjson"
+EXPORT_FORMAT_CSV = "csv"
+EXPORT_FORMATS = (
+    EXPORT_FORMAT_NDJSON,
+    EXPORT_FORMAT_CSV,
+)
+EXPORT_COLUMNS = (
+    "id",
+    "name",
+    "email",
+    "status",
+    "last_login",
+)
 PASSWORD_REGEX = r"^(?=.*?[A-Z])(?=.*?[a-z])(?=.*?[0-9]).{10,}$"
 
 
@@ -66,6 +109,30 @@ class UserSchema(Schema):
     # dump_only params
     _id = custom_fields.PositiveInt(attribute="id", data_key="id", dump_only=True)
     last_login = fields.DateTime(required=True, dump_only=True)
+    session_token = fields.String(dump_only=True)
+
+
+def encode_change_cursor(user) -> str:
+    return encode_cursor({"m": user["last_modified"].isoformat(), "i": user["id"]})
+
+
+def decode_change_cursor(cursor: str) -> Tuple[datetime, int]:
+    payload = decode_cursor(cursor)
+    try:
+        last_modified = datetime.fromisoformat(payload["m"])
+        user_id = payload["i"]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Malformed cursor")
+
+    if not isinstance(user_id, int):
+        raise ValueError("Malformed cursor")
+
+    return last_modified, user_id
+
+
+class ChangeFeedUserSchema(UserSchema):
+    created_at = fields.DateTime(dump_only=True)
+    last_modified = fields.DateTime(dump_only=True)
 
 
 class DateTimeRangeSchema(Schema):
@@ -113,6 +180,12 @@ class SearchUserSchema(Schema):
         custom_fields.PositiveInt(), validate=validate.Length(min=1), load_only=True
     )
     name = fields.String(load_only=True)
+    name_match = fields.String(
+        validate=validate.OneOf(NAME_MATCH_MODES),
+        load_only=True,
+        # The full-text index needs mysql/migrations/0001, so it's opt-in
+        load_default=NAME_MATCH_LIKE,
+    )
     email = fields.String(load_only=True)
     status = fields.String(
         validate=validate.OneOf(ALLOWED_STATUS),
@@ -134,10 +207,17 @@ class SearchUserSchema(Schema):
     page = fields.Integer(
         validate=validate.Range(min=0), load_only=True, load_default=0
     )
+    cursor = fields.String(load_only=True)
+    count_mode = fields.String(
+        validate=validate.OneOf(COUNT_MODES),
+        load_only=True,
+        load_default=COUNT_MODE_EXACT,
+    )
 
     # dump_only params
     users = fields.Nested(UserSchema, many=True, dump_only=True)
     pages = custom_fields.PositiveInt(dump_only=True)
+    next_cursor = fields.String(dump_only=True)
 
     @validates_schema
     def validate_sort_duplicates(self, data, **kwargs):
@@ -151,24 +231,255 @@ class SearchUserSchema(Schema):
         if not set(data).intersection(set(AVAILABLE_FILTERS)):
             raise ValidationError("At least one filter required")
 
+    @validates_schema
+    def validate_page_or_cursor(self, data, **kwargs):
+        if data.get("page") and "cursor" in data:
+            raise ValidationError("Page and cursor are mutually exclusive")
+
     @post_load
     def calculate_offset(self, data, **kwargs):
-        data["offset"] = data["limit"] * data["page"]
-        del data["page"]
+        if (
+            "name" in data
+            and data["name_match"] == NAME_MATCH_FULLTEXT
+            and not data.get("sort_by")
+        ):
+            # Best matches first, relevance can't be used for keyset pagination
+            data["order_by_relevance"] = True
+            data.pop("sort_by", None)
+            if "cursor" in data:
+                raise ValidationError(
+                    "Cursor requires sort_by when searching by name", "cursor"
+                )
+        else:
+            # Keyset pagination needs a total order: id closes every sorting
+            sort_by = data.setdefault("sort_by", [])
+            if "id" not in [sorting_data["column"] for sorting_data in sort_by]:
+                tiebreaker_order = sort_by[-1]["order"] if sort_by else "DESC"
+                sort_by.append({"column": "id", "order": tiebreaker_order})
+
+        page = data.pop("page")
+        if "cursor" in data:
+            data["after"] = self._decode_cursor(data.pop("cursor"), data["sort_by"])
+        else:
+            data["offset"] = data["limit"] * page
+
         return data
 
     @pre_dump
     def calculate_pages(self, data, **kwargs):
-        data["pages"] = ceil(data["users_num"] / data["limit"])
+        if data["users_num"] is None:
+            data["pages"] = None
+        else:
+            data["pages"] = ceil(data["users_num"] / data["limit"])
 
         return data
 
+    @pre_dump
+    def calculate_next_cursor(self, data, **kwargs):
+        users = data["users"]
+        if users and len(users) == data["limit"] and data.get("sort_by"):
+            data["next_cursor"] = self._encode_cursor(users[-1], data["sort_by"])
+
+        return data
+
+    @staticmethod
+    def _encode_cursor(last_user, sort_by):
+        values = []
+        for sorting_data in sort_by:
+            value = last_user[sorting_data["column"]]
+            if isinstance(value, datetime):
+                value = value.isoformat()
+
+            values.append(value)
+
+        return encode_cursor(
+            {
+                "k": [[s["column"], s["order"]] for s in sort_by],
+                "v": values,
+            }
+        )
+
+    @staticmethod
+    def _decode_cursor(cursor, sort_by):
+        try:
+            payload = decode_cursor(cursor)
+            keys, values = payload["k"], payload["v"]
+        except (ValueError, KeyError):
+            raise ValidationError("Invalid cursor", "cursor")
+
+        if keys != [[s["column"], s["order"]] for s in sort_by]:
+            raise ValidationError(
+                "Cursor doesn't match the requested sorting", "cursor"
+            )
+
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValidationError("Invalid cursor", "cursor")
+
+        after = []
+        for (column, _), value in zip(keys, values):
+            # Values end up as query parameters, only scalars of the column type
+            if value is None:
+                if column not in NULLABLE_COLUMNS:
+                    raise ValidationError("Invalid cursor", "cursor")
+            elif column == "id":
+                if not isinstance(value, int) or isinstance(value, bool):
+                    raise ValidationError("Invalid cursor", "cursor")
+            elif not isinstance(value, str):
+                raise ValidationError("Invalid cursor", "cursor")
+            elif column in DATETIME_COLUMNS:
+                try:
+                    value = datetime.fromisoformat(value)
+                except ValueError:
+                    raise ValidationError("Invalid cursor", "cursor")
+
+            after.append(value)
+
+        return after
+
+
+class SuggestUserRequestSchema(Schema):
+    q = fields.String(
+        required=True,
+        validate=validate.Length(min=1, max=255),
+        load_only=True,
+    )
+    limit = fields.Integer(
+        validate=validate.Range(min=1, max=MAX_SUGGEST_LIMIT),
+        load_only=True,
+        load_default=10,
+    )
+
 
 class LoginUserRequestSchema(Schema):
     email = fields.Email(required=True, load_only=True)
     password = fields.String(required=True, load_only=True)
 
 
+class GetUserRequestSchema(Schema):
+    _id = custom_fields.PositiveInt(attribute="id", data_key="id", load_only=True)
+    ids = custom_fields.DelimitedList(
+        custom_fields.PositiveInt(),
+        validate=validate.Length(min=1, max=MAX_SEARCH_LIMIT),
+        load_only=True,
+    )
+
+    @validates_schema
+    def validate_id_or_ids(self, data, **kwargs):
+        if ("id" in data) == ("ids" in data):
+            raise ValidationError("Exactly one of id and ids required")
+
+
+class ExportUserRequestSchema(SearchUserSchema):
+    format = fields.String(
+        validate=validate.OneOf(EXPORT_FORMATS),
+        load_only=True,
+        load_default=EXPORT_FORMAT_NDJSON,
+    )
+
+    class Meta:
+        exclude = ("limit", "page", "cursor", "count_mode")
+
+    @post_load
+    def calculate_offset(self, data, **kwargs):
+        # A single ordered scan: no pages, cursors nor tiebreaker needed
+        if (
+            "name" in data
+            and data["name_match"] == NAME_MATCH_FULLTEXT
+            and not data.get("sort_by")
+        ):
+            data["order_by_relevance"] = True
+            data.pop("sort_by", None)
+
+        return data
+
+
+class StatusChangeJobRequestSchema(SearchUserSchema):
+    new_status = fields.String(
+        required=True,
+        validate=validate.OneOf(ALLOWED_STATUS),
+        load_only=True,
+    )
+    chunk_size = fields.Integer(
+        validate=validate.Range(min=1, max=MAX_JOB_CHUNK_SIZE), load_only=True
+    )
+
+    class Meta:
+        exclude = ("sort_by", "limit", "page", "cursor", "count_mode")
+
+    @post_load
+    def calculate_offset(self, data, **kwargs):
+        # Jobs walk the matching users by id, there's nothing to page
+        return data
+
+
+class UserJobSchema(Schema):
+    _id = fields.String(attribute="id", data_key="id", dump_only=True)
+    type = fields.String(dump_only=True)
+    state = fields.String(dump_only=True)
+    new_status = fields.String(dump_only=True)
+    processed = fields.Integer(dump_only=True)
+    updated = fields.Integer(dump_only=True)
+    last_id = fields.Integer(dump_only=True)
+    created_at = fields.String(dump_only=True)
+    updated_at = fields.String(dump_only=True)
+    finished_at = fields.String(dump_only=True, allow_none=True)
+    error = fields.String(dump_only=True, allow_none=True)
+
+
+class GetUserJobRequestSchema(Schema):
+    job_id = fields.String(
+        required=True,
+        validate=validate.Regexp(r"^[0-9a-f]{32}$"),
+        load_only=True,
+    )
+
+
+class ChangeFeedRequestSchema(Schema):
+    cursor = fields.String(load_only=True)
+    limit = fields.Integer(
+        validate=validate.Range(min=1, max=MAX_CHANGES_LIMIT),
+        load_only=True,
+        load_default=100,
+    )
+    wait = fields.Integer(
+        validate=validate.Range(min=0, max=MAX_CHANGES_WAIT),
+        load_only=True,
+        load_default=0,
+    )
+
+    # dump_only params
+    users = fields.Nested(ChangeFeedUserSchema, many=True, dump_only=True)
+    next_cursor = fields.String(dump_only=True, allow_none=True)
+
+    @post_load
+    def decode_cursor(self, data, **kwargs):
+        if "cursor" in data:
+            try:
+                data["after"] = decode_change_cursor(data.pop("cursor"))
+            except ValueError:
+                raise ValidationError("Invalid cursor", "cursor")
+
+        return data
+
+
+class CreateUserBatchRequestSchema(Schema):
+    users = fields.Nested(
+        UserSchema,
+        only=["name", "email", "password"],
+        many=True,
+        required=True,
+        validate=validate.Length(min=1, max=MAX_BATCH_SIZE),
+        load_only=True,
+    )
+
+
+class UserBatchResultSchema(Schema):
+    index = fields.Integer(dump_only=True)
+    email = fields.String(dump_only=True)
+    status = fields.String(dump_only=True)
+    _id = custom_fields.PositiveInt(attribute="id", data_key="id", dump_only=True)
+
+
 class DeleteUserRequestSchema(Schema):
     _id = custom_fields.PositiveInt(
         attribute="id", data_key="id", required=True, load_only=True
@@ -177,7 +488,19 @@ class DeleteUserRequestSchema(Schema):
 
 user_schema = UserSchema()
 create_user_request_schema = UserSchema(only=["name", "email", "password"])
+create_user_batch_request_schema = CreateUserBatchRequestSchema()
+user_batch_results_schema = UserBatchResultSchema(many=True)
 update_user_request_schema = UpdateUserRequestSchema()
+get_user_request_schema = GetUserRequestSchema()
+users_schema = UserSchema(many=True)
 delete_user_request_schema = DeleteUserRequestSchema()
 search_user_request_schema = SearchUserSchema()
+export_user_request_schema = ExportUserRequestSchema()
+suggest_user_request_schema = SuggestUserRequestSchema()
+status_change_job_request_schema = StatusChangeJobRequestSchema()
+get_user_job_request_schema = GetUserJobRequestSchema()
+user_job_schema = UserJobSchema()
+change_feed_request_schema = ChangeFeedRequestSchema()
+change_feed_user_schema = ChangeFeedUserSchema()
+user_suggestion_schema = UserSchema(only=["_id", "name", "email"], many=True)
 login_user_request_schema = LoginUserRequestSchema()
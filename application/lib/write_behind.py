@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional
+
+from application.datastore.db.connection_constants import USER_MANAGER_DB, MASTER_TYPE
+from application.datastore.db.manager_factory import DBManagerFactory
+from application.datastore.query_executors.user import UserQueryExecutor
+from application.lib.cache import UserRecordCache
+from application.lib.log import logger
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.singleton import Singleton
+from application.lib.utils.various import fire_and_forget
+
+
+class LastLoginWriteBehind(metaclass=Singleton):
+    """
+    Buffers last_login updates and writes them every flush_interval_ms with
+    a single multi-row UPDATE per batch. Only the latest login per user is
+    kept. Disabled, every login is written right away.
+    """
+
+    config_key = "last_login_write_behind"
+
+    def __init__(self, appconfig):
+        self.settings = getattr(appconfig, self.config_key, {})
+        self.enabled = self.settings.get("enabled", False)
+        self.flush_interval = self.settings.get("flush_interval_ms", 500) / 1000
+        self.max_batch_size = self.settings.get("max_batch_size", 1000)
+        self._pending: Dict[int, datetime] = {}
+        self._flush_lock = asyncio.Lock()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def init(self):
+        if self.enabled:
+            self._task = asyncio.ensure_future(self._flush_periodically())
+
+    async def add(self, user_id: int, last_login: datetime):
+        if not self.enabled:
+            await self._write({user_id: last_login})
+            return
+
+        self._pending[user_id] = last_login
+        if len(self._pending) >= self.max_batch_size and not self._flush_lock.locked():
+            fire_and_forget(func=self.flush)
+
+    async def _flush_periodically(self):
+        # Never cancelled: a cancelled write would leave its outcome unknown
+        while True:
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+            else:
+                return
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = {}
+                while self._pending and len(batch) < self.max_batch_size:
+                    user_id, last_login = self._pending.popitem()
+                    batch[user_id] = last_login
+
+                try:
+                    await self._write(batch)
+                except asyncio.CancelledError:
+                    # Written again by whoever flushes next, rewrites are harmless
+                    self._pending = {**batch, **self._pending}
+                    raise
+                except Exception:
+                    logger.exception("last_login write behind flush failed")
+                    # Retried on the next flush, newer logins win
+                    self._pending = {**batch, **self._pending}
+                    return
+
+    async def _write(self, last_logins: Dict[int, datetime]):
+        async with await DBManagerFactory.make_manager(
+            db_name=USER_MANAGER_DB, db_type=MASTER_TYPE
+        ).acquire() as db_worker:
+            await UserQueryExecutor.update_last_logins(db_worker, last_logins)
+
+        MetricsRegistry().histogram(
+            "last_login.batch_size", buckets=(1, 10, 50, 100, 500, 1000, 5000)
+        ).observe(len(last_logins))
+        # last_modified changed as well, let the next read fetch the rows
+        await UserRecordCache().invalidate_users(list(last_logins))
+
+    async def close(self):
+        if self._task is not None:
+            # Lets a flush in progress complete its batch
+            self._closing.set()
+            await self._task
+            self._task = None
+
+        await self.flush()
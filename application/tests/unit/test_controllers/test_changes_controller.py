@@ -0,0 +1,70 @@
+from datetime import datetime
+from http import HTTPStatus
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from application.controllers.user import UserChangesController
+from application.lib.validation.schemas.user import (
+    encode_change_cursor,
+    decode_change_cursor,
+)
+from application.tests.unit.test_controllers.utils import make_controller
+
+
+USER = {
+    "id": 3,
+    "name": "Andrea",
+    "email": "andrea@test.com",
+    "status": "ACTIVE",
+    "last_login": None,
+    "created_at": datetime(2022, 1, 1, 12, 0, 0),
+    "last_modified": datetime(2022, 1, 2, 12, 0, 0),
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "has_changes, expected_users",
+    [
+        (True, [USER]),
+        (False, []),
+    ],
+)
+async def test_long_poll(mocker, has_changes, expected_users):
+    cursor = encode_change_cursor(
+        {"last_modified": datetime(2022, 1, 1, 12, 0, 0), "id": 9}
+    )
+    mock_get_changes = mocker.patch(
+        "application.controllers.user.UserManager.get_changes",
+        side_effect=[[], [USER]],
+    )
+    mock_change_feed_watcher = MagicMock()
+    mock_change_feed_watcher.wait_for_changes = AsyncMock(return_value=has_changes)
+    mocker.patch(
+        "application.controllers.user.ChangeFeedWatcher",
+        return_value=mock_change_feed_watcher,
+    )
+    mocked_request = MagicMock(
+        method="GET",
+        body=b"",
+        arguments={"cursor": [cursor.encode()], "wait": [b"10"]},
+        headers={},
+    )
+    controller = make_controller(
+        controller_class=UserChangesController,
+        application=MagicMock(),
+        request=mocked_request,
+    )
+    await controller.get()
+
+    after = (datetime(2022, 1, 1, 12, 0, 0), 9)
+    mock_change_feed_watcher.wait_for_changes.assert_awaited_once_with(after, 10)
+    assert mock_get_changes.await_count == (2 if has_changes else 1)
+    controller.set_status.assert_called_once_with(HTTPStatus.OK)
+    response = controller.write.call_args.args[0]
+    assert [user["id"] for user in response["users"]] == [
+        user["id"] for user in expected_users
+    ]
+    expected_after = (USER["last_modified"], USER["id"]) if has_changes else after
+    assert decode_change_cursor(response["next_cursor"]) == expected_after
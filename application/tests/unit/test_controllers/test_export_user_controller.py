@@ -0,0 +1,128 @@
+import json
+from datetime import datetime
+from http import HTTPStatus
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from application.controllers.user import UserExportController
+from application.tests.unit.test_controllers.utils import make_controller
+
+
+USERS = [
+    {
+        "id": 1,
+        "name": "Andrea",
+        "email": "andrea@test.com",
+        "status": "ACTIVE",
+        "last_login": datetime(2022, 1, 1),
+    },
+    {
+        "id": 2,
+        "name": "Bianca",
+        "email": "bianca@test.com",
+        "status": "ACTIVE",
+        "last_login": None,
+    },
+]
+
+
+@pytest.fixture
+def mock_export_slots(mocker):
+    mock = MagicMock(retry_after=30)
+    mock.acquire.return_value = True
+    mocker.patch("application.controllers.user.UserExportSlots", return_value=mock)
+    yield mock
+
+
+@pytest.fixture
+def mock_manager_export_users(mocker):
+    async def export_users(filters, consistency_token=None):
+        for user in USERS:
+            yield [user]
+
+    mock = mocker.patch(
+        "application.controllers.user.UserManager.export_users",
+        side_effect=export_users,
+    )
+    yield mock
+
+
+def make_export_controller(query_arguments):
+    mocked_request = MagicMock(
+        method="GET", body=b"", arguments=query_arguments, headers={}
+    )
+    controller = make_controller(
+        controller_class=UserExportController,
+        application=MagicMock(),
+        request=mocked_request,
+    )
+    controller.flush = AsyncMock()
+    return controller
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "export_format, expected_writes",
+    [
+        (
+            b"ndjson",
+            [
+                {
+                    "id": 1,
+                    "name": "Andrea",
+                    "email": "andrea@test.com",
+                    "status": "ACTIVE",
+                    "last_login": "2022-01-01T00:00:00",
+                },
+                {
+                    "id": 2,
+                    "name": "Bianca",
+                    "email": "bianca@test.com",
+                    "status": "ACTIVE",
+                    "last_login": None,
+                },
+            ],
+        ),
+        (
+            b"csv",
+            [
+                "id,name,email,status,last_login\r\n"
+                "1,Andrea,andrea@test.com,ACTIVE,2022-01-01T00:00:00\r\n",
+                "2,Bianca,bianca@test.com,ACTIVE,\r\n",
+            ],
+        ),
+    ],
+)
+async def test_export_users(
+    mock_export_slots, mock_manager_export_users, export_format, expected_writes
+):
+    controller = make_export_controller(
+        {"status": [b"ACTIVE"], "format": [export_format]}
+    )
+    await controller.get()
+
+    mock_manager_export_users.assert_called_once_with(
+        {"status": "ACTIVE", "name_match": "like"}, consistency_token=None
+    )
+    controller.set_status.assert_called_once_with(HTTPStatus.OK)
+    writes = [write_call.args[0] for write_call in controller.write.call_args_list]
+    if export_format == b"ndjson":
+        assert all(write.endswith("\n") for write in writes)
+        writes = [json.loads(write) for write in writes]
+
+    assert writes == expected_writes
+    # One flush per batch
+    assert controller.flush.await_count == len(USERS)
+    mock_export_slots.release.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_export_users_no_slot(mock_export_slots, mock_manager_export_users):
+    mock_export_slots.acquire.return_value = False
+    controller = make_export_controller({"status": [b"ACTIVE"]})
+    await controller.get()
+
+    mock_manager_export_users.assert_not_called()
+    controller.set_status.assert_called_once_with(HTTPStatus.SERVICE_UNAVAILABLE)
+    mock_export_slots.release.assert_not_called()
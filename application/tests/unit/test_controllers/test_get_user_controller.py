@@ -0,0 +1,55 @@
+from http import HTTPStatus
+from unittest.mock import MagicMock
+
+import pytest
+
+from application.controllers.user import UserWriteController
+from application.tests.unit.test_controllers.utils import make_controller
+
+
+@pytest.fixture
+def mock_manager_get_users(mocker):
+    mock = mocker.patch(
+        "application.controllers.user.UserManager.get_users", return_value=[]
+    )
+    yield mock
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "headers, get_users_expected_call, expected_status",
+    [
+        (
+            {},
+            {"consistency_token": None},
+            HTTPStatus.NOT_FOUND,
+        ),
+        (
+            {"X-Consistency-Token": "1700000000.123456"},
+            {"consistency_token": 1700000000.123456},
+            HTTPStatus.NOT_FOUND,
+        ),
+        (
+            {"X-Consistency-Token": "nan"},
+            None,
+            HTTPStatus.BAD_REQUEST,
+        ),
+    ],
+)
+async def test_get_user_consistency_token(
+    mock_manager_get_users, headers, get_users_expected_call, expected_status
+):
+    mocked_request = MagicMock(method="GET", body=b"", arguments={}, headers=headers)
+    controller = make_controller(
+        controller_class=UserWriteController,
+        application=MagicMock(),
+        request=mocked_request,
+    )
+    await controller.get(id="1")
+
+    if get_users_expected_call is not None:
+        mock_manager_get_users.assert_awaited_once_with([1], **get_users_expected_call)
+    else:
+        mock_manager_get_users.assert_not_called()
+
+    controller.set_status.assert_called_with(expected_status)
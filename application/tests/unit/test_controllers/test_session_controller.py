@@ -0,0 +1,84 @@
+from http import HTTPStatus
+from unittest.mock import MagicMock
+
+import pytest
+
+from application.controllers.user import UserSessionController
+from application.lib.managers.session_manager import SessionNotFound
+from application.tests.unit.test_controllers.utils import make_controller
+
+
+def make_session_controller(headers):
+    mocked_request = MagicMock(method="GET", body=b"", arguments={}, headers=headers)
+    return make_controller(
+        controller_class=UserSessionController,
+        application=MagicMock(),
+        request=mocked_request,
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "headers, validated, expected_status, expected_response",
+    [
+        ({"Authorization": "Bearer token"}, 7, HTTPStatus.OK, {"id": 7}),
+        (
+            {"Authorization": "Bearer token"},
+            SessionNotFound(),
+            HTTPStatus.UNAUTHORIZED,
+            "Invalid or expired session",
+        ),
+        ({}, None, HTTPStatus.UNAUTHORIZED, "Missing session token"),
+        (
+            {"Authorization": "Basic token"},
+            None,
+            HTTPStatus.UNAUTHORIZED,
+            "Missing session token",
+        ),
+        (
+            {"Authorization": "Bearer  "},
+            None,
+            HTTPStatus.UNAUTHORIZED,
+            "Missing session token",
+        ),
+    ],
+)
+async def test_validate_session(
+    mocker, headers, validated, expected_status, expected_response
+):
+    mock_validate_session = mocker.patch(
+        "application.controllers.user.SessionManager.validate_session",
+        side_effect=[validated],
+    )
+    controller = make_session_controller(headers)
+
+    await controller.get()
+
+    if validated is None:
+        mock_validate_session.assert_not_awaited()
+    else:
+        mock_validate_session.assert_awaited_once_with("token")
+    controller.set_status.assert_called_once_with(expected_status)
+    controller.write.assert_called_once_with(expected_response)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "headers, expected_status, expected_deleted",
+    [
+        ({"Authorization": "bearer token"}, HTTPStatus.NO_CONTENT, True),
+        ({}, HTTPStatus.UNAUTHORIZED, False),
+    ],
+)
+async def test_delete_session(mocker, headers, expected_status, expected_deleted):
+    mock_delete_session = mocker.patch(
+        "application.controllers.user.SessionManager.delete_session",
+    )
+    controller = make_session_controller(headers)
+
+    await controller.delete()
+
+    assert mock_delete_session.await_count == int(expected_deleted)
+    if expected_deleted:
+        mock_delete_session.assert_awaited_once_with("token")
+    controller.set_status.assert_called_once_with(expected_status)
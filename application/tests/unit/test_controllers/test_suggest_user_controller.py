@@ -0,0 +1,62 @@
+from http import HTTPStatus
+from unittest.mock import MagicMock
+
+import pytest
+
+from application.controllers.user import UserSuggestController
+from application.tests.unit.test_controllers.utils import make_controller
+
+
+@pytest.fixture
+def mock_manager_suggest_users(mocker):
+    mock = mocker.patch(
+        "application.controllers.user.UserManager.suggest_users",
+        return_value=[{"id": 1, "name": "Andrea", "email": "andrea@test.com"}],
+    )
+    yield mock
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "query_arguments, suggest_users_expected_call, expected_write, expected_status",
+    [
+        (
+            # Default limit
+            {"q": [b"andr"]},
+            {"prefix": "andr", "limit": 10},
+            [{"id": 1, "name": "Andrea", "email": "andrea@test.com"}],
+            HTTPStatus.OK,
+        ),
+        (
+            # Limit over the cap
+            {"q": [b"andr"], "limit": [b"50"]},
+            None,
+            {"error": "{'limit': ['Must be greater than or equal to 1 and less than or equal to 20.']}"},
+            HTTPStatus.BAD_REQUEST,
+        ),
+    ],
+)
+async def test_suggest_users(
+    mock_manager_suggest_users,
+    query_arguments,
+    suggest_users_expected_call,
+    expected_write,
+    expected_status,
+):
+    mocked_request = MagicMock(method="GET", body=b"", arguments=query_arguments)
+    controller = make_controller(
+        controller_class=UserSuggestController,
+        application=MagicMock(),
+        request=mocked_request,
+    )
+    await controller.get()
+
+    if suggest_users_expected_call is not None:
+        mock_manager_suggest_users.assert_awaited_once_with(
+            **suggest_users_expected_call
+        )
+    else:
+        mock_manager_suggest_users.assert_not_called()
+
+    controller.write.assert_called_once_with(expected_write)
+    controller.set_status.assert_called_once_with(expected_status)
@@ -0,0 +1,105 @@
+import json
+from http import HTTPStatus
+from unittest.mock import MagicMock
+
+import pytest
+
+from application.controllers.user import UserJobController, UserStatusJobController
+from application.tests.unit.test_controllers.utils import make_controller
+
+
+JOB = {
+    "id": "a" * 32,
+    "type": "status_change",
+    "state": "interrupted",
+    "new_status": "DISABLED",
+    "processed": 1000,
+    "updated": 990,
+    "last_id": 1234,
+    "created_at": "2022-01-01T00:00:00",
+    "updated_at": "2022-01-01T00:05:00",
+    "finished_at": "2022-01-01T00:05:00",
+    "error": "Interrupted by shutdown",
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "body_request, start_status_change_expected_call, expected_write, expected_status",
+    [
+        (
+            # Filters go to the job as they would to a search
+            {"new_status": "DISABLED", "status": "ACTIVE", "chunk_size": 500},
+            {
+                "filters": {"status": "ACTIVE", "name_match": "like"},
+                "new_status": "DISABLED",
+                "chunk_size": 500,
+            },
+            JOB,
+            HTTPStatus.ACCEPTED,
+        ),
+        (
+            # Unknown target status
+            {"new_status": "GONE"},
+            None,
+            {"error": "{'new_status': ['Must be one of: ACTIVE, DISABLED.']}"},
+            HTTPStatus.BAD_REQUEST,
+        ),
+    ],
+)
+async def test_start_status_change(
+    mocker,
+    body_request,
+    start_status_change_expected_call,
+    expected_write,
+    expected_status,
+):
+    mock_start_status_change = mocker.patch(
+        "application.controllers.user.UserJobManager.start_status_change",
+        return_value=JOB,
+    )
+    mocked_request = MagicMock(
+        method="POST", body=json.dumps(body_request), arguments={}, headers={}
+    )
+    controller = make_controller(
+        controller_class=UserStatusJobController,
+        application=MagicMock(),
+        request=mocked_request,
+    )
+    await controller.post()
+
+    if start_status_change_expected_call is not None:
+        mock_start_status_change.assert_awaited_once_with(
+            **start_status_change_expected_call
+        )
+        assert controller._headers["Location"] == f"/user/jobs/{JOB['id']}"
+    else:
+        mock_start_status_change.assert_not_called()
+
+    controller.write.assert_called_once_with(expected_write)
+    controller.set_status.assert_called_once_with(expected_status)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "job, expected_write, expected_status",
+    [
+        (JOB, JOB, HTTPStatus.OK),
+        (None, "Job doesn't exist", HTTPStatus.NOT_FOUND),
+    ],
+)
+async def test_get_job(mocker, job, expected_write, expected_status):
+    mock_get_job = mocker.patch(
+        "application.controllers.user.UserJobManager.get_job", return_value=job
+    )
+    mocked_request = MagicMock(method="GET", body=b"", arguments={}, headers={})
+    controller = make_controller(
+        controller_class=UserJobController,
+        application=MagicMock(),
+        request=mocked_request,
+    )
+    await controller.get(job_id=JOB["id"])
+
+    mock_get_job.assert_awaited_once_with(JOB["id"])
+    controller.write.assert_called_once_with(expected_write)
+    controller.set_status.assert_called_once_with(expected_status)
@@ -0,0 +1,21 @@
+from application.lib.utils.bloom import BloomFilter
+
+
+def test_added_keys_are_always_found():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    emails = [f"user{i}@test.com" for i in range(1000)]
+    for email in emails:
+        bloom_filter.add(email)
+
+    assert all(email in bloom_filter for email in emails)
+    assert not bloom_filter.is_saturated
+
+
+def test_false_positive_rate():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom_filter.add(f"user{i}@test.com")
+
+    false_positives = sum(f"other{i}@test.com" in bloom_filter for i in range(10000))
+
+    assert false_positives < 300
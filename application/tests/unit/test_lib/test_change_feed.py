@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+
+from application.lib.change_feed import ChangeFeedWatcher
+from application.lib.utils.singleton import Singleton
+
+
+HEAD = (datetime(2022, 1, 1, 12, 0, 0), 7)
+
+
+@pytest_asyncio.fixture
+async def change_feed_watcher(mocker):
+    appconfig = MagicMock(change_feed={"poll_interval_ms": 10, "safety_lag": 5})
+    change_feed_watcher = ChangeFeedWatcher(appconfig)
+    mocker.patch.object(
+        change_feed_watcher, "acquire", AsyncMock(return_value=AsyncMock())
+    )
+    await change_feed_watcher.init()
+    yield change_feed_watcher
+    await change_feed_watcher.close()
+    Singleton._instances.pop(ChangeFeedWatcher, None)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_changes(mocker, change_feed_watcher):
+    mock_get_changes_head = mocker.patch(
+        "application.lib.change_feed.UserQueryExecutor.get_changes_head",
+        return_value=HEAD,
+    )
+
+    assert await change_feed_watcher.wait_for_changes(None, timeout=1)
+    assert await change_feed_watcher.wait_for_changes(
+        (datetime(2022, 1, 1, 12, 0, 0), 6), timeout=1
+    )
+    # Already at the head
+    assert not await change_feed_watcher.wait_for_changes(HEAD, timeout=0.05)
+
+    # Nobody waiting, nothing read
+    head_reads = mock_get_changes_head.await_count
+    await asyncio.sleep(0.05)
+    assert mock_get_changes_head.await_count == head_reads
+
+
+@pytest.mark.asyncio
+async def test_stale_head_is_not_trusted(mocker, change_feed_watcher):
+    mock_get_changes_head = mocker.patch(
+        "application.lib.change_feed.UserQueryExecutor.get_changes_head",
+        return_value=HEAD,
+    )
+    # Cached before the empty read the caller just did
+    change_feed_watcher.head = (datetime(2022, 1, 1, 12, 0, 1), 3)
+
+    assert not await change_feed_watcher.wait_for_changes(HEAD, timeout=0.05)
+    assert mock_get_changes_head.await_count > 0
+
+
+@pytest.mark.asyncio
+async def test_waiters_share_reads(mocker, change_feed_watcher):
+    heads = iter([HEAD, HEAD, (datetime(2022, 1, 1, 12, 0, 1), 3)])
+    mock_get_changes_head = mocker.patch(
+        "application.lib.change_feed.UserQueryExecutor.get_changes_head",
+        side_effect=lambda *args, **kwargs: next(heads),
+    )
+    change_feed_watcher.head = HEAD
+
+    results = await asyncio.gather(
+        *[change_feed_watcher.wait_for_changes(HEAD, timeout=1) for _ in range(10)]
+    )
+
+    assert all(results)
+    assert mock_get_changes_head.await_count == 3
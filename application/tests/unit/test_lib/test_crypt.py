@@ -0,0 +1,118 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+
+from application.lib.crypt.executor import HashingExecutor
+from application.lib.crypt.pbkdf2 import CryptPbkdf2
+from application.lib.crypt.scheduler import (
+    HashingScheduler,
+    HashingOverloaded,
+    BATCH_SIGNUP_LANE,
+    LOGIN_LANE,
+    SIGNUP_LANE,
+)
+from application.lib.utils.singleton import Singleton
+
+
+@pytest_asyncio.fixture
+async def hashing_executor(executor_settings):
+    app_config = SimpleNamespace(hashing=executor_settings)
+    executor = HashingExecutor(app_config)
+    await executor.init()
+    await HashingScheduler(app_config).init()
+    yield executor
+    await executor.close()
+    Singleton._instances.pop(HashingExecutor)
+    Singleton._instances.pop(HashingScheduler)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "executor_settings",
+    [
+        {"executor": "thread", "workers": 2},
+        {"executor": "process", "workers": 1},
+    ],
+)
+async def test_async_password_roundtrip(hashing_executor):
+    hashed_password, salt = await CryptPbkdf2.encrypt_password_async("Password123")
+
+    assert CryptPbkdf2.check_password("Password123", hashed_password, salt)
+    assert await CryptPbkdf2.check_password_async("Password123", hashed_password, salt)
+    assert not await CryptPbkdf2.check_password_async(
+        "Password124", hashed_password, salt
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "executor_settings",
+    [{"executor": "thread", "workers": 1}],
+)
+async def test_scheduler_prioritizes_login_lane(hashing_executor):
+    completed = []
+    lanes = [SIGNUP_LANE, SIGNUP_LANE, SIGNUP_LANE, LOGIN_LANE, LOGIN_LANE]
+    await asyncio.gather(
+        *[HashingScheduler().run(lane, completed.append, lane) for lane in lanes]
+    )
+
+    # The first signup is dispatched straight away, queued logins overtake
+    # the remaining signups
+    assert completed == [
+        SIGNUP_LANE,
+        LOGIN_LANE,
+        LOGIN_LANE,
+        SIGNUP_LANE,
+        SIGNUP_LANE,
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "executor_settings",
+    [
+        {
+            "executor": "thread",
+            "workers": 1,
+            "expected_hash_ms": 50,
+            "lanes": {SIGNUP_LANE: {"deadline_ms": 10}},
+        }
+    ],
+)
+async def test_scheduler_rejects_when_deadline_would_be_blown(hashing_executor):
+    with pytest.raises(HashingOverloaded) as exc_info:
+        await CryptPbkdf2.encrypt_password_async("Password123", lane=SIGNUP_LANE)
+
+    assert exc_info.value.retry_after == 1
+    assert await HashingScheduler().run(LOGIN_LANE, sum, [1, 2]) == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "executor_settings",
+    [
+        {
+            "executor": "thread",
+            "workers": 1,
+            "lanes": {BATCH_SIGNUP_LANE: {"max_queue_size": 2}},
+        }
+    ],
+)
+async def test_scheduler_bounds_lane_queue(hashing_executor):
+    release = threading.Event()
+    hashes = [
+        asyncio.ensure_future(
+            HashingScheduler().run(BATCH_SIGNUP_LANE, release.wait, 5)
+        )
+        for _ in range(4)
+    ]
+    await asyncio.sleep(0.01)
+
+    # One running, two queued, the fourth one turned away
+    assert isinstance(hashes[3].exception(), HashingOverloaded)
+    assert hashes[3].exception().retry_after >= 1
+    release.set()
+    assert await asyncio.gather(*hashes[:3]) == [True, True, True]
@@ -0,0 +1,41 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from application.datastore.db.worker import DBWorker, QueryTimeout
+
+
+@pytest.fixture
+def database():
+    connection = MagicMock(
+        close=AsyncMock(), execute=AsyncMock(return_value=MagicMock())
+    )
+    connection.begin.return_value.start = AsyncMock(
+        return_value=MagicMock(commit=AsyncMock(), close=AsyncMock())
+    )
+    database = MagicMock(ensure_connected=AsyncMock())
+    database.connect.return_value.start = AsyncMock(return_value=connection)
+    yield database
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("read_only, expected_begin", [(True, False), (False, True)])
+async def test_read_only_worker_has_no_transaction(database, read_only, expected_begin):
+    async with DBWorker(database, read_only=read_only) as db_worker:
+        await db_worker.fetchone("SELECT 1")
+
+    database.connect.assert_called_once_with(read_only=read_only)
+    connection = db_worker.connection
+    assert connection.begin.called is expected_begin
+    connection.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_statement_timeout(database):
+    async with DBWorker(database, read_only=True) as db_worker:
+        db_worker.connection.execute.side_effect = OperationalError(
+            "SELECT 1", {}, Exception(3024, "maximum statement execution time exceeded")
+        )
+        with pytest.raises(QueryTimeout):
+            await db_worker.fetchall("SELECT 1")
@@ -0,0 +1,36 @@
+import asyncio
+import time
+from unittest.mock import MagicMock
+
+import pytest
+import pytest_asyncio
+
+from application.lib.loop_monitor import LoopMonitor
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.singleton import Singleton
+
+
+@pytest_asyncio.fixture
+async def loop_monitor():
+    appconfig = MagicMock(
+        loop_monitor={"enabled": True, "interval_ms": 10, "slow_callback_ms": 50}
+    )
+    loop_monitor = LoopMonitor(appconfig)
+    await loop_monitor.init()
+    yield loop_monitor
+    await loop_monitor.close()
+    Singleton._instances.pop(LoopMonitor, None)
+
+
+@pytest.mark.asyncio
+async def test_blocking_callback_is_reported(mocker, loop_monitor):
+    mock_warning = mocker.patch("application.lib.loop_monitor.logger.warning")
+    await asyncio.sleep(0.05)
+
+    time.sleep(0.2)
+    await asyncio.sleep(0.05)
+
+    assert mock_warning.call_count == 1
+    assert "test_blocking_callback_is_reported" in mock_warning.call_args.args[0]
+    lag = MetricsRegistry().histogram("loop.lag_ms").snapshot()
+    assert lag["count"] > 0 and lag["sum"] >= 150
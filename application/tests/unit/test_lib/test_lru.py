@@ -0,0 +1,27 @@
+from unittest.mock import patch
+
+from application.lib.utils.lru import TTLLRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLLRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert "b" not in cache
+    assert cache.get("c") == 3
+
+
+def test_expired_entry_is_dropped():
+    cache = TTLLRUCache(maxsize=2, ttl=10)
+    with patch("application.lib.utils.lru.time.monotonic", return_value=100):
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=30)
+
+    with patch("application.lib.utils.lru.time.monotonic", return_value=115):
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+        assert len(cache) == 1
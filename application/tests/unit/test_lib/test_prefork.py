@@ -0,0 +1,15 @@
+from application.lib.tornado.prefork import WorkerSupervisor
+
+
+def test_restart_delay_backs_off_on_crash_loops(mocker):
+    supervisor = WorkerSupervisor(workers=1, worker_main=lambda worker_id: 0)
+    mock_monotonic = mocker.patch(
+        "application.lib.tornado.prefork.time.monotonic", return_value=100.0
+    )
+
+    supervisor.started_at[0] = 99.0
+    assert [supervisor._restart_delay(0) for _ in range(6)] == [1, 3, 7, 15, 30, 30]
+
+    # A worker that stayed up long enough is restarted right away
+    mock_monotonic.return_value = 200.0
+    assert supervisor._restart_delay(0) == 0
@@ -0,0 +1,87 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from application.datastore.db.replica_pool import (
+    LATENCY_BALANCING,
+    Replica,
+    ReplicaPoolDBManager,
+)
+
+
+@pytest.fixture
+def replica_pool():
+    # Built without __init__, the Singleton metaclass would keep it around
+    replica_pool = object.__new__(ReplicaPoolDBManager)
+    replica_pool.balancing = LATENCY_BALANCING
+    replica_pool.max_failures = 2
+    replica_pool.rise_successes = 2
+    replica_pool.health_check_timeout = 1
+    replica_pool.heartbeat_interval = 0
+    replica_pool.max_lag = 0
+    replica_pool.clock_skew_margin = 0
+    replica_pool.replicas = [
+        Replica(database=MagicMock(), name=f"replica_{index}", weight=1)
+        for index in range(2)
+    ]
+    yield replica_pool
+
+
+def test_choose_replica_by_latency_and_load(replica_pool):
+    fast_replica, slow_replica = replica_pool.replicas
+    fast_replica.latency = 0.001
+    slow_replica.latency = 0.01
+
+    assert replica_pool._choose_replica() is fast_replica
+
+    fast_replica.outstanding = 20
+    assert replica_pool._choose_replica() is slow_replica
+
+
+@pytest.mark.asyncio
+async def test_replica_ejected_and_readmitted(replica_pool):
+    replica = replica_pool.replicas[0]
+    replica.database.ping = AsyncMock(side_effect=ConnectionError)
+
+    await replica_pool._probe(replica)
+    assert replica.healthy
+    await replica_pool._probe(replica)
+    assert not replica.healthy
+    assert replica_pool._choose_replica() is replica_pool.replicas[1]
+
+    replica.database.ping = AsyncMock()
+    await replica_pool._probe(replica)
+    assert not replica.healthy
+    await replica_pool._probe(replica)
+    assert replica.healthy
+
+
+def test_choose_replica_past_consistency_token(mocker, replica_pool):
+    mocker.patch("application.datastore.db.replica_pool.time.time", return_value=110)
+    replica_pool.heartbeat_interval = 1
+    replica_pool.max_lag = 30
+    lagging_replica, replica = replica_pool.replicas
+    lagging_replica.replicated_until = 100
+    replica.replicated_until = 105
+
+    assert replica_pool._choose_replica(consistency_token=103) is replica
+    assert replica_pool._choose_replica(consistency_token=106) is None
+
+    # Too far behind for any read
+    replica_pool.max_lag = 8
+    replica.outstanding = 5
+    assert replica_pool._choose_replica() is replica
+
+
+@pytest.mark.asyncio
+async def test_master_fallback(mocker, replica_pool):
+    for replica in replica_pool.replicas:
+        replica.healthy = False
+    mock_make_manager = mocker.patch(
+        "application.datastore.db.manager_factory.DBManagerFactory.make_manager"
+    )
+    mock_make_manager.return_value.acquire = AsyncMock(return_value="master_worker")
+    replica_pool.DB_NAME = "user_manager"
+
+    assert await replica_pool.acquire() == "master_worker"
+    mock_make_manager.assert_called_once_with(db_name="user_manager", db_type="master")
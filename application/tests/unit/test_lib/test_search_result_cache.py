@@ -0,0 +1,44 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import aioredis
+import pytest
+
+from application.lib.cache import SearchResultCache
+from application.lib.utils.singleton import Singleton
+
+
+@pytest.fixture
+def search_result_cache():
+    search_result_cache = SearchResultCache(
+        MagicMock(redis={"host": "localhost"}, search_cache={"enabled": True})
+    )
+    search_result_cache.client = MagicMock()
+    yield search_result_cache
+    Singleton._instances.pop(SearchResultCache, None)
+
+
+def test_serialization_roundtrip(search_result_cache):
+    result = (
+        [{"id": 1, "name": "Andrea", "last_login": None}],
+        1,
+    )
+    result[0][0]["created_at"] = datetime(2022, 1, 1, 12, 0, 0)
+
+    assert (
+        search_result_cache._deserialize(search_result_cache._serialize(result))
+        == result
+    )
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_are_misses(search_result_cache):
+    search_result_cache.client.mget = AsyncMock(
+        side_effect=aioredis.errors.ConnectionClosedError
+    )
+    search_result_cache.client.get = AsyncMock(
+        side_effect=aioredis.errors.ConnectionClosedError
+    )
+
+    assert await search_result_cache.get_generation() is None
+    assert await search_result_cache.get_result(7, "filters", ttl=60) is None
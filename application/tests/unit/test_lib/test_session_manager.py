@@ -0,0 +1,108 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from application.lib.cache import SessionCache
+from application.lib.managers.session_manager import SessionManager, SessionNotFound
+from application.lib.utils.singleton import Singleton
+
+
+@pytest.fixture
+def session_cache():
+    session_cache = SessionCache(
+        MagicMock(redis={"host": "localhost"}, sessions={"ttl": 3600})
+    )
+    session_cache.client = MagicMock()
+    session_cache.client.pipeline.return_value = MagicMock(execute=AsyncMock())
+    session_cache.client.delete = AsyncMock()
+    yield session_cache
+    Singleton._instances.pop(SessionCache, None)
+
+
+@pytest.fixture
+def mock_fire_and_forget(mocker):
+    yield mocker.patch("application.lib.managers.session_manager.fire_and_forget")
+
+
+@pytest.mark.asyncio
+async def test_create_session(session_cache):
+    token = await SessionManager.create_session(7)
+
+    token_hash = SessionManager._hash_token(token)
+    pipeline = session_cache.client.pipeline.return_value
+    # Only the digest is stored, with the ttl on the session and on its index
+    pipeline.set.assert_called_once_with(f"session:{token_hash}", 7, expire=3600)
+    pipeline.sadd.assert_called_once_with("user_sessions:7", token_hash)
+    pipeline.expire.assert_called_once_with("user_sessions:7", 3600)
+    assert token not in str(pipeline.mock_calls)
+    assert session_cache.local_cache.get(token_hash) == 7
+    assert await SessionManager.create_session(7) != token
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "stored_user_id, expected_user_id",
+    [
+        (b"7", 7),
+        (None, None),
+    ],
+)
+async def test_validate_session(
+    session_cache, mock_fire_and_forget, stored_user_id, expected_user_id
+):
+    pipeline = session_cache.client.pipeline.return_value
+    pipeline.execute.return_value = [stored_user_id, 1]
+
+    if expected_user_id is None:
+        with pytest.raises(SessionNotFound):
+            await SessionManager.validate_session("token")
+
+        mock_fire_and_forget.assert_not_called()
+        return
+
+    assert await SessionManager.validate_session("token") == expected_user_id
+
+    # Sliding expiry: the lookup pushes the session and its index back
+    token_hash = SessionManager._hash_token("token")
+    pipeline.expire.assert_called_once_with(f"session:{token_hash}", 3600)
+    mock_fire_and_forget.assert_called_once_with(
+        func=session_cache.touch_user_sessions, user_id=7
+    )
+
+    # Served locally from now on
+    assert await SessionManager.validate_session("token") == expected_user_id
+    assert pipeline.execute.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_delete_session(session_cache, mock_fire_and_forget):
+    token = await SessionManager.create_session(7)
+    token_hash = SessionManager._hash_token(token)
+    session_cache.client.pipeline.return_value.execute.return_value = [None, 1]
+
+    await SessionManager.delete_session(token)
+
+    session_cache.client.delete.assert_awaited_once_with(f"session:{token_hash}")
+    with pytest.raises(SessionNotFound):
+        await SessionManager.validate_session(token)
+
+
+@pytest.mark.asyncio
+async def test_delete_user_sessions(session_cache):
+    tokens = [await SessionManager.create_session(7) for _ in range(2)]
+    other_token = await SessionManager.create_session(8)
+    token_hashes = [SessionManager._hash_token(token) for token in tokens]
+    session_cache.client.smembers = AsyncMock(
+        return_value=[token_hash.encode() for token_hash in token_hashes]
+    )
+
+    await SessionManager.delete_user_sessions(7)
+
+    session_cache.client.smembers.assert_awaited_once_with("user_sessions:7")
+    session_cache.client.delete.assert_awaited_once_with(
+        "user_sessions:7", *[f"session:{token_hash}" for token_hash in token_hashes]
+    )
+    assert all(
+        session_cache.local_cache.get(token_hash) is None for token_hash in token_hashes
+    )
+    assert session_cache.local_cache.get(SessionManager._hash_token(other_token)) == 8
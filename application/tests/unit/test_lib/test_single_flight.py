@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from application.lib.metrics import MetricsRegistry
+from application.lib.utils.single_flight import SingleFlight
+
+
+class Query:
+    def __init__(self, result=None, exception=None):
+        self.result = result
+        self.exception = exception
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, *args):
+        self.calls += 1
+        await self.release.wait()
+        if self.exception is not None:
+            raise self.exception
+
+        return self.result
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_coalesced():
+    single_flight = SingleFlight("test.coalesced")
+    query = Query(result=[{"id": 1}])
+    callers = [asyncio.ensure_future(single_flight.run("key", query)) for _ in range(5)]
+    await asyncio.sleep(0)
+    query.release.set()
+
+    assert await asyncio.gather(*callers) == [[{"id": 1}]] * 5
+    assert query.calls == 1
+    assert len(single_flight) == 0
+    metrics = MetricsRegistry()
+    assert metrics.counter("single_flight.test.coalesced.executed").value == 1
+    assert metrics.counter("single_flight.test.coalesced.coalesced").value == 4
+
+    # Once done, the next call runs again
+    await single_flight.run("key", query)
+    assert query.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    single_flight = SingleFlight("test.keys")
+    query = Query(result=1)
+    query.release.set()
+
+    await asyncio.gather(single_flight.run("a", query), single_flight.run("b", query))
+    assert query.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_exceptions_are_shared():
+    single_flight = SingleFlight("test.exceptions")
+    query = Query(exception=RuntimeError("gone away"))
+    callers = [asyncio.ensure_future(single_flight.run("key", query)) for _ in range(3)]
+    await asyncio.sleep(0)
+    query.release.set()
+
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert query.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_fail_followers():
+    single_flight = SingleFlight("test.cancel")
+    query = Query(result=1)
+    leader = asyncio.ensure_future(single_flight.run("key", query))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(single_flight.run("key", query))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    query.release.set()
+
+    assert await follower == 1
+    assert query.calls == 1
@@ -0,0 +1,68 @@
+import asyncio
+import signal
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+import entrypoint
+from application import load_configurations
+from application.lib.change_feed import ChangeFeedWatcher
+from application.lib.export import UserExportSlots
+from application.lib.loop_monitor import LoopMonitor
+from application.lib.utils.config import ApplicationConfig, DatabaseConfig
+from application.lib.utils.singleton import Singleton
+from application.lib.write_behind import LastLoginWriteBehind
+
+
+SINGLETONS = (
+    ApplicationConfig,
+    DatabaseConfig,
+    LoopMonitor,
+    LastLoginWriteBehind,
+    UserExportSlots,
+    ChangeFeedWatcher,
+)
+
+
+@pytest.fixture
+def startup(mocker):
+    # Everything talking to MySQL, Redis or the network
+    for name in ("init_db", "init_cache", "init_user_existence", "init_hashing"):
+        mocker.patch(f"application.{name}", AsyncMock())
+    mocker.patch("application.init_log")
+    mocker.patch("application.init_background_tasks")
+    for singleton in (LoopMonitor, LastLoginWriteBehind, ChangeFeedWatcher):
+        mocker.patch.object(singleton, "init", AsyncMock())
+    mocker.patch.object(entrypoint, "AsyncIOMainLoop")
+    mocker.patch.object(entrypoint, "bind_sockets")
+    mocker.patch.object(entrypoint, "drain_server", AsyncMock())
+    mock_shutdown_application = mocker.patch.object(
+        entrypoint, "shutdown_application", AsyncMock()
+    )
+
+    def make_server(app):
+        # Stops run_forever as soon as it starts
+        asyncio.get_event_loop().call_soon(asyncio.get_event_loop().stop)
+        return MagicMock()
+
+    mocker.patch.object(entrypoint, "HTTPServer", side_effect=make_server)
+    yield mock_shutdown_application
+    for singleton in SINGLETONS:
+        Singleton._instances.pop(singleton, None)
+
+
+def test_worker_startup(startup):
+    app_config, db_config = load_configurations()
+
+    # What the supervisor runs in every forked worker
+    try:
+        assert entrypoint.run_worker(0, app_config, db_config) == 0
+    finally:
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+        loop.close()
+        asyncio.set_event_loop(None)
+
+    assert LoopMonitor().settings is app_config.loop_monitor
+    startup.assert_awaited_once()
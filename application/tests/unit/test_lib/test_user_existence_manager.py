@@ -0,0 +1,149 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from application.datastore.db.connection_constants import MASTER_TYPE
+from application.lib.cache import UserExistenceCache
+from application.lib.managers.user_existence_manager import UserExistenceManager
+from application.lib.utils.singleton import Singleton
+
+
+@pytest.fixture
+def mock_db_manager_factory(mocker):
+    db_manager = MagicMock()
+    db_manager.acquire = AsyncMock(return_value=AsyncMock())
+    mock = mocker.patch.object(UserExistenceManager, "_db_manager_factory")
+    mock.make_manager.return_value = db_manager
+    yield mock
+
+
+@pytest.fixture
+def mock_user_existence_cache(mocker):
+    cache = MagicMock(remove_users_existence=AsyncMock())
+    mocker.patch(
+        "application.lib.managers.user_existence_manager.UserExistenceCache",
+        return_value=cache,
+    )
+    yield cache
+
+
+@pytest.mark.asyncio
+async def test_remove_stale_keys(
+    mocker, mock_db_manager_factory, mock_user_existence_cache
+):
+    mocker.patch(
+        "application.lib.managers.user_existence_manager.UserQueryExecutor"
+        ".get_existing_emails",
+        return_value=["Andrea@test.com"],
+    )
+
+    removed_keys_num = await UserExistenceManager._remove_stale_keys(
+        ["andrea@test.com", "gone@test.com"]
+    )
+
+    assert removed_keys_num == 1
+    # Deletions are confirmed against the master
+    assert (
+        mock_db_manager_factory.make_manager.call_args.kwargs["db_type"] == MASTER_TYPE
+    )
+    mock_db_manager_factory.make_manager.return_value.acquire.assert_awaited_once_with(
+        read_only=True
+    )
+    mock_user_existence_cache.remove_users_existence.assert_awaited_once_with(
+        ["gone@test.com"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_stream_users_emails(mocker, mock_db_manager_factory):
+    mock_get_users_emails = mocker.patch(
+        "application.lib.managers.user_existence_manager.UserQueryExecutor"
+        ".get_users_emails",
+        side_effect=[[(1, "a@test.com"), (2, "b@test.com")], [(5, "c@test.com")]],
+    )
+
+    batches = [
+        batch async for batch in UserExistenceManager.stream_users_emails(batch_size=2)
+    ]
+
+    assert batches == [[(1, "a@test.com"), (2, "b@test.com")], [(5, "c@test.com")]]
+    assert [call.kwargs["after_id"] for call in mock_get_users_emails.call_args_list] == [0, 2]
+
+
+@pytest.mark.asyncio
+async def test_warmup_waits_for_other_process(mocker, mock_user_existence_cache):
+    mock_user_existence_cache.user_existence_settings = {}
+    mock_user_existence_cache.is_warm = AsyncMock(side_effect=[False, True])
+    mock_user_existence_cache.acquire_lock = AsyncMock(return_value=False)
+    mocker.patch.object(UserExistenceManager, "WARMUP_POLL_INTERVAL", 0)
+    mock_load_users_emails = mocker.patch.object(
+        UserExistenceManager, "_load_users_emails"
+    )
+
+    await UserExistenceManager.warmup()
+
+    mock_load_users_emails.assert_not_called()
+    assert mock_user_existence_cache.is_warm.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_reload_bloom_filter(mocker):
+    user_existence_cache = UserExistenceCache(
+        MagicMock(
+            redis={"host": "localhost"},
+            user_existence={"bloom_filter": {"enabled": True, "capacity": 100}},
+        )
+    )
+
+    async def iterate_keys():
+        yield "andrea@test.com"
+        # Signup stored while the scan is running
+        user_existence_cache._add_to_bloom_filter("bianca@test.com")
+        yield "carla@test.com"
+
+    mocker.patch.object(user_existence_cache, "iterate_keys", iterate_keys)
+    mocker.patch.object(user_existence_cache, "_count_keys", AsyncMock(return_value=3))
+    try:
+        await UserExistenceManager.reload_bloom_filter()
+        first_bloom_filter = user_existence_cache.bloom_filter
+        await UserExistenceManager.reload_bloom_filter()
+    finally:
+        Singleton._instances.pop(UserExistenceCache, None)
+
+    # Rebuilt, not reused
+    assert user_existence_cache.bloom_filter is not first_bloom_filter
+    assert all(
+        email in user_existence_cache.bloom_filter
+        for email in ("andrea@test.com", "bianca@test.com", "carla@test.com")
+    )
+    assert user_existence_cache._bloom_filter_backlog is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "keys_num, expected_capacity",
+    [
+        (None, 100),
+        (10, 100),
+        (1000, 1500),
+    ],
+)
+async def test_bloom_filter_capacity(mocker, keys_num, expected_capacity):
+    user_existence_cache = UserExistenceCache(
+        MagicMock(
+            redis={"host": "localhost"},
+            user_existence={"bloom_filter": {"enabled": True, "capacity": 100}},
+        )
+    )
+    mocker.patch.object(
+        user_existence_cache, "_count_keys", AsyncMock(return_value=keys_num)
+    )
+    mock_load_bloom_filter = mocker.patch.object(
+        user_existence_cache, "_load_bloom_filter"
+    )
+    try:
+        await user_existence_cache.init_bloom_filter()
+    finally:
+        Singleton._instances.pop(UserExistenceCache, None)
+
+    assert mock_load_bloom_filter.await_args.kwargs["capacity"] == expected_capacity
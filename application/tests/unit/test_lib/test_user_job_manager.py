@@ -0,0 +1,169 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from application.lib.managers.user_job_manager import UserJobManager
+
+
+@pytest.fixture
+def mock_db_manager_factory(mocker):
+    db_manager = MagicMock()
+    db_manager.acquire = AsyncMock(return_value=AsyncMock())
+    db_manager.replication_lag.return_value = None
+    mock = mocker.patch.object(UserJobManager, "_db_manager_factory")
+    mock.make_manager.return_value = db_manager
+    yield mock
+
+
+@pytest.fixture
+def mock_user_job_cache(mocker):
+    user_job_cache = MagicMock(chunk_pause=0, max_replica_lag=5)
+    user_job_cache.store_job = AsyncMock()
+    mocker.patch(
+        "application.lib.managers.user_job_manager.UserJobCache",
+        return_value=user_job_cache,
+    )
+    yield user_job_cache
+
+
+def make_job():
+    return {
+        "id": "a" * 32,
+        "state": "running",
+        "new_status": "DISABLED",
+        "processed": 0,
+        "updated": 0,
+        "last_id": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_run_status_change(mocker, mock_db_manager_factory, mock_user_job_cache):
+    mock_get_users_chunk = mocker.patch(
+        "application.lib.managers.user_job_manager.UserQueryExecutor.get_users_chunk",
+        side_effect=[
+            [(1, "andrea@test.com"), (4, "bianca@test.com")],
+            [(9, "carla@test.com")],
+            [],
+        ],
+    )
+    mock_change_chunk_status = mocker.patch.object(
+        UserJobManager, "_change_chunk_status", side_effect=[2, 0]
+    )
+    job = make_job()
+
+    await UserJobManager._run_status_change(job, {"status": "ACTIVE"}, chunk_size=2)
+
+    # Keyset walk: every chunk starts after the last id of the previous one
+    assert [
+        call.kwargs["after_id"] for call in mock_get_users_chunk.await_args_list
+    ] == [0, 4, 9]
+    assert mock_change_chunk_status.await_count == 2
+    # The UPDATE checks the filters again
+    assert all(
+        call.args[2] == {"status": "ACTIVE"}
+        for call in mock_change_chunk_status.await_args_list
+    )
+    assert job["state"] == "done"
+    assert (job["processed"], job["updated"], job["last_id"]) == (3, 2, 9)
+    # Progress after each chunk, then the final state
+    assert mock_user_job_cache.store_job.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_run_status_change_failure(
+    mocker, mock_db_manager_factory, mock_user_job_cache
+):
+    mocker.patch(
+        "application.lib.managers.user_job_manager.UserQueryExecutor.get_users_chunk",
+        side_effect=[[(1, "andrea@test.com")], RuntimeError("gone away")],
+    )
+    mocker.patch.object(UserJobManager, "_change_chunk_status", return_value=1)
+    job = make_job()
+
+    await UserJobManager._run_status_change(job, {"status": "ACTIVE"}, chunk_size=1)
+
+    assert job["state"] == "failed"
+    assert job["error"] == "gone away"
+    assert job["last_id"] == 1
+    assert job["finished_at"] is not None
+
+
+@pytest.mark.asyncio
+async def test_change_chunk_status(mocker, mock_db_manager_factory):
+    session_cache = MagicMock(fence_users_credentials=AsyncMock())
+    mocker.patch(
+        "application.lib.managers.user_job_manager.SessionCache",
+        return_value=session_cache,
+    )
+    user_record_cache = MagicMock(invalidate_users=AsyncMock())
+    mocker.patch(
+        "application.lib.managers.user_job_manager.UserRecordCache",
+        return_value=user_record_cache,
+    )
+    mock_invalidate_searches = mocker.patch(
+        "application.lib.managers.user_job_manager.UserManager.invalidate_searches"
+    )
+    mock_delete_user_sessions = mocker.patch(
+        "application.lib.managers.user_job_manager.SessionManager.delete_user_sessions"
+    )
+    mock_set_users_status = mocker.patch(
+        "application.lib.managers.user_job_manager.UserQueryExecutor.set_users_status",
+        return_value=1,
+    )
+    db_worker = (
+        mock_db_manager_factory.make_manager.return_value.acquire.return_value.__aenter__.return_value
+    )
+
+    updated = await UserJobManager._change_chunk_status(
+        [(1, "andrea@test.com"), (4, "bianca@test.com")],
+        "DISABLED",
+        {"status": "ACTIVE"},
+    )
+
+    assert updated == 1
+    mock_set_users_status.assert_awaited_once_with(
+        db_worker, [1, 4], "DISABLED", {"status": "ACTIVE"}
+    )
+    session_cache.fence_users_credentials.assert_awaited_once_with(
+        ["andrea@test.com", "bianca@test.com"]
+    )
+    user_record_cache.invalidate_users.assert_awaited_once_with([1, 4])
+    mock_invalidate_searches.assert_awaited_once()
+    assert mock_delete_user_sessions.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_close_interrupts_running_jobs(
+    mocker, mock_db_manager_factory, mock_user_job_cache
+):
+    chunk_started = asyncio.Event()
+
+    async def change_chunk_status(user_rows, new_status, filters):
+        chunk_started.set()
+        # Still on the first chunk at shutdown
+        await asyncio.sleep(60)
+
+    mocker.patch(
+        "application.lib.managers.user_job_manager.UserQueryExecutor.get_users_chunk",
+        return_value=[(1, "andrea@test.com")],
+    )
+    mocker.patch.object(
+        UserJobManager, "_change_chunk_status", side_effect=change_chunk_status
+    )
+
+    job = await UserJobManager.start_status_change(
+        {"status": "ACTIVE"}, "DISABLED", chunk_size=1
+    )
+    await asyncio.wait_for(chunk_started.wait(), 5)
+    assert len(UserJobManager._tasks) == 1
+
+    await UserJobManager.close()
+
+    assert not UserJobManager._tasks
+    stored_job = mock_user_job_cache.store_job.await_args.args[0]
+    assert stored_job["id"] == job["id"]
+    assert stored_job["state"] == "interrupted"
+    assert stored_job["error"] == "Interrupted by shutdown"
+    assert stored_job["finished_at"] is not None
@@ -0,0 +1,478 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from application.datastore.db.connection_constants import READ_ONLY_TYPE
+from application.lib.managers.user_manager import UserManager
+from application.lib.utils.lru import TTLLRUCache
+from application.lib.validation.schemas.user import SearchUserSchema
+
+
+@pytest.fixture
+def mock_db_manager_factory(mocker):
+    db_manager = MagicMock()
+    db_manager.acquire = AsyncMock(return_value=AsyncMock())
+    mock = mocker.patch.object(UserManager, "_db_manager_factory")
+    mock.make_manager.return_value = db_manager
+    yield mock
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "cached, db_precheck, in_db, expected_taken, expected_db_calls, expected_cached",
+    [
+        (True, True, True, True, 0, False),
+        (False, False, True, False, 0, False),
+        (False, True, True, True, 1, True),
+        (False, True, False, False, 1, False),
+    ],
+)
+async def test_is_user_taken(
+    mocker,
+    mock_db_manager_factory,
+    cached,
+    db_precheck,
+    in_db,
+    expected_taken,
+    expected_db_calls,
+    expected_cached,
+):
+    mocker.patch(
+        "application.lib.managers.user_manager.UserExistenceCache",
+        return_value=MagicMock(
+            user_exists=AsyncMock(return_value=cached), db_precheck=db_precheck
+        ),
+    )
+    mock_email_exists = mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.email_exists",
+        return_value=in_db,
+    )
+    mock_cache_user_existence = mocker.patch.object(
+        UserManager, "_cache_user_existence"
+    )
+
+    assert await UserManager._is_user_taken("andrea@test.com") is expected_taken
+    assert mock_email_exists.await_count == expected_db_calls
+    assert mock_cache_user_existence.called is expected_cached
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "user_data, fence_error, expected_previous_email, expected_fenced, expected_result",
+    [
+        ({"id": 1, "name": "Andrea"}, None, None, False, True),
+        ({"id": 1, "email": "new@test.com"}, None, "andrea@test.com", True, True),
+        # Redis down: the write goes on, fencing is retried after the commit
+        (
+            {"id": 1, "email": "new@test.com"},
+            ConnectionError(),
+            "andrea@test.com",
+            True,
+            False,
+        ),
+    ],
+)
+async def test_update_user_row(
+    mocker,
+    user_data,
+    fence_error,
+    expected_previous_email,
+    expected_fenced,
+    expected_result,
+):
+    mock_session_cache = MagicMock(fence_credentials=AsyncMock(side_effect=fence_error))
+    mocker.patch(
+        "application.lib.managers.user_manager.SessionCache",
+        return_value=mock_session_cache,
+    )
+    mock_get_user_email = mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.get_user_email",
+        return_value="andrea@test.com",
+    )
+    mock_update_user = mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.update_user"
+    )
+
+    previous_email, fenced = await UserManager._update_user_row(MagicMock(), user_data)
+
+    assert previous_email == expected_previous_email
+    assert fenced is expected_result
+    assert mock_get_user_email.called is expected_fenced
+    assert mock_session_cache.fence_credentials.called is expected_fenced
+    mock_update_user.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_update_user_invalidates_cached_record(mocker, mock_db_manager_factory):
+    user_record_cache = MagicMock(invalidate_users=AsyncMock())
+    mocker.patch(
+        "application.lib.managers.user_manager.UserRecordCache",
+        return_value=user_record_cache,
+    )
+    mocker.patch.object(
+        UserManager, "_update_user_row", AsyncMock(return_value=(None, True))
+    )
+    mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.search_users",
+        return_value=[{"id": 1, "name": "Andrea"}],
+    )
+    mocker.patch.object(UserManager, "invalidate_searches")
+
+    user = await UserManager.update_user({"id": 1, "name": "Andrea"})
+
+    assert user == {"id": 1, "name": "Andrea"}
+    # The row read back is never published, it may already be outdated
+    user_record_cache.invalidate_users.assert_awaited_once_with([1])
+    user_record_cache.fill_users.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "revocation_error, expected_retried",
+    [
+        (None, False),
+        (ConnectionError(), True),
+    ],
+)
+async def test_delete_user_revokes_sessions(
+    mocker, mock_db_manager_factory, revocation_error, expected_retried
+):
+    mocker.patch(
+        "application.lib.managers.user_manager.UserRecordCache",
+        return_value=MagicMock(invalidate_users=AsyncMock()),
+    )
+    mocker.patch.object(
+        UserManager, "_update_user_row", AsyncMock(return_value=("a@b.c", True))
+    )
+    mocker.patch.object(UserManager, "invalidate_searches")
+    mock_delete_user_sessions = mocker.patch(
+        "application.lib.managers.user_manager.SessionManager.delete_user_sessions",
+        side_effect=revocation_error,
+    )
+    mock_fire_and_forget = mocker.patch(
+        "application.lib.managers.user_manager.fire_and_forget"
+    )
+
+    # Committed already, a Redis failure doesn't fail the request
+    await UserManager.delete_user(1)
+
+    mock_delete_user_sessions.assert_awaited_once_with(1)
+    assert mock_fire_and_forget.called is expected_retried
+    if expected_retried:
+        mock_fire_and_forget.assert_called_once_with(
+            func=UserManager._retry_revoke_sessions, user_id=1
+        )
+
+
+@pytest.mark.asyncio
+async def test_update_user_fences_after_commit(mocker, mock_db_manager_factory):
+    mocker.patch(
+        "application.lib.managers.user_manager.UserRecordCache",
+        return_value=MagicMock(invalidate_users=AsyncMock()),
+    )
+    mocker.patch.object(
+        UserManager,
+        "_update_user_row",
+        AsyncMock(return_value=("andrea@test.com", False)),
+    )
+    mocker.patch.object(UserManager, "invalidate_searches")
+    mocker.patch.object(UserManager, "_cache_user_existence")
+    mocker.patch("application.lib.managers.user_manager.UserExistenceCache")
+    mock_fire_and_forget = mocker.patch(
+        "application.lib.managers.user_manager.fire_and_forget"
+    )
+
+    await UserManager.update_user({"id": 1, "email": "new@test.com"}, return_user=False)
+
+    mock_fire_and_forget.assert_any_call(
+        func=UserManager._fence_credentials, email="andrea@test.com"
+    )
+
+
+@pytest.mark.asyncio
+async def test_insert_users(mocker, mock_db_manager_factory):
+    users_data = [
+        {"name": "Andrea", "email": "andrea@test.com", "password": "pwd"},
+        {"name": "Taken", "email": "taken@test.com", "password": "pwd"},
+        {"name": "Andrea", "email": "ANDREA@test.com", "password": "pwd"},
+        {"name": "Racing", "email": "racing@test.com", "password": "pwd"},
+    ]
+    mocker.patch.object(
+        UserManager, "_get_taken_emails", AsyncMock(return_value={"taken@test.com"})
+    )
+    mocker.patch(
+        "application.lib.managers.user_manager.CryptPbkdf2.encrypt_password_async",
+        side_effect=[(b"hash", b"salt_0"), (b"hash", b"salt_3")],
+    )
+    mock_insert_users = mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.insert_users",
+    )
+    # racing@test.com was created meanwhile by another signup
+    mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.get_users_salts",
+        return_value=[(1, "andrea@test.com", b"salt_0"), (2, "racing@test.com", b"x")],
+    )
+    mocker.patch.object(UserManager, "_cache_users_existence")
+    mocker.patch.object(UserManager, "invalidate_searches")
+
+    results = await UserManager.insert_users(users_data)
+
+    assert [result["status"] for result in results] == [
+        "created",
+        "already_taken",
+        "already_taken",
+        "already_taken",
+    ]
+    assert results[0]["id"] == 1
+    assert [row["email"] for row in mock_insert_users.await_args.args[1]] == [
+        "andrea@test.com",
+        "racing@test.com",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_insert_users_cancels_hashing_on_failure(mocker):
+    users_data = [
+        {"name": "Andrea", "email": f"andrea{index}@test.com", "password": "pwd"}
+        for index in range(3)
+    ]
+    mocker.patch.object(UserManager, "_get_taken_emails", AsyncMock(return_value=set()))
+    pending_hash = asyncio.Event()
+    cancelled = []
+
+    async def encrypt_password_async(cleartext_password, lane):
+        if not cancelled:
+            cancelled.append(False)
+            raise RuntimeError("broken pool")
+        try:
+            await pending_hash.wait()
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    mocker.patch(
+        "application.lib.managers.user_manager.CryptPbkdf2.encrypt_password_async",
+        side_effect=encrypt_password_async,
+    )
+
+    with pytest.raises(RuntimeError):
+        await UserManager.insert_users(users_data)
+    await asyncio.sleep(0)
+
+    assert cancelled == [False, True, True]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "consistency_token, generation, cached_result, expected_query_token, expected_stored",
+    [
+        # Miss: replica read, then stored
+        (None, (7, 1640000000.0), None, None, True),
+        # Right after a write the replica may be behind, not stored
+        (None, (7, 1650000000.0), None, None, False),
+        # Hit
+        (None, (7, 1650000000.0), ([], 0), None, False),
+        # Consistency tokens bypass the cache
+        (1650000001.0, (7, 1650000000.0), ([], 0), 1650000001.0, False),
+        # Redis unavailable: plain query, nothing stored
+        (None, None, None, None, False),
+    ],
+)
+async def test_search_users_cache(
+    mocker,
+    consistency_token,
+    generation,
+    cached_result,
+    expected_query_token,
+    expected_stored,
+):
+    mocker.patch(
+        "application.lib.managers.user_manager.time.time", return_value=1650000001.0
+    )
+    search_result_cache = MagicMock(enabled=True, write_settle_time=2)
+    search_result_cache.get_ttl.return_value = 60
+    search_result_cache.get_generation = AsyncMock(return_value=generation)
+    search_result_cache.get_result = AsyncMock(return_value=cached_result)
+    mocker.patch(
+        "application.lib.managers.user_manager.SearchResultCache",
+        return_value=search_result_cache,
+    )
+    mock_query_users = mocker.patch.object(
+        UserManager, "_query_users", AsyncMock(return_value=([{"id": 1}], 1))
+    )
+    mock_fire_and_forget = mocker.patch(
+        "application.lib.managers.user_manager.fire_and_forget"
+    )
+
+    result = await UserManager.search_users(
+        {"status": "ACTIVE", "limit": 10}, consistency_token=consistency_token
+    )
+
+    if cached_result is not None and consistency_token is None:
+        mock_query_users.assert_not_awaited()
+        assert result == cached_result
+    else:
+        mock_query_users.assert_awaited_once_with(
+            {"status": "ACTIVE", "limit": 10}, consistency_token=expected_query_token
+        )
+        assert result == ([{"id": 1}], 1)
+
+    assert mock_fire_and_forget.called is expected_stored
+    if expected_stored:
+        assert mock_fire_and_forget.call_args.kwargs["generation"] == 7
+
+
+@pytest.fixture
+def mock_search_count_cache(mocker):
+    search_count_cache = MagicMock(cache=TTLLRUCache(maxsize=16, ttl=5))
+    mocker.patch(
+        "application.lib.managers.user_manager.SearchCountCache",
+        return_value=search_count_cache,
+    )
+    yield search_count_cache
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "count_mode, plan, expected_users_num, expected_count_calls",
+    [
+        ("exact", None, 42, 1),
+        # EXPLAIN rows scaled by the filtered percentage
+        ("estimate", {"rows": 200, "filtered": 50.0}, 100, 0),
+        ("estimate", {"rows": 200, "filtered": None}, 200, 0),
+        ("estimate", {"rows": None, "filtered": None}, 0, 0),
+        ("none", None, None, 0),
+    ],
+)
+async def test_count_users(
+    mocker,
+    mock_search_count_cache,
+    count_mode,
+    plan,
+    expected_users_num,
+    expected_count_calls,
+):
+    db_worker = MagicMock()
+    db_worker.fetchone = AsyncMock(return_value=MagicMock(_mapping=plan))
+    mock_count_users = mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.count_users",
+        return_value=42,
+    )
+
+    users_num = await UserManager._count_users(
+        db_worker, filters={"status": "ACTIVE", "count_mode": count_mode}
+    )
+
+    assert users_num == expected_users_num
+    assert mock_count_users.await_count == expected_count_calls
+    if count_mode == "estimate":
+        assert db_worker.fetchone.await_args.args[0].text.strip().startswith("EXPLAIN")
+    else:
+        db_worker.fetchone.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "other_filters, expected_count_calls",
+    [
+        # Pagination, sorting and count mode don't change the matching users
+        (
+            {
+                "status": "ACTIVE",
+                "limit": 50,
+                "offset": 100,
+                "sort_by": [{"column": "name", "order": "ASC"}],
+                "count_mode": "exact",
+            },
+            1,
+        ),
+        ({"status": "ACTIVE", "after": [10]}, 1),
+        ({"status": "DISABLED", "limit": 10, "offset": 0}, 2),
+    ],
+)
+async def test_count_users_cache_key(
+    mocker, mock_search_count_cache, other_filters, expected_count_calls
+):
+    mock_count_users = mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.count_users",
+        return_value=42,
+    )
+
+    await UserManager._count_users(
+        MagicMock(), filters={"status": "ACTIVE", "limit": 10, "offset": 0}
+    )
+    await UserManager._count_users(MagicMock(), filters=other_filters)
+
+    assert mock_count_users.await_count == expected_count_calls
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "request_update, expected_name_clause",
+    [
+        ({}, "name LIKE :name"),
+        (
+            {"name_match": "fulltext"},
+            "MATCH(name) AGAINST(:name_phrase IN BOOLEAN MODE)",
+        ),
+    ],
+)
+async def test_search_users_by_name(
+    mocker,
+    mock_db_manager_factory,
+    mock_search_count_cache,
+    request_update,
+    expected_name_clause,
+):
+    db_worker = MagicMock(
+        fetchone=AsyncMock(return_value=(1,)),
+        fetchall=AsyncMock(return_value=[(1, "Andrea", "a@b.c", "ACTIVE", None)]),
+    )
+    acquired = mock_db_manager_factory.make_manager.return_value.acquire.return_value
+    acquired.__aenter__.return_value = db_worker
+    mocker.patch(
+        "application.lib.managers.user_manager.SearchResultCache",
+        return_value=MagicMock(enabled=False),
+    )
+    filters = SearchUserSchema().load({"name": "Andrea", **request_update})
+
+    users, users_num = await UserManager.search_users(filters)
+
+    assert users_num == 1
+    assert users[0]["name"] == "Andrea"
+    count_query = " ".join(str(db_worker.fetchone.await_args.args[0]).split())
+    search_query = " ".join(str(db_worker.fetchall.await_args.args[0]).split())
+    assert f"WHERE {expected_name_clause}" in count_query
+    assert f"WHERE {expected_name_clause}" in search_query
+
+
+@pytest.mark.asyncio
+async def test_suggest_users(mocker, mock_db_manager_factory):
+    suggestion_cache = MagicMock(cache=TTLLRUCache(maxsize=16, ttl=5))
+    mocker.patch(
+        "application.lib.managers.user_manager.SuggestionCache",
+        return_value=suggestion_cache,
+    )
+    suggestions = [{"id": 1, "name": "Andrea", "email": "andrea@test.com"}]
+    mock_suggest_users = mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.suggest_users",
+        return_value=suggestions,
+    )
+    db_worker = (
+        mock_db_manager_factory.make_manager.return_value.acquire.return_value.__aenter__.return_value
+    )
+
+    assert await UserManager.suggest_users("Andr", limit=5) == suggestions
+    # Same prefix in any case, served from memory
+    assert await UserManager.suggest_users("andr", limit=5) == suggestions
+    mock_suggest_users.assert_awaited_once_with(db_worker, prefix="Andr", limit=5)
+    assert (
+        mock_db_manager_factory.make_manager.call_args.kwargs["db_type"]
+        == READ_ONLY_TYPE
+    )
+
+    # A different limit is a different result
+    await UserManager.suggest_users("andr", limit=10)
+    assert mock_suggest_users.await_count == 2
+    assert mock_suggest_users.await_args.kwargs["limit"] == 10
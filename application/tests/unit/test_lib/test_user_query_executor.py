@@ -0,0 +1,201 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from application.datastore.query_executors.user import UserQueryExecutor
+from application.lib.validation.schemas.user import SearchUserSchema
+
+
+COLUMNS = "id,name,email,status,last_login,created_at,last_modified"
+
+
+def normalize(query) -> str:
+    return " ".join(str(query).split())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "request_data, expected_query, expected_parameters",
+    [
+        (
+            {"name": "Andrea", "limit": 5},
+            f"SELECT {COLUMNS} FROM users WHERE name LIKE :name "
+            "ORDER BY id DESC LIMIT :limit OFFSET :offset;",
+            {"name": "%Andrea%", "limit": 5, "offset": 0},
+        ),
+        (
+            {"name": "Andrea Av", "name_match": "fulltext", "limit": 5},
+            f"SELECT {COLUMNS} FROM users "
+            "WHERE MATCH(name) AGAINST(:name_phrase IN BOOLEAN MODE) "
+            "ORDER BY MATCH(name) AGAINST(:name_phrase IN BOOLEAN MODE) DESC, "
+            "id DESC LIMIT :limit OFFSET :offset;",
+            {"name_phrase": '"Andrea Av"', "limit": 5, "offset": 0},
+        ),
+        (
+            {"name": "a b", "name_match": "fulltext", "status": "ACTIVE", "limit": 5},
+            f"SELECT {COLUMNS} FROM users WHERE name LIKE :name "
+            "AND status = :status ORDER BY id DESC LIMIT :limit OFFSET :offset;",
+            {"name": "%a b%", "status": "ACTIVE", "limit": 5, "offset": 0},
+        ),
+    ],
+)
+async def test_search_users_query(request_data, expected_query, expected_parameters):
+    db_worker = MagicMock(fetchall=AsyncMock(return_value=[]))
+
+    users = await UserQueryExecutor.search_users(
+        db_worker, filters=SearchUserSchema().load(request_data)
+    )
+
+    assert users is None
+    query, parameters = db_worker.fetchall.await_args.args
+    assert normalize(query) == expected_query
+    assert parameters == expected_parameters
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "filters, expected_query, expected_parameters",
+    [
+        (
+            {},
+            "UPDATE users SET status = :new_status "
+            "WHERE id IN :chunk_user_ids AND status != :new_status",
+            {"new_status": "DISABLED", "chunk_user_ids": (1, 4)},
+        ),
+        (
+            # Users changed since the chunk read may not match anymore
+            {"name": "Andrea", "status": "ACTIVE", "name_match": "like"},
+            "UPDATE users SET status = :new_status "
+            "WHERE name LIKE :name AND status = :status "
+            "AND id IN :chunk_user_ids AND status != :new_status",
+            {
+                "name": "%Andrea%",
+                "status": "ACTIVE",
+                "new_status": "DISABLED",
+                "chunk_user_ids": (1, 4),
+            },
+        ),
+        (
+            # The job filter on ids doesn't clash with the chunk ids
+            {"user_ids": [1, 4, 9]},
+            "UPDATE users SET status = :new_status "
+            "WHERE id IN :user_ids "
+            "AND id IN :chunk_user_ids AND status != :new_status",
+            {
+                "user_ids": (1, 4, 9),
+                "new_status": "DISABLED",
+                "chunk_user_ids": (1, 4),
+            },
+        ),
+    ],
+)
+async def test_set_users_status_query(filters, expected_query, expected_parameters):
+    db_worker = MagicMock(execute_rowcount=AsyncMock(return_value=2))
+
+    updated = await UserQueryExecutor.set_users_status(
+        db_worker, [1, 4], "DISABLED", filters
+    )
+
+    assert updated == 2
+    query, parameters = db_worker.execute_rowcount.await_args.args
+    assert normalize(query) == expected_query
+    assert parameters == expected_parameters
+
+
+@pytest.mark.asyncio
+async def test_get_users_chunk_query():
+    db_worker = MagicMock(fetchall=AsyncMock(return_value=[(5, "andrea@test.com")]))
+
+    user_rows = await UserQueryExecutor.get_users_chunk(
+        db_worker,
+        filters={"status": "ACTIVE", "name_match": "like"},
+        after_id=4,
+        limit=100,
+        excluded_status="DISABLED",
+    )
+
+    assert user_rows == [(5, "andrea@test.com")]
+    query, parameters = db_worker.fetchall.await_args.args
+    assert normalize(query) == (
+        "SELECT id, email FROM users WHERE status = :status "
+        "AND id > :after_id AND status != :excluded_status "
+        "ORDER BY id LIMIT :chunk_limit"
+    )
+    assert parameters == {
+        "status": "ACTIVE",
+        "after_id": 4,
+        "excluded_status": "DISABLED",
+        "chunk_limit": 100,
+    }
+
+
+@pytest.mark.asyncio
+async def test_suggest_users_query():
+    db_worker = MagicMock(fetchall=AsyncMock(return_value=[]))
+
+    await UserQueryExecutor.suggest_users(db_worker, prefix="an_dr%", limit=5)
+
+    query, parameters = db_worker.fetchall.await_args.args
+    # One index range scan per column, each capped at the limit
+    assert normalize(query) == (
+        "( SELECT 0 AS source, email AS matched, id, name, email FROM users "
+        "WHERE email LIKE :prefix ORDER BY email LIMIT :limit ) "
+        "UNION ALL "
+        "( SELECT 1 AS source, name AS matched, id, name, email FROM users "
+        "WHERE name LIKE :prefix ORDER BY name LIMIT :limit ) "
+        "ORDER BY source, matched;"
+    )
+    # LIKE wildcards typed by the user match literally
+    assert parameters == {"prefix": "an\\_dr\\%%", "limit": 5}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "rows, limit, expected_suggestions",
+    [
+        (
+            # Email matches come first
+            [
+                (0, "andrea@test.com", 1, "Andrea", "andrea@test.com"),
+                (1, "Andreina", 2, "Andreina", "ina@test.com"),
+            ],
+            5,
+            [
+                {"id": 1, "name": "Andrea", "email": "andrea@test.com"},
+                {"id": 2, "name": "Andreina", "email": "ina@test.com"},
+            ],
+        ),
+        (
+            # Users matching on both branches are suggested once
+            [
+                (0, "andrea@test.com", 1, "Andrea", "andrea@test.com"),
+                (1, "Andrea", 1, "Andrea", "andrea@test.com"),
+            ],
+            5,
+            [{"id": 1, "name": "Andrea", "email": "andrea@test.com"}],
+        ),
+        (
+            # Up to limit from each branch, limit overall
+            [
+                (0, "andrea@test.com", 1, "Andrea", "andrea@test.com"),
+                (0, "andrew@test.com", 3, "Drew", "andrew@test.com"),
+                (1, "Andreina", 2, "Andreina", "ina@test.com"),
+                (1, "Andrew", 4, "Andrew", "awk@test.com"),
+            ],
+            2,
+            [
+                {"id": 1, "name": "Andrea", "email": "andrea@test.com"},
+                {"id": 3, "name": "Drew", "email": "andrew@test.com"},
+            ],
+        ),
+    ],
+)
+async def test_suggest_users(rows, limit, expected_suggestions):
+    db_worker = MagicMock(fetchall=AsyncMock(return_value=rows))
+
+    suggestions = await UserQueryExecutor.suggest_users(
+        db_worker, prefix="andr", limit=limit
+    )
+
+    assert suggestions == expected_suggestions
+    assert db_worker.fetchall.await_args.args[1]["limit"] == limit
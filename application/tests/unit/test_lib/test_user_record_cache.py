@@ -0,0 +1,99 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import aioredis
+import pytest
+
+from application.lib.cache import UserRecordCache
+from application.lib.managers.user_manager import UserManager
+from application.lib.utils.singleton import Singleton
+from application.datastore.db.connection_constants import MASTER_TYPE, READ_ONLY_TYPE
+
+
+def make_user(user_id):
+    return {
+        "id": user_id,
+        "name": "Andrea",
+        "email": f"andrea{user_id}@test.com",
+        "status": "ACTIVE",
+        "last_login": datetime(2022, 1, 1),
+    }
+
+
+@pytest.fixture
+def user_record_cache():
+    user_record_cache = UserRecordCache(
+        MagicMock(redis={"host": "localhost"}, user_cache={})
+    )
+    user_record_cache.client = MagicMock()
+    yield user_record_cache
+    Singleton._instances.pop(UserRecordCache, None)
+
+
+@pytest.mark.asyncio
+async def test_get_users(user_record_cache):
+    user_record_cache.local_cache.set(1, make_user(1))
+    user_record_cache.client.mget = AsyncMock(
+        return_value=[
+            user_record_cache._serialize(make_user(2)),
+            None,
+            user_record_cache.tombstone,
+        ]
+    )
+
+    users, invalidated_user_ids = await user_record_cache.get_users([1, 2, 3, 4])
+
+    # Only local misses reach Redis
+    user_record_cache.client.mget.assert_awaited_once_with("user:2", "user:3", "user:4")
+    assert users == {1: make_user(1), 2: make_user(2)}
+    assert invalidated_user_ids == {4}
+    assert user_record_cache.local_cache.get(2) == make_user(2)
+
+
+@pytest.mark.asyncio
+async def test_fill_users_does_not_overwrite(user_record_cache):
+    pipeline = MagicMock()
+    # User 2 was invalidated or written by an update during the read
+    pipeline.execute = AsyncMock(return_value=[True, None])
+    user_record_cache.client.pipeline.return_value = pipeline
+
+    await user_record_cache.fill_users([make_user(1), make_user(2)])
+
+    assert all(
+        call.kwargs["exist"] == aioredis.Redis.SET_IF_NOT_EXIST
+        for call in pipeline.set.call_args_list
+    )
+    assert user_record_cache.local_cache.get(1) == make_user(1)
+    assert user_record_cache.local_cache.get(2) is None
+
+
+@pytest.mark.asyncio
+async def test_get_users_invalidated_from_master(mocker):
+    user_record_cache = MagicMock()
+    user_record_cache.get_users = AsyncMock(return_value=({}, {2}))
+    mocker.patch(
+        "application.lib.managers.user_manager.UserRecordCache",
+        return_value=user_record_cache,
+    )
+    db_manager = MagicMock()
+    db_manager.acquire = AsyncMock(return_value=AsyncMock())
+    mock_factory = mocker.patch.object(UserManager, "_db_manager_factory")
+    mock_factory.make_manager.return_value = db_manager
+    mocker.patch(
+        "application.lib.managers.user_manager.UserQueryExecutor.search_users",
+        side_effect=[[make_user(1)], [make_user(2)]],
+    )
+    mock_fire_and_forget = mocker.patch(
+        "application.lib.managers.user_manager.fire_and_forget"
+    )
+
+    users = await UserManager.get_users([1, 2])
+
+    assert users == [make_user(1), make_user(2)]
+    assert [
+        call.kwargs["db_type"] for call in mock_factory.make_manager.call_args_list
+    ] == [READ_ONLY_TYPE, MASTER_TYPE]
+    # Only replica reads fill the cache, tombstoned users stay on master
+    mock_fire_and_forget.assert_called_once_with(
+        func=user_record_cache.fill_users, users=[make_user(1)]
+    )
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from application.lib.utils.singleton import Singleton
+from application.lib.write_behind import LastLoginWriteBehind
+
+
+@pytest.fixture
+def write_behind():
+    appconfig = MagicMock(
+        last_login_write_behind={"enabled": True, "max_batch_size": 2}
+    )
+    write_behind = LastLoginWriteBehind(appconfig)
+    yield write_behind
+    Singleton._instances.pop(LastLoginWriteBehind, None)
+
+
+@pytest.mark.asyncio
+async def test_flush_in_batches_keeping_latest_login(mocker, write_behind):
+    mock_write = mocker.patch.object(write_behind, "_write")
+    mocker.patch("application.lib.write_behind.fire_and_forget")
+    first_login, second_login = datetime(2022, 1, 1), datetime(2022, 1, 2)
+
+    await write_behind.add(1, first_login)
+    await write_behind.add(1, second_login)
+    await write_behind.add(2, first_login)
+    await write_behind.add(3, first_login)
+    await write_behind.flush()
+
+    batches = [call.args[0] for call in mock_write.await_args_list]
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert {**batches[0], **batches[1]} == {
+        1: second_login,
+        2: first_login,
+        3: first_login,
+    }
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried(mocker, write_behind):
+    mock_write = mocker.patch.object(
+        write_behind, "_write", side_effect=[ConnectionError, None]
+    )
+    await write_behind.add(1, datetime(2022, 1, 1))
+
+    await write_behind.flush()
+    assert write_behind._pending == {1: datetime(2022, 1, 1)}
+
+    await write_behind.flush()
+    assert write_behind._pending == {}
+    assert mock_write.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_write_is_put_back(mocker, write_behind):
+    write_started = asyncio.Event()
+
+    async def write(last_logins):
+        write_started.set()
+        await asyncio.Event().wait()
+
+    mocker.patch.object(write_behind, "_write", side_effect=write)
+    await write_behind.add(1, datetime(2022, 1, 1))
+    flush_task = asyncio.ensure_future(write_behind.flush())
+    await write_started.wait()
+    assert write_behind._pending == {}
+
+    flush_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flush_task
+
+    assert write_behind._pending == {1: datetime(2022, 1, 1)}
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_flush_in_progress(mocker, write_behind):
+    write_behind.flush_interval = 0.01
+    write_started, release_write = asyncio.Event(), asyncio.Event()
+    written = {}
+
+    async def write(last_logins):
+        write_started.set()
+        await release_write.wait()
+        written.update(last_logins)
+
+    mocker.patch.object(write_behind, "_write", side_effect=write)
+    await write_behind.init()
+    await write_behind.add(1, datetime(2022, 1, 1))
+    await write_started.wait()
+
+    close_task = asyncio.ensure_future(write_behind.close())
+    await asyncio.sleep(0.02)
+    assert not close_task.done()
+    release_write.set()
+    await close_task
+
+    assert written == {1: datetime(2022, 1, 1)}
+    assert write_behind._pending == {}
@@ -0,0 +1,262 @@
+from datetime import datetime
+
+import pytest
+from marshmallow import ValidationError
+
+from application.datastore.query_executors.user import UserQueryExecutor
+from application.lib.utils.cursor import encode_cursor
+from application.lib.validation.schemas.user import SearchUserSchema
+
+
+@pytest.mark.parametrize(
+    "sort_by, expected_sort_by",
+    [
+        (
+            None,
+            [{"column": "id", "order": "DESC"}],
+        ),
+        (
+            [{"column": "created_at", "order": "ASC"}],
+            [
+                {"column": "created_at", "order": "ASC"},
+                {"column": "id", "order": "ASC"},
+            ],
+        ),
+        (
+            [{"column": "id", "order": "ASC"}, {"column": "name", "order": "DESC"}],
+            [{"column": "id", "order": "ASC"}, {"column": "name", "order": "DESC"}],
+        ),
+    ],
+)
+def test_sort_tiebreaker(sort_by, expected_sort_by):
+    request = {"status": "ACTIVE"}
+    if sort_by is not None:
+        request["sort_by"] = sort_by
+
+    data = SearchUserSchema().load(request)
+
+    assert data["sort_by"] == expected_sort_by
+    assert data["offset"] == 0
+
+
+def test_cursor_roundtrip():
+    schema = SearchUserSchema()
+    request = {
+        "status": "ACTIVE",
+        "sort_by": [{"column": "last_login", "order": "DESC"}],
+        "limit": 2,
+    }
+    first_page = schema.load(request)
+    users = [
+        {"id": 9, "name": "a", "email": "a@b.c", "last_login": None},
+        {"id": 4, "name": "b", "email": "b@b.c", "last_login": datetime(2022, 1, 1)},
+    ]
+    dumped = schema.dump({**first_page, "users": users, "users_num": 10, "limit": 2})
+
+    next_page = schema.load({**request, "cursor": dumped["next_cursor"]})
+
+    assert "offset" not in next_page
+    assert next_page["after"] == [datetime(2022, 1, 1), 4]
+
+
+@pytest.mark.parametrize(
+    "request_update",
+    [
+        {"cursor": "not a cursor"},
+        {"cursor": "eyJrIjpbWyJpZCIsIkFTQyJdXSwidiI6WzFdfQ"},
+        {"cursor": "eyJrIjpbWyJpZCIsIkRFU0MiXV0sInYiOlsxXX0", "page": 2},
+    ],
+)
+def test_invalid_cursor(request_update):
+    with pytest.raises(ValidationError):
+        SearchUserSchema().load({"status": "ACTIVE", **request_update})
+
+
+@pytest.mark.parametrize(
+    "sort_by, values",
+    [
+        ([{"column": "id", "order": "DESC"}], [{"a": 1}]),
+        ([{"column": "id", "order": "DESC"}], ["10"]),
+        ([{"column": "id", "order": "DESC"}], [True]),
+        ([{"column": "id", "order": "DESC"}], [None]),
+        ([{"column": "name", "order": "ASC"}], [5, 1]),
+        ([{"column": "created_at", "order": "ASC"}], [None, 1]),
+        ([{"column": "last_login", "order": "DESC"}], [[2022], 1]),
+        ([{"column": "last_login", "order": "DESC"}], ["yesterday", 1]),
+    ],
+)
+def test_cursor_value_types(sort_by, values):
+    keys = [[s["column"], s["order"]] for s in sort_by]
+    if keys[-1][0] != "id":
+        keys.append(["id", keys[-1][1]])
+    cursor = encode_cursor({"k": keys, "v": values})
+
+    with pytest.raises(ValidationError, match="Invalid cursor"):
+        SearchUserSchema().load(
+            {"status": "ACTIVE", "sort_by": sort_by, "cursor": cursor}
+        )
+
+
+@pytest.mark.parametrize(
+    "sort_by, after, expected_clause",
+    [
+        (
+            [{"column": "id", "order": "DESC"}],
+            [10],
+            "id <= :after_0 AND ((id < :after_0))",
+        ),
+        (
+            [{"column": "name", "order": "ASC"}, {"column": "id", "order": "ASC"}],
+            ["bob", 10],
+            "name >= :after_0 AND ((name > :after_0) "
+            "OR (name = :after_0 AND id > :after_1))",
+        ),
+        (
+            [
+                {"column": "last_login", "order": "ASC"},
+                {"column": "id", "order": "ASC"},
+            ],
+            [None, 10],
+            "(last_login IS NOT NULL) OR (last_login IS NULL AND id > :after_1)",
+        ),
+        (
+            [
+                {"column": "last_login", "order": "DESC"},
+                {"column": "id", "order": "DESC"},
+            ],
+            [datetime(2022, 1, 1), 10],
+            "((last_login < :after_0 OR last_login IS NULL)) "
+            "OR (last_login = :after_0 AND id < :after_1)",
+        ),
+    ],
+)
+def test_seek_clause(sort_by, after, expected_clause):
+    parameters = {}
+    clause = UserQueryExecutor._get_stringified_seek_clause(
+        filters={"sort_by": sort_by, "after": after}, parameters=parameters
+    )
+
+    assert clause == expected_clause
+    assert parameters == {
+        f"after_{position}": value for position, value in enumerate(after)
+    }
+
+
+@pytest.mark.parametrize(
+    "request_update, expected_where, expected_order_by, expected_parameters",
+    [
+        # LIKE unless full-text is asked for
+        (
+            {"name": "Andrea"},
+            "WHERE name LIKE :name",
+            "ORDER BY id DESC",
+            {"name": "%Andrea%"},
+        ),
+        (
+            {"name": 'Andrea "A"', "name_match": "fulltext"},
+            "WHERE MATCH(name) AGAINST(:name_phrase IN BOOLEAN MODE)",
+            "ORDER BY MATCH(name) AGAINST(:name_phrase IN BOOLEAN MODE) DESC, id DESC",
+            {"name_phrase": '"Andrea A"'},
+        ),
+        # No word long enough to produce an n-gram
+        (
+            {"name": "A", "name_match": "fulltext"},
+            "WHERE name LIKE :name",
+            "ORDER BY id DESC",
+            {"name": "%A%"},
+        ),
+        (
+            {"name": "a b", "name_match": "fulltext"},
+            "WHERE name LIKE :name",
+            "ORDER BY id DESC",
+            {"name": "%a b%"},
+        ),
+        (
+            {
+                "name": "Andrea",
+                "name_match": "fulltext",
+                "sort_by": [{"column": "name"}],
+            },
+            "WHERE MATCH(name) AGAINST(:name_phrase IN BOOLEAN MODE)",
+            "ORDER BY name ASC, id ASC",
+            {"name_phrase": '"Andrea"'},
+        ),
+    ],
+)
+def test_name_search(
+    request_update, expected_where, expected_order_by, expected_parameters
+):
+    data = SearchUserSchema().load({"limit": 5, **request_update})
+
+    (
+        where_clauses,
+        order_by_clauses,
+        _,
+        parameters,
+    ) = UserQueryExecutor._get_stringified_where_sort_limit_clauses(filters=data)
+
+    assert where_clauses == expected_where
+    assert order_by_clauses == expected_order_by
+    assert parameters == {**expected_parameters, "limit": 5, "offset": 0}
+
+
+@pytest.mark.parametrize(
+    "request_update, expected_count_mode",
+    [
+        ({}, "exact"),
+        ({"count_mode": "exact"}, "exact"),
+        ({"count_mode": "estimate"}, "estimate"),
+        ({"count_mode": "none"}, "none"),
+    ],
+)
+def test_count_mode(request_update, expected_count_mode):
+    data = SearchUserSchema().load({"status": "ACTIVE", **request_update})
+
+    assert data["count_mode"] == expected_count_mode
+
+
+def test_invalid_count_mode():
+    with pytest.raises(ValidationError):
+        SearchUserSchema().load({"status": "ACTIVE", "count_mode": "approximate"})
+
+
+@pytest.mark.parametrize(
+    "users_num, expected_pages",
+    [
+        (25, 3),
+        (0, 0),
+        # count_mode none
+        (None, None),
+    ],
+)
+def test_pages(users_num, expected_pages):
+    dumped = SearchUserSchema().dump({"users": [], "users_num": users_num, "limit": 10})
+
+    assert dumped["pages"] == expected_pages
+
+
+@pytest.mark.parametrize(
+    "request_update, expect_valid",
+    [
+        ({"name": "Andrea"}, True),
+        ({"name": "Andrea", "name_match": "fulltext"}, False),
+        (
+            {
+                "name": "Andrea",
+                "name_match": "fulltext",
+                "sort_by": [{"column": "id", "order": "DESC"}],
+            },
+            True,
+        ),
+    ],
+)
+def test_name_search_cursor(request_update, expect_valid):
+    # Relevance order can't be resumed from a cursor, the LIKE default can
+    cursor = encode_cursor({"k": [["id", "DESC"]], "v": [10]})
+    request = {"cursor": cursor, **request_update}
+
+    if expect_valid:
+        assert SearchUserSchema().load(request)["after"] == [10]
+    else:
+        with pytest.raises(ValidationError):
+            SearchUserSchema().load(request)
@@ -1,31 +1,83 @@
 import asyncio
 import logging
+import os
+import signal
+import sys
+from functools import partial
 
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
 from tornado.platform.asyncio import AsyncIOMainLoop
 
 from application import (
+    init_event_loop_policy,
+    init_supervisor_log,
     initialize_application,
     initialize_web_application,
+    load_configurations,
     shutdown_application,
 )
+from application.lib.tornado.prefork import WorkerSupervisor
+from application.lib.utils.config import ApplicationConfig, DatabaseConfig
 
 logger = logging.getLogger()
 
 
-def main(io_loop):
+async def drain_server(server: HTTPServer, grace_period: float):
+    # Stop accepting, give in-flight requests some time, then close the rest
+    server.stop()
+    await asyncio.sleep(grace_period)
+    await server.close_all_connections()
+
+
+def main(
+    io_loop,
+    app_config: ApplicationConfig,
+    db_config: DatabaseConfig,
+    reuse_port: bool = False,
+) -> int:
     AsyncIOMainLoop().install()
-    app_config, _ = io_loop.run_until_complete(initialize_application())
+    io_loop.run_until_complete(initialize_application(app_config, db_config))
     app = initialize_web_application()
-    app.listen(app_config.port)
+    server = HTTPServer(app)
+    server.add_sockets(bind_sockets(int(app_config.port), reuse_port=reuse_port))
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        io_loop.add_signal_handler(signum, io_loop.stop)
+
     try:
-        logger.info(f"user_manager running on port {app_config.port}")
+        logger.info(
+            f"user_manager running on port {app_config.port} "
+            f"({type(io_loop).__module__} loop)"
+        )
         io_loop.run_forever()
     except Exception:
         logger.exception(f"Error encountered while user_manager was running")
     finally:
+        io_loop.run_until_complete(
+            drain_server(server, getattr(app_config, "shutdown_grace_period", 2))
+        )
         io_loop.run_until_complete(shutdown_application())
 
+    return 0
+
+
+def run_worker(
+    worker_id: int, app_config: ApplicationConfig, db_config: DatabaseConfig
+) -> int:
+    # Forked workers inherit the configurations loaded by the supervisor
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return main(loop, app_config, db_config, reuse_port=True)
+
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    main(loop)
+    app_config, db_config = load_configurations()
+    init_event_loop_policy(app_config)
+    workers = int(getattr(app_config, "workers", 1)) or os.cpu_count()
+    if workers == 1:
+        loop = asyncio.get_event_loop()
+        sys.exit(main(loop, app_config, db_config))
+
+    init_supervisor_log(app_config.loglevel)
+    worker_main = partial(run_worker, app_config=app_config, db_config=db_config)
+    sys.exit(WorkerSupervisor(workers=workers, worker_main=worker_main).run())
@@ -14,11 +14,18 @@ CREATE TABLE IF NOT EXISTS `user_manager`.`users` (
     UNIQUE KEY `users__email_idx` (`email`),
     KEY `users__status` (`status`),
     KEY `users__name` (`name`),
+    FULLTEXT KEY `users__name_ft_idx` (`name`) WITH PARSER ngram,
     KEY `users__created_at_idx` (`created_at`),
     KEY `users__last_modified_idx` (`last_modified`),
     KEY `users__last_login_idx` (`last_login`)
 )  ENGINE=INNODB DEFAULT CHARSET=UTF8;
 
+CREATE TABLE IF NOT EXISTS `user_manager`.`replication_heartbeat` (
+    `id` TINYINT UNSIGNED NOT NULL,
+    `ts` DECIMAL(16, 6) NOT NULL,
+    PRIMARY KEY (`id`)
+)  ENGINE=INNODB;
+
 GRANT USAGE ON *.* TO 'BE_user_manager'@'%';
 DROP USER 'BE_user_manager'@'%';
 CREATE USER 'BE_user_manager'@'%' IDENTIFIED BY 'password';
@@ -0,0 +1,5 @@
+-- Full-text n-gram index backing the default name search mode.
+-- Requires ngram_token_size = 2 and innodb_ft_enable_stopword = 0 (see my.cnf)
+-- to be in place before the index is built.
+ALTER TABLE `user_manager`.`users`
+    ADD FULLTEXT KEY `users__name_ft_idx` (`name`) WITH PARSER ngram;
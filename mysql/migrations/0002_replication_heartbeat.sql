@@ -0,0 +1,7 @@
+-- Single row table written on the master and read on every replica
+-- to measure how far behind each of them is (epoch seconds).
+CREATE TABLE IF NOT EXISTS `user_manager`.`replication_heartbeat` (
+    `id` TINYINT UNSIGNED NOT NULL,
+    `ts` DECIMAL(16, 6) NOT NULL,
+    PRIMARY KEY (`id`)
+)  ENGINE=INNODB;